@@ -1,22 +1,66 @@
 """fruit_ctrl_Py controller."""
 
+# Rilascio dei frutti sul nastro trasportatore.
+#
+# I nodi dei frutti (DEF apple8..apple49, orange8..orange49) e i loro campi
+# 'translation' vengono risolti una sola volta all'avvio; ogni rilascio
+# sposta il frutto successivo in fruit_initial_translation.
+#
+# Processo di arrivo configurabile con variabili d'ambiente:
+#   FRUIT_SPAWNER_ARRIVAL  fixed (default) | poisson | burst
+#   FRUIT_SPAWNER_RATE     frutti al minuto (default 7.8125 = uno ogni 120 passi da 64 ms)
+#   FRUIT_SPAWNER_SEED     seme per tipo di frutto e intervalli (default: casuale)
+#   FRUIT_SPAWNER_BURST    frutti per raffica (burst, default 3)
+#   FRUIT_SPAWNER_BURST_GAP  intervallo tra i frutti di una raffica in secondi (default 1.0)
+# Variando FRUIT_SPAWNER_RATE si cerca il massimo throughput sostenibile del sorter.
+#
+# Modalità di riciclo per prove di lunga durata (FRUIT_SPAWNER_RECYCLE=1):
+# i frutti rilasciati fermi sotto il piano del nastro (in un contenitore o a
+# terra) tornano disponibili e vengono riportati in fruit_initial_translation
+# al rilascio successivo, quindi il numero di nodi resta costante.
+#   FRUIT_SPAWNER_POOL     massimo di frutti in circolo contemporaneamente (default 0 = tutti)
+
 from controller import Supervisor
-from controller import Node
-from controller import Field
+import os
 import random
 
-random.seed()
-
 robot = Supervisor()
 
 timestep = 64
 
-i = 0
-j = 8
-k = 8
-l = 8
-fr = 1
-max = 50
+first = 8   # Primo indice dei DEF dei frutti
+max = 50    # Indice oltre l'ultimo DEF dei frutti
+start_time = 7.5  # Istante del primo rilascio (s)
+
+DEFAULT_RATE = 60.0 / (120 * timestep / 1000.0)  # Un frutto ogni 120 passi
+
+ARRIVAL = os.environ.get("FRUIT_SPAWNER_ARRIVAL", "fixed")
+RATE = float(os.environ.get("FRUIT_SPAWNER_RATE", DEFAULT_RATE))
+SEED = os.environ.get("FRUIT_SPAWNER_SEED")
+BURST = int(os.environ.get("FRUIT_SPAWNER_BURST", 3))
+BURST_GAP = float(os.environ.get("FRUIT_SPAWNER_BURST_GAP", 1.0))
+
+if ARRIVAL not in ("fixed", "poisson", "burst"):
+    print(f"Errore: processo di arrivo '{ARRIVAL}' non valido, uso 'fixed'.")
+    ARRIVAL = "fixed"
+
+if not RATE > 0:  # Zero, negativa o NaN: periodo infinito o intervalli negativi
+    print(f"Errore: frequenza di arrivo {RATE} non valida, uso {DEFAULT_RATE:.4f} frutti al minuto.")
+    RATE = DEFAULT_RATE
+
+if BURST < 1:
+    print(f"Errore: raffiche di {BURST} frutti non valide, uso 3.")
+    BURST = 3
+
+rng = random.Random(int(SEED) if SEED is not None else None)
+
+RECYCLE = os.environ.get("FRUIT_SPAWNER_RECYCLE") == "1"
+POOL = int(os.environ.get("FRUIT_SPAWNER_POOL", 0))
+RECYCLE_PERIOD = 1.0       # Periodo del controllo dei frutti da riciclare (s)
+SETTLE_TIME = 2.0          # Tempo da fermo prima del riciclo (s)
+SETTLED_MAX_Z = 0.3        # Quota massima di un frutto fermo (sotto il piano del nastro, m)
+SETTLED_MAX_SPEED = 0.05   # Velocità massima di un frutto fermo (m/s)
+REPORT_PERIOD = 60.0       # Periodo del resoconto del riciclo (s)
 
 
 # Initialize camera
@@ -36,31 +80,129 @@ else:
     speed_field = conveyor_belt.getField("speed")
     if speed_field is None:
         print("Errore: Campo 'speed' non trovato nel nodo 'conveyor_belt'.")
-        
+
 current_speed = 0.15
 
+
+def resolve_fruits(prefix):
+    """
+    Risolve una sola volta i nodi e i campi 'translation' dei frutti di un tipo
+
+    Args:
+        prefix (str): Prefisso dei DEF ('apple' o 'orange')
+
+    Returns:
+        list: Coppie (nodo, campo 'translation'), in ordine di indice
+    """
+    fields = []
+    for n in range(first, max):
+        node = robot.getFromDef(f'{prefix}{n:d}')
+        if node is None:
+            print(f"Errore: Nodo '{prefix}{n:d}' non trovato nel file .wbt.")
+            continue
+        fields.append((node, node.getField('translation')))
+    return fields
+
+
+def next_interval(released):
+    """
+    Intervallo fino al prossimo rilascio secondo il processo di arrivo
+
+    Args:
+        released (int): Frutti già rilasciati
+
+    Returns:
+        float: Intervallo in secondi
+    """
+    period = 60.0 / RATE
+    if ARRIVAL == "poisson":
+        return rng.expovariate(1.0 / period)
+    if ARRIVAL == "burst":
+        # Raffiche di BURST frutti, una raffica ogni BURST periodi
+        if released % BURST:
+            return BURST_GAP
+        pause = BURST * period - (BURST - 1) * BURST_GAP
+        return pause if pause > 0 else 0.0
+    return period
+
+
+def recycle_fruits(now):
+    """
+    Rimette tra i disponibili i frutti fermi in un contenitore o a terra
+
+    Un frutto è fermo se resta sotto SETTLED_MAX_Z e più lento di
+    SETTLED_MAX_SPEED per almeno SETTLE_TIME: esclude i frutti sul nastro e
+    quelli ancora in presa o in caduta.
+
+    Args:
+        now (float): Tempo di simulazione
+    """
+    global recycled
+    for entry in live[:]:
+        fr, node, field, settled_since = entry
+        z = node.getPosition()[2]
+        vx, vy, vz = node.getVelocity()[:3]
+        if z < SETTLED_MAX_Z and vx * vx + vy * vy + vz * vz < SETTLED_MAX_SPEED ** 2:
+            if settled_since is None:
+                entry[3] = now
+            elif now - settled_since >= SETTLE_TIME:
+                live.remove(entry)
+                fruit_pool[fr].append((node, field))
+                recycled += 1
+        else:
+            entry[3] = None
+
+
+def report(now):
+    """Resoconto periodico dei rilasci in modalità riciclo"""
+    global report_start, skipped
+    if now - report_start >= REPORT_PERIOD:
+        print(f"Spawner: {released} rilasciati, {recycled} riciclati, {len(live)} in circolo, "
+              f"{skipped} arrivi saltati (pool pieno o nessun frutto disponibile)")
+        skipped = 0
+        report_start = now
+
+
+# Frutti disponibili per tipo: 1 = mele, 2 = arance
+fruit_pool = {1: resolve_fruits('apple'), 2: resolve_fruits('orange')}
+live = []  # Frutti in circolo: [tipo, nodo, campo, fermo dal] (solo in modalità riciclo)
+released = 0
+recycled = 0
+skipped = 0
+next_release = start_time
+next_recycle = start_time
+report_start = start_time
+
 # Main loop:
 while robot.step(timestep) != -1:
 
-    if robot.getTime() > 7.5:
-        if i == 0:
-            if fr > 0:
-                fr = int(random.choice([1,2]))
-                if j == max: fr = 2
-                if k == max: fr = 1
-                if fr == 1 and j < max:
-                    name = f'apple{j:d}'
-                    j += 1
-                if fr == 2 and k < max:
-                    name = f'orange{k:d}'
-                    k += 1
-                fruit = robot.getFromDef(name)
-                fruit_trans_field = Node.getField(fruit, 'translation')
-                Field.setSFVec3f(fruit_trans_field, fruit_initial_translation)
-                if j == max and k == max: fr = 0
-        i += 1
-        if i == 120: i = 0
-    pass
+    now = robot.getTime()
 
-    current_speed = speed_field.getSFFloat()
+    if RECYCLE and now > next_recycle:
+        recycle_fruits(now)
+        report(now)
+        next_recycle += RECYCLE_PERIOD
+
+    if now > next_release:
+        if RECYCLE and POOL and len(live) >= POOL:
+            skipped += 1  # Pool pieno: l'arrivo va perso, come un frutto rifiutato a monte
+        elif not (fruit_pool[1] or fruit_pool[2]):
+            # Nessun frutto fermo da riciclare: l'arrivo va perso invece di
+            # accumularsi e far partire una raffica quando i frutti tornano
+            skipped += 1
+        else:
+            # Tipo casuale tra quelli ancora disponibili
+            fr = rng.choice([1, 2])
+            if not fruit_pool[fr]:
+                fr = 3 - fr
+            node, field = fruit_pool[fr].pop(0)
+            field.setSFVec3f(fruit_initial_translation)
+            node.resetPhysics()  # Azzera la velocità residua del frutto riciclato
+            if RECYCLE:
+                live.append([fr, node, field, None])
+            released += 1
+            if not RECYCLE and not (fruit_pool[1] or fruit_pool[2]):
+                print(f"Spawner: {released} frutti rilasciati in {now - start_time:.1f} s")
+        next_release += next_interval(released)
 
+    current_speed = speed_field.getSFFloat()
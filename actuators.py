@@ -0,0 +1,96 @@
+# ============================================================================
+# COALESCENZA DEI COMANDI AGLI ATTUATORI
+# ============================================================================
+"""
+Involucri per gli attuatori comandati ad ogni passo: il campo velocità del
+nastro trasportatore e i motori del braccio UR5e e del gripper.
+
+Ogni involucro ricorda l'ultimo valore comandato e inoltra a Webots solo i
+valori diversi; i comandi ripetuti vengono soppressi e contati. Le altre
+chiamate (getMinPosition, getSFFloat, ...) passano invariate al dispositivo.
+
+Nota: il valore ricordato è l'ultimo comandato da questo controller; se un
+altro controller modifica lo stesso campo, il comando successivo identico
+al precedente non viene reinviato.
+"""
+
+from scheduler import PeriodicReport  # Resoconto ogni REPORT_PERIOD secondi di simulazione
+
+
+class ActuatorStats:
+    """Contatori dei comandi inviati e soppressi per tutti gli attuatori"""
+
+    def __init__(self):
+        self.sent = 0
+        self.suppressed = 0
+        self._report = PeriodicReport(self._print_report)
+
+    def report(self, now):
+        """Stampa periodicamente i comandi inviati e soppressi al secondo"""
+        self._report.update(now)
+
+    def _print_report(self, elapsed):
+        print(f"Attuatori: {self.sent / elapsed:.1f} comandi/s inviati, "
+              f"{self.suppressed / elapsed:.1f} comandi/s soppressi")
+        self.sent = self.suppressed = 0
+
+
+class CoalescedField:
+    """
+    Campo SFFloat di un nodo che inoltra solo i valori cambiati
+
+    Args:
+        field: Campo Webots (es. la velocità del nastro)
+        stats (ActuatorStats): Contatori condivisi
+    """
+
+    def __init__(self, field, stats):
+        self.field = field
+        self.stats = stats
+        self.value = None
+
+    def setSFFloat(self, value):
+        if value == self.value:
+            self.stats.suppressed += 1
+            return
+        self.value = value
+        self.field.setSFFloat(value)
+        self.stats.sent += 1
+
+    def __getattr__(self, name):
+        return getattr(self.field, name)
+
+
+class CoalescedMotor:
+    """
+    Motore che inoltra solo le posizioni e le velocità cambiate
+
+    Args:
+        motor: Motore Webots
+        stats (ActuatorStats): Contatori condivisi
+    """
+
+    def __init__(self, motor, stats):
+        self.motor = motor
+        self.stats = stats
+        self.position = None
+        self.velocity = None
+
+    def setPosition(self, position):
+        if position == self.position:
+            self.stats.suppressed += 1
+            return
+        self.position = position
+        self.motor.setPosition(position)
+        self.stats.sent += 1
+
+    def setVelocity(self, velocity):
+        if velocity == self.velocity:
+            self.stats.suppressed += 1
+            return
+        self.velocity = velocity
+        self.motor.setVelocity(velocity)
+        self.stats.sent += 1
+
+    def __getattr__(self, name):
+        return getattr(self.motor, name)
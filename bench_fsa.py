@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# ============================================================================
+# MICRO-BENCHMARK DEL PARSER FSA
+# ============================================================================
+"""
+Misura fsa_parser.parse() su programmi sintetici di molti stati e lo
+confronta con il parsing originale del controller (re.findall + split per
+configurazione). Per ogni dimensione riporta il tempo mediano e il migliore
+su più ripetizioni, il rapporto con il periodo di controllo (32 ms) e il
+tempo per trovare un errore all'ultimo stato (percorso lento). Misura anche
+il caricamento dello stesso programma negli stati di fsa_schema, dal
+formato storico, da JSON e dalla codifica binaria, e il percorso completo del
+controller (fsa_compiler.compile_program, fino agli StateConfig) per ognuno
+dei tre formati.
+
+Uso:
+    python bench_fsa.py [--states 1000 10000 100000] [--repeat 5]
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+
+import fsa_compiler
+import fsa_parser
+import fsa_schema
+
+CONTROL_TICK = 0.032  # Periodo del loop del controller (s)
+BELT_SPEED = 0.15     # Velocità del nastro di default del controller
+
+
+def controller_load(program):
+    """Caricamento del controller: dal contenuto del file agli StateConfig"""
+    return fsa_compiler.compile_program(program, BELT_SPEED)
+
+
+def synthetic_program(num_states, seed=0):
+    """
+    Genera un programma FSA valido in forma canonica
+
+    Args:
+        num_states (int): Numero di stati
+        seed (int): Seme del generatore casuale
+
+    Returns:
+        str: Messaggio FSA
+    """
+    rng = random.Random(seed)
+    states = [(rng.randint(0, 50), rng.choice(("G1", "G2")), rng.randint(0, 50),
+               rng.choice(("O1", "O2")), rng.randint(0, 10)) for _ in range(num_states)]
+    return fsa_parser.format_program(states)
+
+
+def legacy_parse(message):
+    """Parsing del controller originale (senza costruzione degli StateConfig)"""
+    num_states = int(message.split(',')[0].strip())
+    state_configs = re.findall(r'\((\d+,(?:G|O)\d+,\d+,(?:G|O)\d+,\d+)\)', message)
+    if len(state_configs) != num_states:
+        return None
+    states = []
+    for config in state_configs:
+        values = config.split(',')
+        states.append((int(values[0]), int(values[1][1:]), int(values[2]), int(values[3][1:]), int(values[4])))
+    return states
+
+
+def timed(function, argument, repeat):
+    """Tempo mediano e minimo (s) di function(argument) su repeat esecuzioni"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            function(argument)
+        except fsa_parser.FSASyntaxError:
+            pass
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2], times[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark del parser FSA")
+    parser.add_argument("--states", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Numero di stati dei programmi")
+    parser.add_argument("--repeat", type=int, default=5, help="Ripetizioni per misura")
+    args = parser.parse_args()
+
+    print(f"{'stati':>8} {'byte':>9} {'variante':<12} {'mediana ms':>11} {'min ms':>8} {'tick':>6}")
+    for num_states in args.states:
+        message = synthetic_program(num_states)
+        assert [s[0] for s in fsa_parser.parse(message)] == [s[0] for s in legacy_parse(message)]
+        broken = message[:-2] + "x)"  # Errore nell'ultimo stato
+        specs = fsa_schema.load(message)
+        structured = json.dumps(fsa_schema.to_json(specs))
+        binary = fsa_schema.encode_binary(specs)
+        for name, function, text in (("originale", legacy_parse, message),
+                                     ("fsa_parser", fsa_parser.parse, message),
+                                     ("errore", fsa_parser.parse, broken),
+                                     ("storico", fsa_schema.load, message),
+                                     ("json", fsa_schema.load, structured),
+                                     ("binario", fsa_schema.load, binary),
+                                     ("ctrl storico", controller_load, message),
+                                     ("ctrl json", controller_load, structured),
+                                     ("ctrl binario", controller_load, binary)):
+            median, best = timed(function, text, args.repeat)
+            print(f"{num_states:>8} {len(text):>9} {name:<12} {median * 1000:>11.2f} {best * 1000:>8.2f} "
+                  f"{median / CONTROL_TICK:>6.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# ============================================================================
+# MICRO-BENCHMARK DELLA PIPELINE DI VISIONE
+# ============================================================================
+"""
+Confronta la versione originale di find_fruit() (array e kernel ricreati ad
+ogni frame) con FruitDetector (buffer preallocati), in entrambe le modalità
+di segmentazione, e il tracker di fruit_tracker.py su una sequenza di frame
+(registrata con --corpus, altrimenti frutti sintetici che scorrono sul
+nastro, comprese mele marce a due colori).
+
+Per ogni variante riporta la latenza per frame e la memoria allocata per
+frame (picco misurato con tracemalloc, che traccia anche i buffer NumPy).
+
+Con --stages misura separatamente ogni fase della pipeline di find_fruit
+(decodifica, ROI, cvtColor, inRange, CLOSE, OPEN, findContours,
+boundingRect) con percentili p50/p95/p99 e frame al secondo; con
+--variants confronta varianti della pipeline (dimensione del kernel,
+ordine delle operazioni morfologiche, modalità di ricerca dei contorni)
+per costo e accordo con la pipeline di riferimento.
+
+Uso:
+    python bench_vision.py [--frames 500] [--corpus frames.npy]
+    python bench_vision.py --stages [--corpus registrazione.npy]
+    python bench_vision.py --variants [--corpus registrazione.npy]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import cv2  # OpenCV per l'elaborazione delle immagini
+import numpy as np  # NumPy per operazioni numeriche e array
+
+from fruit_detector import DETECTION_MODES, FRUIT_HSV_RANGES, FruitDetector
+from frame_recorder import load_trace
+from fruit_tracker import FruitTracker
+
+WIDTH, HEIGHT = 200, 150  # Dimensioni della telecamera nel mondo Webots
+
+# Colori BGR rappresentativi di ogni frutto (dentro i range HSV di find_fruit)
+FRUIT_BGR = ((0, 140, 255), (30, 180, 40), (12, 12, 12))
+BELT_BGR = (120, 120, 120)
+MIXED_ROTTEN = 3  # Frame sintetico: mela verde con una banda scura larga 96 px (marcia)
+MIXED_BAND = 15   # Semialtezza della banda scura (px)
+
+
+def synthetic_frames(count, seed=0, labels=None):
+    """
+    Genera frame BGRA sintetici: nastro grigio con al più un frutto circolare,
+    di un solo colore oppure verde con una banda scura (mela marcia a due
+    colori, su cui la classificazione deve restare "marcia")
+
+    Args:
+        count (int): Numero di frame
+        seed (int): Seme del generatore casuale
+        labels (list): Se indicata, riceve il frutto presente in ogni frame
+
+    Returns:
+        list: Lista di buffer bytes come quelli di camera.getImage()
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        img = np.empty((HEIGHT, WIDTH, 4), np.uint8)
+        img[:, :, :3] = BELT_BGR
+        img[:, :, 3] = 255
+        kind = int(rng.integers(-1, 4))
+        if kind == MIXED_ROTTEN:
+            center = (int(rng.integers(70, 130)), int(rng.integers(40, 110)))
+            cv2.circle(img, center, 48, FRUIT_BGR[1] + (255,), -1)
+            band = img[center[1] - MIXED_BAND:center[1] + MIXED_BAND + 1]
+            band[(band[:, :, :3] == FRUIT_BGR[1]).all(axis=2)] = FRUIT_BGR[2] + (255,)
+            kind = 2
+        elif kind != -1:
+            center = (int(rng.integers(70, 130)), int(rng.integers(40, 110)))
+            cv2.circle(img, center, 48, FRUIT_BGR[kind] + (255,), -1)
+        frames.append(img.tobytes())
+        if labels is not None:
+            labels.append(kind)
+    return frames
+
+
+def synthetic_sequence(count, seed=0, step=6, labels=None):
+    """
+    Genera una sequenza di frame BGRA con un frutto alla volta che entra dal
+    bordo superiore e scende di step px per frame, come sul nastro
+
+    Args:
+        count (int): Numero di frame
+        seed (int): Seme del generatore casuale
+        step (int): Spostamento del frutto tra due frame (px)
+        labels (list): Se indicata, riceve il frutto presente in ogni frame
+
+    Returns:
+        list: Lista di buffer bytes come quelli di camera.getImage()
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    while len(frames) < count:
+        kind = int(rng.integers(0, 4))
+        cx = int(rng.integers(70, 130))
+        for cy in range(-48, HEIGHT + 48, step):
+            img = np.empty((HEIGHT, WIDTH, 4), np.uint8)
+            img[:, :, :3] = BELT_BGR
+            img[:, :, 3] = 255
+            cv2.circle(img, (cx, cy), 48, FRUIT_BGR[1 if kind == MIXED_ROTTEN else kind] + (255,), -1)
+            if kind == MIXED_ROTTEN:
+                band = img[max(cy - MIXED_BAND, 0):max(cy + MIXED_BAND + 1, 0)]
+                band[(band[:, :, :3] == FRUIT_BGR[1]).all(axis=2)] = FRUIT_BGR[2] + (255,)
+            frames.append(img.tobytes())
+            if labels is not None:
+                labels.append(2 if kind == MIXED_ROTTEN else kind)
+    return frames[:count]
+
+
+def load_corpus(path):
+    """
+    Carica un corpus di frame BGRA da file .npy
+
+    Accetta sia un array (N, H, W, 4) sia una traccia di FrameRecorder.
+    """
+    data = np.load(path, mmap_mode='r')
+    if data.dtype.names:
+        data = load_trace(path)['image']
+    return [np.ascontiguousarray(frame).tobytes() for frame in data]
+
+
+def legacy_find_fruit(image):
+    """Copia della find_fruit() originale, senza le chiamate al display"""
+    min = []
+    max = []
+    cnts = []
+    mask = []
+    model = -1
+
+    img = np.frombuffer(image, dtype=np.uint8).reshape((HEIGHT, WIDTH, 4))
+    roi = img[0:150, 35:165]
+    imHSV = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+
+    min.append(np.array([10, 135, 135], np.uint8))
+    max.append(np.array([32, 255, 255], np.uint8))
+    min.append(np.array([30, 50, 50], np.uint8))
+    max.append(np.array([90, 255, 255], np.uint8))
+    min.append(np.array([0, 0, 0], np.uint8))
+    max.append(np.array([179, 50, 30], np.uint8))
+
+    Kernel = np.ones((5, 5), np.uint8)
+
+    for i in range(3):
+        mask.append(cv2.inRange(imHSV, min[i], max[i]))
+        mask[i] = cv2.morphologyEx(mask[i], cv2.MORPH_CLOSE, Kernel)
+        mask[i] = cv2.morphologyEx(mask[i], cv2.MORPH_OPEN, Kernel)
+        cnts.append(cv2.findContours(mask[i], cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[0])
+        for c in cnts[i]:
+            x, y, w, h = cv2.boundingRect(c)
+            if w > 80:
+                model = i
+
+    return model
+
+
+def percentile(values, q):
+    """Percentile q (0-100) di una lista di valori, per interpolazione lineare"""
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def bench(name, detect, frames):
+    """
+    Misura latenza e allocazioni per frame di una funzione di rilevamento
+
+    Returns:
+        list: Risultati del rilevamento, per il confronto tra le varianti
+    """
+    # Riscaldamento (cache di OpenCV e NumPy)
+    for frame in frames[:20]:
+        detect(frame)
+
+    latencies = []
+    results = []
+    for frame in frames:
+        start = time.perf_counter()
+        results.append(detect(frame))
+        latencies.append((time.perf_counter() - start) * 1e6)
+
+    # Allocazioni: picco di memoria tracciata durante ogni singolo frame
+    peaks = []
+    tracemalloc.start()
+    for frame in frames[:200]:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        detect(frame)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    print(f"{name:<20} mean {sum(latencies) / len(latencies):8.1f} us  "
+          f"p50 {percentile(latencies, 50):8.1f} us  p95 {percentile(latencies, 95):8.1f} us  "
+          f"alloc/frame {sum(peaks) / len(peaks) / 1024:8.1f} KiB")
+    return results
+
+
+# ============================================================================
+# TEMPI PER FASE E VARIANTI DELLA PIPELINE
+# ============================================================================
+STAGES = ("decode", "roi", "cvtColor", "inRange", "close", "open", "findContours", "boundingRect")
+
+# Varianti: (nome, lato del kernel, ordine morfologico, modalità dei contorni)
+VARIANTS = (
+    ("k5 close-open list", 5, "close-open", cv2.RETR_LIST),  # Pipeline di find_fruit
+    ("k5 close-open external", 5, "close-open", cv2.RETR_EXTERNAL),
+    ("k5 open-close list", 5, "open-close", cv2.RETR_LIST),
+    ("k3 close-open list", 3, "close-open", cv2.RETR_LIST),
+    ("k3 close-open external", 3, "close-open", cv2.RETR_EXTERNAL),
+    ("k7 close-open list", 7, "close-open", cv2.RETR_LIST),
+)
+
+
+def staged_find_fruit(image, kernel, order, retrieval, timings):
+    """
+    Pipeline di find_fruit con cronometraggio di ogni fase
+
+    Args:
+        image (bytes): Frame BGRA
+        kernel (ndarray): Kernel morfologico
+        order (str): "close-open" oppure "open-close"
+        retrieval (int): Modalità di ricerca dei contorni (cv2.RETR_*)
+        timings (dict): Fase -> lista dei tempi in microsecondi (aggiornato)
+
+    Returns:
+        int: Tipo di frutto rilevato (-1 se nessun frutto trovato)
+    """
+    clock = time.perf_counter_ns
+    ops = (cv2.MORPH_CLOSE, cv2.MORPH_OPEN) if order == "close-open" else (cv2.MORPH_OPEN, cv2.MORPH_CLOSE)
+    spent = dict.fromkeys(STAGES, 0)
+    model = -1
+
+    t0 = clock()
+    img = np.frombuffer(image, dtype=np.uint8).reshape((HEIGHT, WIDTH, 4))
+    t1 = clock()
+    roi = img[0:150, 35:165]
+    t2 = clock()
+    hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+    t3 = clock()
+    spent["decode"], spent["roi"], spent["cvtColor"] = t1 - t0, t2 - t1, t3 - t2
+
+    for i, (lo, hi) in enumerate(FRUIT_HSV_RANGES):
+        t0 = clock()
+        mask = cv2.inRange(hsv, np.array(lo, np.uint8), np.array(hi, np.uint8))
+        t1 = clock()
+        mask = cv2.morphologyEx(mask, ops[0], kernel)
+        t2 = clock()
+        mask = cv2.morphologyEx(mask, ops[1], kernel)
+        t3 = clock()
+        contours = cv2.findContours(mask, retrieval, cv2.CHAIN_APPROX_SIMPLE)[0]
+        t4 = clock()
+        for c in contours:
+            x, y, w, h = cv2.boundingRect(c)
+            if w > 80:
+                model = i
+        t5 = clock()
+        spent["inRange"] += t1 - t0
+        spent["close" if ops[0] == cv2.MORPH_CLOSE else "open"] += t2 - t1
+        spent["open" if ops[1] == cv2.MORPH_OPEN else "close"] += t3 - t2
+        spent["findContours"] += t4 - t3
+        spent["boundingRect"] += t5 - t4
+
+    for stage, ns in spent.items():
+        timings[stage].append(ns / 1000.0)
+    return model
+
+
+def run_staged(frames, kernel_size, order, retrieval):
+    """
+    Esegue la pipeline a fasi su tutti i frame
+
+    Returns:
+        tuple: (tempi per fase, tempi totali per frame, classificazioni)
+    """
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    for frame in frames[:20]:
+        staged_find_fruit(frame, kernel, order, retrieval, {stage: [] for stage in STAGES})
+
+    timings = {stage: [] for stage in STAGES}
+    totals = []
+    results = []
+    for frame in frames:
+        start = time.perf_counter()
+        results.append(staged_find_fruit(frame, kernel, order, retrieval, timings))
+        totals.append((time.perf_counter() - start) * 1e6)
+    return timings, totals, results
+
+
+def report_stages(frames):
+    """Stampa p50/p95/p99 di ogni fase della pipeline di find_fruit"""
+    timings, totals, _ = run_staged(frames, 5, "close-open", cv2.RETR_LIST)
+    print(f"{'fase':<14} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'quota':>7}")
+    grand = sum(sum(v) for v in timings.values())
+    for stage in STAGES:
+        values = timings[stage]
+        print(f"{stage:<14} {percentile(values, 50):9.1f} {percentile(values, 95):9.1f} "
+              f"{percentile(values, 99):9.1f} {100.0 * sum(values) / grand:6.1f}%")
+    print(f"{'totale':<14} {percentile(totals, 50):9.1f} {percentile(totals, 95):9.1f} "
+          f"{percentile(totals, 99):9.1f}   {1e6 * len(totals) / sum(totals):.0f} frame/s")
+
+
+def report_variants(frames, labels=None):
+    """
+    Confronta le varianti della pipeline per costo e accordo
+
+    Args:
+        frames (list): Frame BGRA
+        labels (list): Frutto effettivamente presente in ogni frame, se noto
+    """
+    print(f"{'variante':<24} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'frame/s':>8} "
+          f"{'accordo':>8}" + (f" {'accuratezza':>11}" if labels else ""))
+    reference = None
+    for name, kernel_size, order, retrieval in VARIANTS:
+        _, totals, results = run_staged(frames, kernel_size, order, retrieval)
+        if reference is None:
+            reference = results
+        agreement = sum(a == b for a, b in zip(results, reference)) / len(results)
+        line = (f"{name:<24} {percentile(totals, 50):9.1f} {percentile(totals, 95):9.1f} "
+                f"{percentile(totals, 99):9.1f} {1e6 * len(totals) / sum(totals):8.0f} {100 * agreement:7.1f}%")
+        if labels:
+            accuracy = sum(a == b for a, b in zip(results, labels)) / len(results)
+            line += f" {100 * accuracy:10.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark di find_fruit")
+    parser.add_argument("--frames", type=int, default=500, help="Numero di frame sintetici")
+    parser.add_argument("--corpus", help="File .npy con frame BGRA (N, H, W, 4) o traccia registrata")
+    parser.add_argument("--stages", action="store_true", help="Tempi per fase della pipeline")
+    parser.add_argument("--variants", action="store_true", help="Confronto tra varianti della pipeline")
+    args = parser.parse_args()
+
+    labels = None if args.corpus else []
+    frames = load_corpus(args.corpus) if args.corpus else synthetic_frames(args.frames, labels=labels)
+    print(f"Frame: {len(frames)}  OpenCV {cv2.__version__}  NumPy {np.__version__}")
+
+    if args.stages or args.variants:
+        if args.stages:
+            report_stages(frames)
+        if args.variants:
+            report_variants(frames, labels)
+        return
+
+    before = bench("find_fruit", legacy_find_fruit, frames)
+    for mode in DETECTION_MODES:
+        detector = FruitDetector(WIDTH, HEIGHT, mode=mode)
+        after = bench(mode, detector.detect, frames)
+        mismatches = sum(1 for a, b in zip(before, after) if a != b)
+        print(f"{'':<20} classificazioni diverse da find_fruit: {mismatches}")
+        if labels:
+            errors = sum(1 for a, b in zip(after, labels) if a != b)
+            print(f"{'':<20} classificazioni errate: {errors}")
+
+    # Tracker: su una sequenza di frame (uno ogni 32 ms), registrata o sintetica
+    sequence_labels = None if args.corpus else []
+    sequence = frames if args.corpus else synthetic_sequence(args.frames, labels=sequence_labels)
+    reference = legacy_find_fruit if args.corpus else None
+    for mode in DETECTION_MODES:
+        tracker = FruitTracker(FruitDetector(WIDTH, HEIGHT, mode=mode))
+        clock = [0.0]
+
+        def tracked(frame):
+            clock[0] += 0.032
+            nearest = tracker.nearest(tracker.update(frame, clock[0]))
+            return nearest.fruit if nearest is not None else -1
+
+        after = bench(f"tracker {mode}", tracked, sequence)
+        line = f"{'':<20} classificazioni/frame: {tracker.classifications / max(tracker.frames, 1):.2f}"
+        if reference:
+            before = [reference(frame) for frame in sequence]
+            line += f"  diverse da find_fruit: {sum(1 for a, b in zip(before, after) if a != b)}"
+        else:
+            # Frame con un frutto riconosciuto come un altro (-1 = frutto non ancora entrato)
+            line += f"  classificazioni errate: {sum(1 for a, b in zip(after, sequence_labels) if a not in (-1, b))}"
+        print(line)
+
+if __name__ == '__main__':
+    main()
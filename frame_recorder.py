@@ -0,0 +1,109 @@
+# ============================================================================
+# REGISTRAZIONE DEI FRAME DELLA TELECAMERA
+# ============================================================================
+"""
+Registratore di frame e letture dei sensori su file .npy memory-mapped.
+
+Il file è un array strutturato (vedi trace_dtype) preallocato con
+np.lib.format.open_memmap e usato come buffer circolare: superata la
+capacità, i record più vecchi vengono sovrascritti. Ogni frame viene
+copiato direttamente dal buffer di camera.getImage() nella mappatura del
+file, tramite una vista np.frombuffer, senza immagini intermedie.
+
+Il file registrato si legge con load_trace() ed è utilizzabile come corpus
+per bench_vision.py e come traccia per replay.py.
+"""
+
+import numpy as np  # NumPy per operazioni numeriche e array
+
+
+def trace_dtype(height, width):
+    """
+    Tipo dei record di una traccia registrata (file .npy strutturato)
+
+    Campi:
+        seq (int64): Numero progressivo del record (0 = posizione vuota)
+        time (float64): Tempo di simulazione in secondi
+        distance (float64): Lettura del sensore di distanza
+        position (float64): Lettura del sensore di posizione del polso
+        fruit (int8): Frutto rilevato dal controller (-1 = nessuno)
+        image (uint8 HxWx4): Frame BGRA della telecamera
+    """
+    return np.dtype([
+        ('seq', np.int64),
+        ('time', np.float64),
+        ('distance', np.float64),
+        ('position', np.float64),
+        ('fruit', np.int8),
+        ('image', np.uint8, (height, width, 4)),
+    ])
+
+
+def load_trace(path):
+    """
+    Carica una traccia registrata ordinandone i record per numero progressivo
+
+    Args:
+        path (str): File .npy con record di tipo trace_dtype
+
+    Returns:
+        ndarray: Record validi in ordine cronologico
+    """
+    data = np.load(path, mmap_mode='r')
+    order = np.argsort(data['seq'], kind='stable')
+    order = order[data['seq'][order] > 0]
+    if len(order) == 0:
+        return data[:0]
+    if np.all(np.diff(order) == 1):
+        return data[order[0]:order[-1] + 1]  # Buffer non ancora circolato: resta mappato
+    return data[order]
+
+
+class FrameRecorder:
+    """
+    Buffer circolare memory-mapped di frame e letture dei sensori
+
+    Args:
+        path (str): File .npy di destinazione (viene sovrascritto)
+        capacity (int): Numero massimo di record conservati
+        width, height (int): Dimensioni dell'immagine della telecamera
+    """
+
+    def __init__(self, path, capacity, width, height):
+        self.path = path
+        self.capacity = capacity
+        self.shape = (height, width, 4)
+        self.data = np.lib.format.open_memmap(path, mode='w+', dtype=trace_dtype(height, width), shape=(capacity,))
+        # Viste per colonna sulla mappatura del file
+        self.seqs = self.data['seq']
+        self.times = self.data['time']
+        self.distances = self.data['distance']
+        self.positions = self.data['position']
+        self.fruits = self.data['fruit']
+        self.images = self.data['image']
+        self.count = 0
+
+    def append(self, time, image, distance, position, fruit):
+        """
+        Aggiunge un record al buffer circolare
+
+        Args:
+            time (float): Tempo di simulazione
+            image (bytes): Buffer restituito da camera.getImage() (None = ignorato)
+            distance, position (float): Letture dei sensori
+            fruit (int): Frutto rilevato (-1 = nessuno)
+        """
+        if image is None:
+            return
+        i = self.count % self.capacity
+        self.count += 1
+        self.images[i] = np.frombuffer(image, dtype=np.uint8).reshape(self.shape)
+        self.times[i] = time
+        self.distances[i] = distance
+        self.positions[i] = position
+        self.fruits[i] = fruit
+        self.seqs[i] = self.count  # Scritto per ultimo: il record è completo
+
+    def flush(self):
+        """Forza la scrittura su disco delle pagine modificate"""
+        self.data.flush()
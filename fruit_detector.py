@@ -0,0 +1,269 @@
+# ============================================================================
+# RILEVAMENTO FRUTTA CON BUFFER PREALLOCATI
+# ============================================================================
+"""
+Pipeline di visione per il riconoscimento dei frutti sul nastro.
+
+Soglie HSV, kernel morfologico e immagini intermedie (HSV, maschere) vengono
+creati una sola volta nel costruttore; ad ogni frame le funzioni OpenCV
+scrivono nei buffer esistenti tramite il parametro dst=.
+
+Modalità disponibili:
+- "per_class": una maschera inRange + CLOSE/OPEN + findContours per colore
+  (comportamento originale di find_fruit)
+- "single_pass": una lookup table HSV produce in un solo passaggio
+  un'immagine di etichette; morfologia e findContours vengono eseguite
+  una sola volta sull'unione delle etichette e ogni frutto prende
+  l'etichetta più frequente nel suo riquadro. Come in find_fruit una
+  componente nera più larga di MIN_FRUIT_WIDTH prevale: una mela verde con
+  una macchia scura estesa resta marcia anche se la maggioranza dei pixel
+  è verde. Le due modalità non sono equivalenti in ogni caso (per esempio
+  se arancione e verde compaiono nello stesso riquadro). Il guadagno è
+  limitato (circa 0,8 volte il tempo di per_class con bench_vision.py):
+  cvtColor, le lookup table e la morfologia sull'unione restano per frame.
+
+Per il tracker di fruit_tracker.py la ricerca è divisa in locate()
+(riquadri di tutti i frutti nel frame, dall'immagine di etichette) e
+classify() (tipo del frutto in un riquadro), che segue la modalità
+configurata: in "per_class" ripete le tre maschere di find_fruit sul solo
+riquadro, in "single_pass" usa le etichette.
+"""
+
+import cv2  # OpenCV per l'elaborazione delle immagini
+import numpy as np  # NumPy per operazioni numeriche e array
+
+# --- Range colori in HSV (indice = tipo di frutto) ---
+FRUIT_HSV_RANGES = (
+    ((10, 135, 135), (32, 255, 255)),  # Arancione
+    ((30, 50, 50), (90, 255, 255)),    # Verde
+    ((0, 0, 0), (179, 50, 30)),        # Nero (per mele marce)
+)
+
+# --- Regione di interesse (righe, colonne) e dimensione minima del frutto ---
+ROI_ROWS = (0, 150)
+ROI_COLS = (35, 165)
+MIN_FRUIT_WIDTH = 80
+ROTTEN = 2  # Indice del nero (mela marcia), prevale sugli altri colori
+
+DETECTION_MODES = ("per_class", "single_pass")
+
+
+def build_label_luts():
+    """
+    Costruisce le lookup table per la segmentazione in un solo passaggio
+
+    Returns:
+        tuple: (bit_luts, label_lut)
+            bit_luts (list): una tabella da 256 valori per ogni canale H, S, V;
+                il bit i è acceso se il valore rientra nel range del frutto i
+            label_lut (ndarray 256): da maschera di bit a etichetta
+                (0 = sfondo, i + 1 = frutto i)
+    """
+    bit_luts = [np.zeros(256, np.uint8) for _ in range(3)]
+    for i, (lo, hi) in enumerate(FRUIT_HSV_RANGES):
+        for c in range(3):
+            bit_luts[c][lo[c]:hi[c] + 1] |= 1 << i
+
+    # Se un pixel rientra in più range (solo arancione/verde per H = 30..32)
+    # vince il frutto con indice maggiore, come l'ultimo contorno in find_fruit
+    label_lut = np.zeros(256, np.uint8)
+    for bits in range(1, 1 << len(FRUIT_HSV_RANGES)):
+        label_lut[bits] = bits.bit_length()
+    return bit_luts, label_lut
+
+
+class FruitDetector:
+    """
+    Rilevatore di frutti che riutilizza soglie, kernel e buffer tra i frame
+
+    Args:
+        width, height (int): Dimensioni dell'immagine della telecamera
+        kernel_size (int): Lato del kernel per le operazioni morfologiche
+        mode (str): Modalità di segmentazione ("per_class" o "single_pass")
+
+    Dopo detect(), box contiene il rettangolo [x, y, w, h] dell'ultimo
+    frutto rilevato, in coordinate dell'immagine completa.
+    """
+
+    def __init__(self, width, height, kernel_size=5, mode="per_class"):
+        if mode not in DETECTION_MODES:
+            raise ValueError(f"Modalità di rilevamento non valida: {mode}")
+        self.mode = mode
+        self.shape = (height, width, 4)
+        self.lower = [np.array(lo, np.uint8) for lo, _ in FRUIT_HSV_RANGES]
+        self.upper = [np.array(hi, np.uint8) for _, hi in FRUIT_HSV_RANGES]
+        self.kernel = np.ones((kernel_size, kernel_size), np.uint8)
+
+        roi_h = min(ROI_ROWS[1], height) - ROI_ROWS[0]
+        roi_w = min(ROI_COLS[1], width) - ROI_COLS[0]
+        self.hsv = np.empty((roi_h, roi_w, 3), np.uint8)
+        self.mask = np.empty((roi_h, roi_w), np.uint8)
+        self.closed = np.empty((roi_h, roi_w), np.uint8)
+        self.box = [0, 0, 0, 0]
+
+        # Buffer della modalità a passaggio singolo
+        self.bit_luts, self.label_lut = build_label_luts()
+        self.channels = [np.empty((roi_h, roi_w), np.uint8) for _ in range(3)]
+        self.labels = np.empty((roi_h, roi_w), np.uint8)
+
+    def to_hsv(self, image):
+        """
+        Converte la regione di interesse del frame BGRA nel buffer HSV
+
+        Args:
+            image (bytes): Buffer restituito da camera.getImage()
+        """
+        img = np.frombuffer(image, dtype=np.uint8).reshape(self.shape)
+        roi = img[ROI_ROWS[0]:ROI_ROWS[1], ROI_COLS[0]:ROI_COLS[1]]  # Vista, nessuna copia
+        cv2.cvtColor(roi, cv2.COLOR_BGR2HSV, dst=self.hsv)
+
+    def detect(self, image):
+        """
+        Analizza un frame e restituisce il tipo di frutto rilevato
+
+        Args:
+            image (bytes): Buffer restituito da camera.getImage()
+
+        Returns:
+            int: Tipo di frutto rilevato (-1 se nessun frutto trovato)
+        """
+        self.to_hsv(image)
+        if self.mode == "single_pass":
+            return self._detect_single_pass()
+        model = -1
+
+        for i in range(3):
+            # Maschera del colore corrente e pulizia morfologica
+            cv2.inRange(self.hsv, self.lower[i], self.upper[i], dst=self.mask)
+            cv2.morphologyEx(self.mask, cv2.MORPH_CLOSE, self.kernel, dst=self.closed)
+            cv2.morphologyEx(self.closed, cv2.MORPH_OPEN, self.kernel, dst=self.mask)
+
+            for c in cv2.findContours(self.mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[0]:
+                x, y, w, h = cv2.boundingRect(c)
+                if w > MIN_FRUIT_WIDTH:  # Se il contorno è abbastanza grande
+                    model = i
+                    box = self.box
+                    box[0], box[1], box[2], box[3] = x + ROI_COLS[0], y + ROI_ROWS[0], w, h
+
+        return model
+
+    def _detect_single_pass(self):
+        """Segmentazione di tutti i colori con un'unica immagine di etichette"""
+        model = -1
+        for box in self._locate_roi():
+            label = self.classify_roi(box)
+            if label >= model and label != -1:
+                model = label
+                out = self.box
+                out[0], out[1], out[2], out[3] = box[0] + ROI_COLS[0], box[1] + ROI_ROWS[0], box[2], box[3]
+        return model
+
+    def locate(self, image):
+        """
+        Trova i riquadri di tutti i frutti nel frame, senza classificarli
+
+        Args:
+            image (bytes): Buffer restituito da camera.getImage()
+
+        Returns:
+            list: Riquadri (x, y, w, h) in coordinate dell'immagine completa
+        """
+        self.to_hsv(image)
+        return [(x + ROI_COLS[0], y + ROI_ROWS[0], w, h) for x, y, w, h in self._locate_roi()]
+
+    def classify(self, box):
+        """
+        Tipo del frutto in un riquadro restituito dall'ultima locate()
+
+        Args:
+            box (tuple): Riquadro (x, y, w, h) in coordinate dell'immagine completa
+
+        Returns:
+            int: Tipo di frutto (-1 se il riquadro non contiene pixel di frutta)
+        """
+        x, y, w, h = box
+        box = (x - ROI_COLS[0], y - ROI_ROWS[0], w, h)
+        if self.mode == "per_class":
+            return self._classify_per_class(box)
+        return self.classify_roi(box)
+
+    def _classify_per_class(self, box):
+        """Tipo del frutto in un riquadro della ROI con le maschere per colore di detect()"""
+        x, y, w, h = box
+        hsv = self.hsv[y:y + h, x:x + w]
+        model = -1
+        for i in range(len(FRUIT_HSV_RANGES)):
+            if self._has_wide_contour(cv2.inRange(hsv, self.lower[i], self.upper[i])):
+                model = i
+        return model
+
+    def classify_roi(self, box):
+        """
+        Etichetta di un riquadro in coordinate della ROI: nero se contiene
+        una componente nera più larga di MIN_FRUIT_WIDTH, altrimenti
+        l'etichetta più frequente
+
+        I voti vengono contati con compare e countNonZero nei buffer mask e
+        closed, liberi dopo la ricerca dei contorni di _locate_roi(): nessuna
+        allocazione per riquadro.
+        """
+        x, y, w, h = box
+        labels = self.labels[y:y + h, x:x + w]
+        mask = self.mask[y:y + h, x:x + w]
+
+        # Nero per primo: la maschera resta in mask per il controllo della componente
+        cv2.compare(labels, ROTTEN + 1, cv2.CMP_EQ, dst=mask)
+        black = cv2.countNonZero(mask)
+        if black > MIN_FRUIT_WIDTH and self._has_wide_mask_component(box):
+            return ROTTEN
+
+        # Etichetta più frequente; a parità vince l'indice minore
+        model, best = -1, 0
+        for fruit in range(len(FRUIT_HSV_RANGES)):
+            votes = black if fruit == ROTTEN else cv2.countNonZero(
+                cv2.compare(labels, fruit + 1, cv2.CMP_EQ, dst=mask))
+            if votes > best:
+                model, best = fruit, votes
+        return model
+
+    def _has_wide_mask_component(self, box):
+        """True se la maschera nel riquadro di mask, pulita come in detect(), ha un contorno più largo di MIN_FRUIT_WIDTH"""
+        x, y, w, h = box
+        mask = self.mask[y:y + h, x:x + w]
+        closed = self.closed[y:y + h, x:x + w]
+        cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.kernel, dst=closed)
+        cv2.morphologyEx(closed, cv2.MORPH_OPEN, self.kernel, dst=mask)
+        return any(cv2.boundingRect(c)[2] > MIN_FRUIT_WIDTH
+                   for c in cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0])
+
+    def _has_wide_contour(self, mask):
+        """True se la maschera, pulita come in detect(), ha un contorno più largo di MIN_FRUIT_WIDTH"""
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.kernel)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        return any(cv2.boundingRect(c)[2] > MIN_FRUIT_WIDTH
+                   for c in cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0])
+
+    def _locate_roi(self):
+        """Immagine di etichette e riquadri dei frutti, in coordinate della ROI"""
+        # Etichette: LUT per canale, AND dei bit, LUT da bit a etichetta
+        h, s, v = self.channels
+        cv2.split(self.hsv, self.channels)
+        cv2.LUT(h, self.bit_luts[0], dst=h)
+        cv2.LUT(s, self.bit_luts[1], dst=s)
+        cv2.LUT(v, self.bit_luts[2], dst=v)
+        cv2.bitwise_and(h, s, dst=self.mask)
+        cv2.bitwise_and(self.mask, v, dst=self.mask)
+        cv2.LUT(self.mask, self.label_lut, dst=self.labels)
+
+        # Morfologia e ricerca dei contorni una sola volta sull'unione. Erosione
+        # e dilatazione (min e max) conservano l'insieme dei pixel non nulli:
+        # sulle etichette danno gli stessi contorni della maschera binaria
+        cv2.morphologyEx(self.labels, cv2.MORPH_CLOSE, self.kernel, dst=self.closed)
+        cv2.morphologyEx(self.closed, cv2.MORPH_OPEN, self.kernel, dst=self.mask)
+
+        boxes = []
+        for c in cv2.findContours(self.mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]:
+            box = cv2.boundingRect(c)
+            if box[2] > MIN_FRUIT_WIDTH:  # Se il contorno è abbastanza grande
+                boxes.append(box)
+        return boxes
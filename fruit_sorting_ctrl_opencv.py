@@ -36,17 +36,30 @@ Questo programma implementa un sistema di controllo robotico con la seguente inf
 # ============================================================================
 # 1. IMPORTAZIONE DELLE LIBRERIE NECESSARIE
 # ============================================================================
-import cv2  # OpenCV per l'elaborazione delle immagini
-import numpy as np  # NumPy per operazioni numeriche e array
-from controller import Supervisor  # Libreria Webots per controllare il robot
-import math # Libreria per operazioni matematiche
-import time # Libreria per gestione del tempo
-import re  # Libreria per le espressioni regolari
 import os  # Per gestire i file
 
+# Backend: Webots oppure il mondo simulato per le esecuzioni headless (vedi replay.py)
+if os.environ.get("FRUIT_SORTER_BACKEND") == "mock":
+    from mock_controller import Supervisor
+else:
+    from controller import Supervisor  # Libreria Webots per controllare il robot
+from fsa_reloader import FSAReloader  # Ricaricamento in background del file FSA
+import fsa_protocol  # Conferma delle versioni FSA applicate
+from fsa_compiler import compile_program  # Programmi FSA (storico, JSON, binario) compilati in StateConfig
+from fruit_detector import FruitDetector  # Pipeline di visione con buffer preallocati
+from fruit_tracker import FruitTracker  # Tracking dei frutti tra i frame
+from frame_recorder import FrameRecorder  # Registrazione dei frame su file memory-mapped
+from hud import Hud  # Etichette e pannello informativo a frequenza limitata
+from actuators import ActuatorStats, CoalescedField, CoalescedMotor  # Invio dei soli comandi cambiati
+from trajectory import ArmTrajectory, CycleStats, constant_velocity_duration  # Traiettorie e tempi di ciclo
+from pick_metrics import PickMetrics, NONE_LABEL  # Tempi dei sottostati per prelievo
+from scheduler import PeriodicTask, Scheduler  # Eventi a tempo di simulazione e task periodici
+import loop_profiler  # Tempi per sezione del loop, overrun e fattore di tempo reale
+
 # --- Inizializzazione Robot e Nastro Strasportatore ---
 
 robot = Supervisor() # Creazione dell'istanza del supervisore
+actuator_stats = ActuatorStats() # Comandi agli attuatori inviati e soppressi
 conveyor_belt = robot.getFromDef("conveyor_belt") # Ottiene il riferimento al nastro trasportatore dal mondo Webots
 
 # Verifica se il nastro trasportatore è stato trovato correttamente
@@ -57,6 +70,8 @@ else:
     speed_field = conveyor_belt.getField("speed")
     if speed_field is None:
         print("Errore: Campo 'speed' non trovato nel nodo 'conveyor_belt'.")
+    else:
+        speed_field = CoalescedField(speed_field, actuator_stats)
 
 # Imposta la velocità iniziale del nastro (deve essere un float)
 speed_field.setSFFloat(0.15) # Per fermare il nastro usa: speed_field.setSFFloat(0.0) 
@@ -69,6 +84,37 @@ timestep = 32 # Timestep di base per la simulazione (32 ms)
 current_state = 1 # Stato corrente del sistema
 numero_stati = 0 # Numeri stati completi
 first_load = True # Stampa FSA
+FSA_DEBUG_STATES = 10 # Stati stampati al primo caricamento (programmi lunghi)
+HUD_REFRESH_PERIOD = 0.2 # Periodo del task di aggiornamento di etichette e pannello (s)
+FSA_POLL_PERIOD = 0.5 # Periodo del task che raccoglie i nuovi FSA dal thread di ricaricamento (s)
+LOGIC_PERIOD = 3 * timestep / 1000.0 # Periodo del task dello stato principale (s)
+STATS_PERIOD = 1.0 # Periodo del task dei resoconti e delle metriche (s)
+DETECTION_MODE = "per_class" # Segmentazione: "per_class" (3 maschere) o "single_pass" (etichette)
+GATED_DETECTION = True # Esegue la visione solo se il sensore di distanza rileva un frutto
+TRACKED_DETECTION = True # Segue i frutti tra i frame e classifica ognuno una sola volta
+TRAJECTORY_MODE = os.environ.get("FRUIT_SORTER_TRAJECTORY") == "1" # Profili trapezoidali sincronizzati
+TRAJECTORY_ACCELERATION = 15.0 # Accelerazione massima dei giunti con le traiettorie (rad/s²)
+SLEEP_UNTIL_DEADLINE = os.environ.get("FRUIT_SORTER_SLEEP") == "1" # Passi lunghi fino alla prossima scadenza
+WAITING_DELAY = 0.288  # Attesa dopo action_waiting (s), pari a 8 passi saltati a 32 ms
+DROPPING_DELAY = 0.160 # Attesa dopo action_dropping (s), pari a 4 passi saltati a 32 ms
+SENSOR_IDLE_PERIOD = round(WAITING_DELAY * 1000) # Periodo dei sensori non letti a ogni passo (ms, 0 = invariato)
+# Periodi (ms) di telecamera, sensore di distanza e sensore del polso, allineati a chi li legge:
+# - idle: gripper vuoto, action_waiting legge la distanza ogni WAITING_DELAY
+# - detect: frutto sotto il gripper (o in arrivo), visione e distanza a ogni frame
+# - moving: ciclo del braccio, posizione del polso a ogni passo e distanza pronta per il ritorno in attesa
+SENSOR_PERIODS = {
+    "idle": (SENSOR_IDLE_PERIOD, SENSOR_IDLE_PERIOD, SENSOR_IDLE_PERIOD),
+    "detect": (timestep, timestep, timestep),
+    "moving": (SENSOR_IDLE_PERIOD, timestep, timestep),
+}
+LOOKAHEAD_MODE = os.environ.get("FRUIT_SORTER_LOOKAHEAD") == "1" # Classificazione anticipata dei frutti in arrivo
+# La stima dell'arrivo decide solo quando leggere la distanza a ogni passo:
+# le dita si chiudono sempre dopo la conferma del sensore di distanza
+LOOKAHEAD_ARRIVAL_ROW = 87 # Riga del bordo anteriore del frutto quando entra sotto il gripper (px, tarata sul mondo simulato)
+LOOKAHEAD_PIXELS_PER_METER = 600.0 # Scala dell'immagine lungo il nastro (px/m, tarata sul mondo simulato)
+FINGER_CLOSE_TIME = 0.256 # Tempo di chiusura delle dita (s)
+LOOKAHEAD_LEAD = 0.128 # Anticipo della lettura a ogni passo sull'arrivo previsto (s)
+LOOKAHEAD_TOLERANCE = 0.5 # Ritardo massimo dell'arrivo rispetto alla previsione (s)
 
 # --- Stati e Contatori ---
 fruit = -1 # Variabile per il tipo di frutto (-1 = nessun frutto, 0 = arancia, 1 = mela, 2 = mela marcia)
@@ -78,7 +124,12 @@ state_apple_count = 0    # Mele raccolte nello stato corrente
 state_orange_count = 0   # Arance raccolte nello stato corrente
 
 # --- Flag di Sistema ---
-counter = 0
+substate_wait = 0.0 # Attesa richiesta dal sottostato prima della prossima esecuzione (s)
+lookahead_fruit = -1 # Frutto in arrivo rilevato dalla telecamera
+lookahead_eta = 0.0 # Istante previsto di arrivo sotto il gripper
+skipped_frames = 0 # Frame non analizzati grazie al sensore di distanza
+analyzed_at = None # Tempo dell'ultimo frame analizzato da find_fruit
+sensor_mode = "detect" # Modo dei periodi dei sensori (vedi SENSOR_PERIODS)
 is_process_complete = False
 main_state_changed = False
 elapsed_time = 0
@@ -87,31 +138,27 @@ elapsed_time = 0
 state_start_time = 0
 state_delay_active = False
 state_delay_end_time = 0
+scheduler = Scheduler() # Scadenze dei sottostati e dei delay tra gli stati
+substate_event = None # Prossima esecuzione del sottostato, per scheduler.cancel()
+
+# --- Indici dei contenitori ---
+BIN_NAMES = ("bin_green1", "bin_green2", "bin_orange1", "bin_orange2") # Stesso ordine di fsa_compiler.BIN_CODES
+BIN_G1, BIN_G2, BIN_O1, BIN_O2 = range(len(BIN_NAMES))
+BIN_TARGETS = (1, 5, 0, 4) # Indice in target_positions di ogni contenitore
+BELT_SPEED = 0.15 # Velocità del nastro se lo stato non ne indica una
 
 # --- Contatori Contenitori ---
-counter_O1 = 0      # Contatore arance contenitore 1
-counter_G1 = 0      # Contatore mele contenitore 1
-counter_O2 = 0      # Contatore arance contenitore 2
-counter_G2 = 0      # Contatore mele contenitore 2
+bin_totals = [0] * len(BIN_NAMES)       # Oggetti totali per contenitore (indice BIN_*)
+state_bin_counts = [0] * len(BIN_NAMES) # Oggetti per contenitore nello stato corrente
+state_outstanding = 0 # Oggetti ancora richiesti per completare lo stato corrente
 counter_binblue = 0 # Contatore mele marce
 
-# --- Definizioni di variabile dopo le altre dichiarazioni di variabile globale ---
-bin_green1, bin_green2 = "bin_green1", "bin_green2"
-bin_orange1, bin_orange2 = "bin_orange1", "bin_orange2"
-
-# --- Dizionario per tenere traccia dei conteggi nei contenitori ---
-state_bin_counts = {
-    "bin_green1": 0,
-    "bin_green2": 0,
-    "bin_orange1": 0,
-    "bin_orange2": 0
-}
-
 # ============================================================================
 # 3. CONFIGURAZIONE DELLE POSIZIONI TARGET DEL ROBOT
 # ============================================================================
 # --- Posizioni Target ---
 target_HALT = [0, -1.57, 0, -1.57, 0] # Posizione di riposo (HALT) del robot
+target_HOME = [0.0] * 5 # Posizione di attesa sopra il nastro
 target_positions = [                                        # Array delle posizioni target per i vari contenitori
     [-1.570796, -1.87972, -2.139774, -2.363176, -1.50971],  # O1 (posizione arancia 1)
     [0, -1.87972, -2.139774, -2.363176, -1.50971],          # G1 (posizione mela 1)
@@ -120,6 +167,7 @@ target_positions = [                                        # Array delle posizi
     [1.570796, -1.87972, -2.139774, -2.363176, -1.50971],   # O2 (posizione arancia 2)
     [1, -1.87972, -2.139774, -2.363176, -1.50971]           # G2 (posizione mela 2)
 ]
+target_names = ("O1", "G1", "B1", "HALT", "O2", "G2") # Nomi delle posizioni target
 
 # --- Inizializzazione Dispositivi ---
 speed = 2 # Velocità di base del robot UR5e
@@ -129,6 +177,7 @@ hand_motors = []
 hand_motors.append(robot.getDevice('finger_1_joint_1'))
 hand_motors.append(robot.getDevice('finger_2_joint_1'))
 hand_motors.append(robot.getDevice('finger_middle_joint_1'))
+hand_motors = [CoalescedMotor(motor, actuator_stats) for motor in hand_motors]
 
 # Inizializzazione dei motori del braccio UR5e
 ur_motors = []
@@ -137,11 +186,20 @@ ur_motors.append(robot.getDevice('shoulder_lift_joint'))
 ur_motors.append(robot.getDevice('elbow_joint'))
 ur_motors.append(robot.getDevice('wrist_1_joint'))
 ur_motors.append(robot.getDevice('wrist_2_joint'))
+ur_motors = [CoalescedMotor(motor, actuator_stats) for motor in ur_motors]
 
 # Imposta la velocità di tutti i motori del braccio
 for i in range(5):
     ur_motors[i].setVelocity(speed)
 
+# Traiettorie sincronizzate dei giunti (FRUIT_SORTER_TRAJECTORY=1) e tempi di ciclo
+arm_trajectory = ArmTrajectory(ur_motors, TRAJECTORY_ACCELERATION) if TRAJECTORY_MODE else None
+cycle_stats = CycleStats()
+cycle_start = None      # Inizio del ciclo di prelievo in corso
+cycle_predicted = 0.0   # Durata prevista del ciclo in corso
+cycle_key = None        # (frutto, contenitore) del ciclo in corso
+picking_target = 2      # Indice in target_positions del rilascio in corso
+
 # Inizializzazione sensore di distanza del gripper
 distance_sensor = robot.getDevice('distance sensor')
 distance_sensor.enable(timestep)
@@ -153,6 +211,28 @@ position_sensor.enable(timestep)
 # Inizializzazione della telecamera
 camera = robot.getDevice('camera')
 camera.enable(timestep)
+camera_enabled_at = robot.getTime() # Origine della griglia dei frame: ultima camera.enable()
+camera_previous_frame = None        # Istante dell'ultimo frame prodotto prima di camera_enabled_at
+fruit_detector = FruitDetector(camera.getWidth(), camera.getHeight(), mode=DETECTION_MODE)
+fruit_tracker = FruitTracker(fruit_detector)
+fruit_box = (0, 0, 0, 0) # Riquadro del frutto più vicino al gripper nell'ultimo frame analizzato
+
+# Registrazione opzionale dei frame (FRUIT_SORTER_RECORD=percorso.npy)
+recorder = None
+if os.environ.get("FRUIT_SORTER_RECORD"):
+    recorder = FrameRecorder(os.environ["FRUIT_SORTER_RECORD"],
+                             int(os.environ.get("FRUIT_SORTER_RECORD_FRAMES", 1024)),
+                             camera.getWidth(), camera.getHeight())
+recorded_frame_at = None # Istante dell'ultimo frame registrato
+
+# Metriche opzionali dei sottostati (FRUIT_SORTER_METRICS_DIR=directory)
+metrics = None
+if os.environ.get("FRUIT_SORTER_METRICS_DIR"):
+    metrics = PickMetrics(os.environ["FRUIT_SORTER_METRICS_DIR"])
+
+# Profiler opzionale del loop (FRUIT_SORTER_PROFILE=1 o percorso del riepilogo)
+profiler = loop_profiler.from_environment()
+lap = profiler.lap if profiler is not None else (lambda name: None)
 
 # Inizializzazione del display
 display = robot.getDevice('display')
@@ -163,6 +243,12 @@ display.setFont('Verdana', 16, True)
 # Inizializzazione speaker
 speaker = robot.getDevice('speaker')
 
+# Inizializzazione del pannello informativo e delle etichette (HUD)
+info_display = robot.getDevice("info_display")
+if info_display is None:
+    print("Errore: Display non trovato!")
+hud = Hud(robot, info_display, 0.0)  # Frequenza data dal task "hud" dell'executor
+
 # ============================================================================
 # 4. FUNZIONI DI UTILITÀ PER AUDIO E DISPLAY
 # ============================================================================
@@ -191,150 +277,98 @@ def printDisplay(x, y, w, h, name):
     display.drawRectangle(x, y, w, h)
     display.drawText(name, x - 2, y - 20)
 
-def draw_info_panel():
+def printTracks(tracks):
     """
-    Crea e aggiorna un pannello informativo sul display del robot
-    che mostra vari contatori, stati del sistema e requisiti richiesti
-    """
-    # Ottiene il riferimento al display    
-    info_display = robot.getDevice("info_display")
-
-    if info_display is None:
-        print("Errore: Display non trovato!")
-        return
-
-    # Configura lo sfondo del display
-    info_display.setColor(0xFFFFFF)  # Sfondo bianco
-    info_display.setAlpha(0.8)  # Leggera trasparenza
-    info_display.fillRectangle(0, 0, 270, 180)
+    Disegna sul display i riquadri di tutti i frutti seguiti, con tipo e
+    identificatore della traccia
     
-    info_display.setFont("Arial", 14, True)
-    info_display.setColor(0x000000)  # Testo nero
-    info_display.setAlpha(1.0)  # Testo completamente opaco
+    Args:
+        tracks (list): Tracce viste nell'ultimo frame
+    """
+    resetDisplay()
+    for track in tracks:
+        x, y, w, h = track.box
+        display.drawRectangle(x, y, w, h)
+        name = fruit_names[track.fruit] if track.fruit != -1 else "?"
+        display.drawText(f"{name} #{track.id}", x - 2, y - 20)
 
-    # Ottiene i requisiti dello stato corrente
-    current_requirements = FSA[current_state]["requirements"] if current_state in FSA else {}
+def hud_view_model():
+    """
+    Crea il modello della vista mostrato dal pannello informativo e dalle
+    etichette: contatori, stati del sistema e requisiti richiesti
     
-    # Calcola i requisiti totali per mele e arance nello stato corrente
-    required_apples = sum(count for bin_name, count in current_requirements.items() if bin_name.startswith("bin_green"))
-    required_oranges = sum(count for bin_name, count in current_requirements.items() if bin_name.startswith("bin_orange"))
+    Returns:
+        dict: Valori mostrati dall'HUD
+    """
+    # Ottiene la configurazione compilata dello stato corrente
+    config = FSA[current_state] if current_state < len(FSA) else FSA[-1]
+    required = config.required
 
-    # Calcola il delay rimanente
+    # Calcola il delay rimanente (arrotondato al decimo di secondo mostrato)
     if state_delay_active and not is_process_complete:
-        remaining_delay = max(0, state_delay_end_time - robot.getTime())
+        remaining_delay = round(max(0, state_delay_end_time - robot.getTime()), 1)
     else:
         remaining_delay = 0
 
-    # Mostra contatori generali con requisiti
-    info_display.drawText(f"Apples: {apple:3d}    {state_apple_count}|{required_apples}", 10, 10)
-    info_display.drawText(f"Oranges: {orange:3d}    {state_orange_count}|{required_oranges}", 10, 30)
-    info_display.drawText(f"Fruit: {fruit_names[fruit] if fruit != -1 else 'None'}", 10, 50)
-    # Mostra stato corrente
-    info_display.drawText(f"State: {current_state}|{numero_stati}", 10, 100)
-    
-    # Mostra contatori dei contenitori con requisiti
-    g1_req = current_requirements.get(bin_green1, 0)
-    g2_req = current_requirements.get(bin_green2, 0)
-    o1_req = current_requirements.get(bin_orange1, 0)
-    o2_req = current_requirements.get(bin_orange2, 0)
-    
-    info_display.drawText(f"G1: {counter_G1} {state_bin_counts[bin_green1]}|{g1_req}", 10, 120)
-    info_display.drawText(f"O1: {counter_O1} {state_bin_counts[bin_orange1]}|{o1_req}", 10, 140)
-    info_display.drawText(f"G2: {counter_G2} {state_bin_counts[bin_green2]}|{g2_req}", 95, 120)
-    info_display.drawText(f"O2: {counter_O2} {state_bin_counts[bin_orange2]}|{o2_req}", 95, 140)
-    info_display.drawText(f"B1: {counter_binblue}", 180, 120)
-    
-    # Mostra delay e substate
-    info_display.drawText(f"Delay: {remaining_delay:.1f}", 180, 140)
-    info_display.drawText(f"Substate: {'END' if current_substate == 'END' else (current_substate.__name__ if hasattr(current_substate, '__name__') else 'Unknown')}", 10, 160)
+    return {
+        "apple": apple, "orange": orange,
+        "state_apples": state_apple_count, "state_oranges": state_orange_count,
+        "required_apples": config.required_apples, "required_oranges": config.required_oranges,
+        "fruit": fruit_names[fruit] if fruit != -1 else 'None',
+        "skipped": skipped_frames,
+        "state": current_state, "states": numero_stati,
+        "G1": bin_totals[BIN_G1], "state_G1": state_bin_counts[BIN_G1], "required_G1": required[BIN_G1],
+        "O1": bin_totals[BIN_O1], "state_O1": state_bin_counts[BIN_O1], "required_O1": required[BIN_O1],
+        "G2": bin_totals[BIN_G2], "state_G2": state_bin_counts[BIN_G2], "required_G2": required[BIN_G2],
+        "O2": bin_totals[BIN_O2], "state_O2": state_bin_counts[BIN_O2], "required_O2": required[BIN_O2],
+        "blue": counter_binblue,
+        "delay": remaining_delay,
+        "substate": 'END' if current_substate == 'END' else (current_substate.__name__ if hasattr(current_substate, '__name__') else 'Unknown'),
+    }
 
 # ============================================================================
 # 5. GESTIONE FSA (FINITE STATE AUTOMATON)
 # ============================================================================
 def parse_fsa_message(message):
     """
-    Analizza un messaggio FSA e crea un dizionario di configurazioni degli stati
+    Analizza un messaggio FSA e crea la lista compilata delle configurazioni degli stati
     
     Args:
-        message (str): Stringa contenente la configurazione FSA
+        message: Programma FSA in uno dei formati di fsa_schema.load
+                 (stringa storica, JSON o binario)
         
     Returns:
-        dict: Dizionario contenente le configurazioni degli stati, o None se c'è un errore
+        list: StateConfig indicizzati per numero di stato (indice 0 non usato,
+              ultimo elemento = HALT), o None se c'è un errore
     """
-    global numero_stati, first_load
+    global first_load
 
     try:
-        # Estrae il numero di stati dal messaggio
-        num_states = int(message.split(',')[0].strip())
-        numero_stati = num_states + 1 # memorizza quanti stati ci sono
-        
-        # Usa regex per estrarre le configurazioni degli stati
-        state_configs = re.findall(r'\((\d+,(?:G|O)\d+,\d+,(?:G|O)\d+,\d+)\)', message)
-        
-        # Verifica la corrispondenza tra numero di stati dichiarati e configurazioni trovate
-        if len(state_configs) != num_states:
-            print(f"Errore: Il numero di stati ({num_states}) non corrisponde al numero di configurazioni ({len(state_configs)})")
-            return None
-            
-        # Inizializza il dizionario FSA
-        fsa = {}
-        
-        # Processa ogni configurazione di stato
-        for i, config in enumerate(state_configs, start=1):
-            # Divide la configurazione nei suoi componenti
-            values = config.split(',')
-            g1_count = int(values[0])
-            g1_bin = values[1]
-            o1_count = int(values[2])
-            o1_bin = values[3]
-            delay = int(values[4])
-            
-            # Converte i nomi dei contenitori
-            bin_green = f"bin_green{g1_bin[-1]}"
-            bin_orange = f"bin_orange{o1_bin[-1]}"
-            
-            # Calcola lo stato successivo
-            # Se è l'ultimo stato, il prossimo stato è HALT (num_states + 1)
-            next_state = i + 1 if i < num_states else (num_states + 1)
-            
-            # Crea la configurazione dello stato
-            fsa[i] = {
-                "trigger": next_state,
-                "requirements": {
-                    bin_green: g1_count,
-                    bin_orange: o1_count
-                },
-                "delay": delay
-            }
-        
-        # Aggiungi lo stato HALT
-        halt_state_num = num_states + 1
-        fsa[halt_state_num] = {
-            "trigger": -1,
-            "requirements": {},
-            "delay": 0
-        }
-        
-        if first_load:    
-            print_fsa_debug_info(fsa, num_states)
-            first_load = False
-        
-        return fsa
-
-    except Exception as e:
+        fsa = compile_program(message, BELT_SPEED)
+    except ValueError as e:
         print(f"Errore nel parsing del messaggio FSA: {e}")
         return None
+    num_states = len(fsa) - 2  # Esclusi l'indice 0 e HALT
+    
+    if first_load:    
+        print_fsa_debug_info(fsa, num_states)
+        first_load = False
+    
+    return fsa
 
 def print_fsa_debug_info(fsa, num_states):
     """Stampa informazioni di debug per la configurazione FSA"""
     print("\n=== Configurazione FSA ===")
-    for state in range(1, num_states + 1):
+    for state in range(1, min(num_states, FSA_DEBUG_STATES) + 1):
         print(f"Stato {state}:")
-        print(f"  Trigger: {fsa[state]['trigger']}")
+        print(f"  Trigger: {fsa[state].trigger}")
         print("  Requirements:")
-        for bin_name, count in fsa[state]['requirements'].items():
-            print(f"    {bin_name}: {count} oggetti richiesti")
-        print(f"  Delay: {fsa[state]['delay']} secondi")
+        for bin_index in fsa[state].fruit_bins[1] + fsa[state].fruit_bins[0]:
+            print(f"    {BIN_NAMES[bin_index]}: {fsa[state].required[bin_index]} oggetti richiesti")
+        print(f"  Delay: {fsa[state].delay} secondi")
+        print(f"  Nastro: {fsa[state].belt_speed} m/s")
+    if num_states > FSA_DEBUG_STATES:
+        print(f"... altri {num_states - FSA_DEBUG_STATES} stati")
     
     print(f"\nStato {num_states + 1}:")
     print("  HALT")
@@ -343,86 +377,27 @@ def print_fsa_debug_info(fsa, num_states):
 # ============================================================================
 # INIZIALIZZAZIONE FSA
 # ============================================================================
-# Funzione per leggere la stringa dal file
-def leggi_stringa_da_file(percorso_file):
-    try:
-        with open(percorso_file, 'r') as file:
-            return file.read().strip()  # Rimuove gli spazi vuoti e legge il contenuto
-    except Exception as e:
-        print(f"Errore durante la lettura del file: {e}")
-        return None
-
-# Carica il messaggio FSA dal file
-message = leggi_stringa_da_file('fsa_message.json')
-
-# Se non c'è un messaggio nel file, termina il programma
-if message is None:
-    print("Errore: File FSA non trovato o non leggibile")
-    exit(1)  # Termina il programma con codice di errore
+# Il file FSA viene osservato da un thread in background (inotify o polling):
+# il loop principale riceve un nuovo FSA solo quando il contenuto cambia
+file_path = 'fsa_message.json'
+fsa_reloader = FSAReloader(file_path, parse_fsa_message)
 
-# Esegui il parsing del messaggio
-FSA = parse_fsa_message(message)
+# Carica ed analizza il messaggio FSA all'avvio
+FSA = fsa_reloader.load()
 
+# Se il file manca o il parsing fallisce, termina il programma
 if FSA is None:
-    print("Errore: Parsing del messaggio FSA fallito")
+    print("Errore: File FSA non trovato o non valido")
     exit(1)  # Termina il programma con codice di errore
-    
-# Variabili per monitorare l'ultima modifica
-last_modified_time = None
-
-# Funzione per controllare se il file è stato modificato
-def is_file_modified(percorso_file, last_modified_time):
-    global first_load
-    
-    try:
-        current_modified_time = os.path.getmtime(percorso_file)
-        if current_modified_time != last_modified_time:
-            return current_modified_time  # Il file è stato modificato
-            first_load = True
-        return last_modified_time  # Nessuna modifica
-    except Exception as e:
-        print(f"Errore nel controllo della modifica del file: {e}")
-        return last_modified_time
-
-# Funzione per leggere e analizzare il messaggio FSA
-def load_fsa_message(percorso_file, last_modified_time):
-    # Controlla se il file è stato modificato
-    last_modified_time = is_file_modified(percorso_file, last_modified_time)
-    
-    # Se il file è stato modificato, rilegge e analizza il messaggio
-    if last_modified_time != -1:
-        message = leggi_stringa_da_file(percorso_file)
-        
-        if message:
-            FSA = parse_fsa_message(message)
-            if FSA is None:
-                print("Errore: Parsing del messaggio FSA fallito")
-                exit(1)  # Termina il programma con codice di errore
-        else:
-            print("Errore: File FSA non trovato o non leggibile")
-            exit(1)  # Termina il programma con codice di errore
-    else:
-        print("Errore: Impossibile controllare le modifiche al file FSA")
-        exit(1)  # Termina il programma con codice di errore
 
-    return FSA, last_modified_time
-
-# Imposta il percorso del file e la variabile per monitorare il tempo di modifica
-file_path = 'fsa_message.json'
-last_modified_time = -1  # Inizializza con un valore di default
-
-# contatore contenitori
-bin_counts = {
-    "bin_green1": 0,
-    "bin_green2": 0,
-    "bin_orange1": 0,
-    "bin_orange2": 0
-}
+numero_stati = len(FSA) - 1 # memorizza quanti stati ci sono (HALT compreso)
+next_fsa = None # Nuovo FSA in attesa di un punto sicuro (doppio buffer)
+fsa_reloader.start()
 
 # ============================================================================
 # FUNZIONI DI GESTIONE DELLE POSIZIONI DI PRELIEVO
 # ============================================================================
-def get_picking_positions(fruit, state):
+def get_picking_target(fruit, state):
     """
     Determina la posizione corretta per il rilascio del frutto in base al tipo e allo stato
     
@@ -431,68 +406,82 @@ def get_picking_positions(fruit, state):
         state (int): Stato corrente del sistema
         
     Returns:
-        list: Lista delle posizioni target per i giunti del robot
+        int: Indice della posizione target in target_positions
     """
-    # Gestione delle mele marce - vanno sempre nel cestino blu
-    if fruit == 2:
-        return target_positions[2]  # Posizione B1 (cestino mele marce)
+    # Frutto non riconosciuto: posizione di fallback (cestino mele marce)
+    if fruit < 0:
+        return 2
         
-    # Ottiene la configurazione dello stato corrente
-    current_state_config = FSA[state]["requirements"]
-    
-    # Gestione delle mele (fruit == 1)
-    if fruit == 1:
-        # Cerca nei requisiti quale contenitore verde è richiesto
-        for bin_name in current_state_config:
-            if bin_name.startswith("bin_green"):
-                # Sceglie tra G1 e G2 in base al numero del contenitore
-                return target_positions[1] if bin_name.endswith("1") else target_positions[5]
-    
-    # Gestione delle arance (fruit == 0)
-    elif fruit == 0:
-        # Cerca nei requisiti quale contenitore arancione è richiesto
-        for bin_name in current_state_config:
-            if bin_name.startswith("bin_orange"):
-                # Sceglie tra O1 e O2 in base al numero del contenitore
-                return target_positions[0] if bin_name.endswith("1") else target_positions[4]
+    # Mele marce sempre nel cestino blu, mele e arance nel contenitore dello stato
+    if fruit == 2:
+        return 2
+    bin_index = select_bin(fruit, state)
+    return BIN_TARGETS[bin_index] if bin_index != -1 else 2
+
+def select_bin(fruit, state):
+    """
+    Contenitore di destinazione di una mela o di un'arancia: il primo, in
+    ordine di riempimento, che non ha ancora gli oggetti richiesti nello
+    stato; a contenitori completi, l'ultimo.
     
-    # Posizione di fallback in caso di errori
-    return target_positions[2]
+    Args:
+        fruit (int): Tipo di frutto (0=arancia, 1=mela)
+        state (int): Stato corrente del sistema
+        
+    Returns:
+        int: Indice BIN_* del contenitore (-1 se il frutto non ne ha)
+    """
+    bins = FSA[state].fruit_bins[fruit]
+    required = FSA[state].required
+    for bin_index in bins:
+        if state_bin_counts[bin_index] < required[bin_index]:
+            return bin_index
+    return bins[-1] if bins else -1
+
+def get_picking_positions(fruit, state):
+    """
+    Posizioni dei giunti per il rilascio del frutto (vedi get_picking_target)
+        
+    Returns:
+        list: Lista delle posizioni target per i giunti del robot
+    """
+    return target_positions[get_picking_target(fruit, state)]
 
 # ============================================================================
 # 6. FUNZIONI DI GESTIONE DEGLI STATI E TRANSIZIONI
 # ============================================================================
 
-def handle_state_delay(current_time):
+def handle_state_delay():
     """
-    Gestisce i ritardi tra gli stati e le relative transizioni.
-    
-    Args:
-        current_time (float): Tempo corrente della simulazione
+    Mantiene fermo il nastro durante il delay tra gli stati (la fine del
+    delay è un evento dello scheduler, vedi end_state_delay).
         
     Returns:
         bool: True se il delay è ancora attivo, False altrimenti
     """
-    global state_delay_active, current_state, main_state_changed, state_bin_counts
-    
     if not state_delay_active:
         return False
         
     speed_field.setSFFloat(0.0)  # Ferma il nastro durante il delay
-    
-    # Controllo se il delay è terminato
-    if current_time >= state_delay_end_time:
-        state_delay_active = False
-        
-        # Gestione transizione di stato
-        if FSA[current_state]["trigger"] != -1:
-            transition_to_next_state()
-        else:
-            halt_system()
-            
-        return False
     return True
 
+def end_state_delay():
+    """
+    Evento di fine delay: esegue la transizione al prossimo stato o
+    l'arresto del sistema.
+    """
+    global state_delay_active
+    
+    state_delay_active = False
+    if metrics is not None:
+        metrics.record_delay(state_delay_end_time - FSA[current_state].delay, robot.getTime())
+    
+    # Gestione transizione di stato
+    if FSA[current_state].trigger != -1:
+        transition_to_next_state()
+    else:
+        halt_system()
+
 def transition_to_next_state():
     """
     Gestisce la transizione al prossimo stato, resettando i contatori
@@ -502,53 +491,119 @@ def transition_to_next_state():
     global state_apple_count, state_orange_count
     
     old_state = current_state
-    current_state = FSA[current_state]["trigger"]
+    current_state = FSA[current_state].trigger
     main_state_changed = True
     
     # Reset contatori per il nuovo stato
-    state_bin_counts = {
-        "bin_green1": 0,
-        "bin_green2": 0,
-        "bin_orange1": 0,
-        "bin_orange2": 0
-    }
+    state_bin_counts = [0] * len(BIN_NAMES)
     
     # Reset dei contatori di stato
     state_apple_count = state_orange_count = 0
     
-    speed_field.setSFFloat(0.15)  # Riavvia il nastro
+    speed_field.setSFFloat(FSA[current_state].belt_speed)  # Riavvia il nastro alla velocità del nuovo stato
+    reset_state_progress()
 
-def check_state_requirements():
+def reset_state_progress():
     """
-    Verifica se i requisiti dello stato corrente sono stati soddisfatti.
-    
-    Returns:
-        bool: True se i requisiti sono soddisfatti, False altrimenti
+    Ricalcola gli oggetti mancanti per completare lo stato corrente.
+    Va chiamata solo quando cambiano lo stato o l'FSA: durante lo stato il
+    contatore viene decrementato da action_dropping. Se non manca nulla
+    avvia subito il delay dello stato.
     """
-    current_state_config = FSA[current_state]
-    requirements = current_state_config["requirements"]
+    global state_outstanding
     
-    for bin_name, required_count in requirements.items():
-        current_count = state_bin_counts.get(bin_name, 0)
-        if current_count < required_count:
-            return False
-    return True
+    required = FSA[current_state].required
+    state_outstanding = 0
+    for bin_index in range(len(BIN_NAMES)):
+        if state_bin_counts[bin_index] < required[bin_index]:
+            state_outstanding += required[bin_index] - state_bin_counts[bin_index]
+    
+    if state_outstanding == 0 and not state_delay_active and not is_process_complete:
+        start_state_delay(robot.getTime())
     
 def halt_system():
     """
     Gestisce l'arresto del sistema, portando il robot in posizione di riposo
     e fermando il nastro trasportatore.
     """
-    global current_substate, is_process_complete
+    global current_substate, is_process_complete, cycle_start
     
     is_process_complete = True
     current_substate = "END"  # Mark as END state
+    cycle_start = None  # Ciclo interrotto: non va misurato se il sistema riparte (restart_process)
     speed_field.setSFFloat(0.0)
     
     # Movimento alla posizione di riposo
+    if arm_trajectory is not None:
+        arm_trajectory.move(target_HALT, robot.getTime())
+        return
     for i in range(5):
         ur_motors[i].setPosition(target_HALT[i])
 
+def fsa_swap_safe():
+    """
+    Verifica se il programma FSA può essere sostituito: tra un prelievo e
+    l'altro (braccio a casa, nessun frutto in presa) o a sistema fermo.
+    """
+    return current_substate is action_waiting or is_process_complete
+
+def apply_fsa(new_fsa):
+    """
+    Sostituisce il programma FSA in esecuzione senza riavviare il controller.
+    Se il nuovo programma ha meno stati di quello corrente si passa all'ultimo
+    stato; a sistema fermo (HALT) il nuovo programma riparte dal primo stato.
+    
+    Args:
+        new_fsa (list): FSA validato da parse_fsa_message
+    """
+    global FSA, numero_stati, current_state
+    
+    FSA = new_fsa
+    numero_stati = len(FSA) - 1
+    if is_process_complete:
+        restart_process()
+    elif current_state >= numero_stati:
+        current_state = numero_stati - 1  # Ultimo stato reale: numero_stati è HALT
+    reset_state_progress()
+    if not state_delay_active:
+        speed_field.setSFFloat(FSA[current_state].belt_speed)
+    version = fsa_reloader.version
+    print(f"FSA aggiornato (versione {version if version is not None else 'senza busta'}), stato {current_state}")
+    acknowledge_fsa()
+
+def restart_process():
+    """
+    Riavvia il sistema fermo (HALT) dal primo stato del programma: azzera i
+    contatori dello stato, riporta il braccio sopra il nastro e riprogramma
+    i sottostati a partire dall'attesa
+    """
+    global is_process_complete, current_state, current_substate, main_state_changed
+    global state_bin_counts, state_apple_count, state_orange_count, substate_event
+    
+    is_process_complete = False
+    current_state = 1
+    main_state_changed = False
+    state_bin_counts = [0] * len(BIN_NAMES)
+    state_apple_count = state_orange_count = 0
+    current_substate = action_waiting
+    
+    if arm_trajectory is not None:
+        arm_trajectory.move(target_HOME, robot.getTime())
+    else:
+        for motor in ur_motors:
+            motor.setPosition(0.0)
+    scheduler.cancel(substate_event)  # Esecuzione non ancora scaduta prima dell'HALT
+    substate_event = scheduler.schedule(robot.getTime(), timed_substate)
+
+def acknowledge_fsa():
+    """Conferma a writer_node la versione FSA in esecuzione (fsa_applied.json)"""
+    if fsa_reloader.version is None:
+        return  # Formato storico: nessuna versione da confermare
+    try:
+        fsa_protocol.acknowledge(file_path, fsa_reloader.version, robot.getTime())
+    except OSError as e:
+        print(f"Errore durante la scrittura della conferma FSA: {e}")
+
 def start_state_delay(current_time):
     """
     Avvia il delay dello stato corrente.
@@ -559,7 +614,8 @@ def start_state_delay(current_time):
     global state_delay_active, state_delay_end_time
     
     state_delay_active = True
-    state_delay_end_time = current_time + FSA[current_state]["delay"]
+    state_delay_end_time = current_time + FSA[current_state].delay
+    scheduler.schedule(state_delay_end_time, end_state_delay)
     speed_field.setSFFloat(0.0)
 
 def main_state():
@@ -571,15 +627,9 @@ def main_state():
         halt_system()
         return
     
-    current_time = robot.getTime()
-    
-    # Gestione del delay tra stati
-    if handle_state_delay(current_time):
-        return
-    
-    # Verifica requisiti stato corrente
-    if check_state_requirements() and not state_delay_active:
-        start_state_delay(current_time)
+    # Gestione del delay tra stati (il completamento dei requisiti
+    # viene rilevato da action_dropping all'ultimo deposito)
+    handle_state_delay()
 
 
 # ============================================================================
@@ -589,59 +639,107 @@ def find_fruit():
     """
     Analizza l'immagine dalla telecamera per rilevare e classificare i frutti
     
+    Con TRACKED_DETECTION i frutti nel frame vengono associati alle tracce
+    esistenti e solo quelli nuovi vengono classificati.
+    
     Returns:
-        int: Tipo di frutto rilevato (-1 se nessun frutto trovato)
-    """
-    # Inizializzazione liste per l'elaborazione dell'immagine
-    global fruit_names, fruit_names
-    min = []        # Valori minimi HSV per ogni colore
-    max = []        # Valori massimi HSV per ogni colore
-    cnts = []       # Contorni rilevati
-    mask = []       # Maschere per ogni colore
-    model = -1      # Tipo di frutto rilevato
-
-    # Acquisizione e pre-processing dell'immagine
-    img = np.frombuffer(camera.getImage(), dtype=np.uint8).reshape((camera.getHeight(), camera.getWidth(), 4))
-    roi = img[0:150, 35:165]  # Regione di interesse
-    imHSV = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)  # Conversione in HSV
-
-    # Definizione range colori in HSV
-    # Arancione
-    min.append(np.array([10, 135, 135], np.uint8))
-    max.append(np.array([32, 255, 255], np.uint8))
-    
-    # Verde
-    min.append(np.array([30, 50, 50], np.uint8))
-    max.append(np.array([90, 255, 255], np.uint8))
-    
-    # Nero (per mele marce)
-    min.append(np.array([0, 0, 0], np.uint8))
-    max.append(np.array([179, 50, 30], np.uint8))
-       
-    
-    # Kernel per operazioni morfologiche
-    Kernel = np.ones((5, 5), np.uint8)
-    
-    # Processo di rilevamento per ogni colore
-    for i in range(3):
-        # Creazione della maschera per il colore corrente
-        mask.append(cv2.inRange(imHSV, min[i], max[i]))
+        int: Tipo del frutto più vicino al gripper (-1 se nessun frutto trovato)
+    """
+    global fruit_box, analyzed_at
+    analyzed_at = robot.getTime()
+    if not TRACKED_DETECTION:
+        model = fruit_detector.detect(camera.getImage())
+
+        # Disegna il riquadro dell'ultimo frutto rilevato
+        if model != -1:
+            x, y, w, h = fruit_detector.box
+            fruit_box = (x, y, w, h)
+            printDisplay(x, y, w, h, fruit_names[model])
+        return model
+
+    tracks = fruit_tracker.update(camera.getImage(), robot.getTime())
+    if tracks:
+        printTracks(tracks)  # Un solo ridisegno per frame, per tutti i frutti
+    nearest = fruit_tracker.nearest(tracks)
+    if nearest is None:
+        return -1
+    fruit_box = nearest.box
+    return nearest.fruit
+
+def estimate_arrival(now):
+    """
+    Stima tipo e istante di arrivo del frutto in avvicinamento, dalla sua
+    posizione nel frame e dalla velocità del nastro. Il frutto avanza verso
+    il basso dell'immagine: il bordo inferiore del riquadro è quello anteriore.
+    
+    Args:
+        now (float): Tempo corrente della simulazione
         
-        # Operazioni morfologiche per migliorare la qualità della maschera
-        mask[i] = cv2.morphologyEx(mask[i], cv2.MORPH_CLOSE, Kernel)
-        mask[i] = cv2.morphologyEx(mask[i], cv2.MORPH_OPEN, Kernel)
+    Returns:
+        tuple: (tipo di frutto, istante di arrivo) oppure None
+    """
+    belt_speed = speed_field.getSFFloat()
+    if belt_speed <= 0:
+        return None  # Nastro fermo: arrivo non prevedibile
+    detected = find_fruit()
+    if detected == -1:
+        return None
+    x, y, w, h = fruit_box
+    distance = (LOOKAHEAD_ARRIVAL_ROW - (y + h)) / LOOKAHEAD_PIXELS_PER_METER
+    # La posizione è quella del frame, che con la telecamera rallentata può essere vecchio
+    frame_time = camera_frame_time()
+    return detected, (now if frame_time is None else frame_time) + max(0.0, distance) / belt_speed
 
-        # Ricerca dei contorni nella maschera
-        cnts.append(cv2.findContours(mask[i], cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[0])
+def camera_frame_time():
+    """
+    Istante del frame corrente della telecamera. Come in Webots i frame
+    arrivano ogni periodo di campionamento a partire dall'ultima
+    camera.enable(), non sui multipli del periodo dall'avvio.
+    
+    Returns:
+        float: Tempo di simulazione del frame (None se non ancora prodotto)
+    """
+    period = camera.getSamplingPeriod()
+    elapsed = round((robot.getTime() - camera_enabled_at) * 1000)
+    if period <= 0:
+        return None
+    if elapsed < period:
+        return camera_previous_frame  # Nessun frame dopo enable(): resta il precedente
+    return camera_enabled_at + (elapsed - elapsed % period) / 1000.0
 
-        # Analisi dei contorni trovati
-        for c in cnts[i]:
-            x, y, w, h = cv2.boundingRect(c)
-            if w > 80:  # Se il contorno è abbastanza grande
-                model = i  # Identifica il tipo di frutto
-                printDisplay(x + 35, y, w, h, fruit_names[i])
+def set_sensor_mode(mode):
+    """
+    Porta telecamera e sensori ai periodi del modo indicato (SENSOR_PERIODS)
+    
+    Un sensore riabilitato produce il primo valore dopo un periodo: passando
+    a idle action_waiting attende proprio WAITING_DELAY, quindi legge sempre
+    un valore aggiornato. Con la registrazione dei frame distanza e posizione
+    restano a ogni passo, perché vengono salvate con ogni frame. La telecamera
+    viene riabilitata solo se il periodo cambia: enable() sposta la griglia
+    dei frame e ritarderebbe il prossimo.
+    
+    Args:
+        mode (str): "idle", "detect" o "moving"
+        
+    Returns:
+        bool: True se la telecamera torna attiva e il frame corrente non è aggiornato
+    """
+    global sensor_mode, camera_enabled_at, camera_previous_frame
 
-    return model
+    if SENSOR_IDLE_PERIOD <= 0 or mode == sensor_mode:
+        return False
+    camera_period, distance_period, position_period = SENSOR_PERIODS[mode]
+    if recorder is not None:
+        distance_period = position_period = timestep
+    camera_activated = camera_period < SENSOR_PERIODS[sensor_mode][0]
+    sensor_mode = mode
+    if camera_period != camera.getSamplingPeriod():
+        camera_previous_frame = camera_frame_time()
+        camera.enable(camera_period)
+        camera_enabled_at = robot.getTime()
+    distance_sensor.enable(distance_period)
+    position_sensor.enable(position_period)
+    return camera_activated
 
 # ============================================================================
 # 8. FUNZIONI DI SUBSTATI DEL ROBOT
@@ -654,10 +752,32 @@ def action_waiting():
     Returns:
         function: Prossima funzione di stato da eseguire
     """
-    global counter, fruit
-    fruit = find_fruit()    # Rileva il tipo di frutto presente
+    global substate_wait, fruit, skipped_frames, lookahead_fruit, lookahead_eta
     is_fruit_detected = distance_sensor.getValue() < 1000  # Verifica presenza fisica del frutto
 
+    if LOOKAHEAD_MODE and not is_fruit_detected:
+        # Gripper aperto in attesa; con un frutto in arrivo lo classifica in anticipo
+        for motor in hand_motors:
+            motor.setPosition(motor.getMinPosition())
+        arrival = estimate_arrival(robot.getTime())
+        if arrival is not None:
+            lookahead_fruit, lookahead_eta = arrival
+            substate_wait = max(0.0, lookahead_eta - LOOKAHEAD_LEAD - robot.getTime())
+            return action_staging
+
+    if GATED_DETECTION and not is_fruit_detected:
+        # Gripper vuoto: nessuna elaborazione dell'immagine (salvo quella di estimate_arrival)
+        if analyzed_at != robot.getTime():
+            skipped_frames += 1
+        set_sensor_mode("idle")
+        fruit = -1
+        substate_wait = WAITING_DELAY
+        return action_waiting
+    if set_sensor_mode("detect"):
+        return action_waiting  # Attende un frame al periodo normale
+
+    fruit = find_fruit()    # Rileva il tipo di frutto presente
+
     # Se un frutto è rilevato e identificato
     if is_fruit_detected and fruit != -1:
         playSnd(fruit)  # Riproduce il suono corrispondente al frutto
@@ -667,9 +787,48 @@ def action_waiting():
         for motor in hand_motors:
             motor.setPosition(0.52)  # Chiude le dita
             
-    counter = 8  # Imposta un delay per evitare rilevamenti multipli
+    substate_wait = WAITING_DELAY  # Imposta un delay per evitare rilevamenti multipli
     return actions_substate_machine.get(("waiting", is_fruit_detected), action_waiting)
 
+def action_staging():
+    """
+    Funzione di pre-presa: poco prima dell'arrivo previsto del frutto passa
+    alla lettura della distanza a ogni passo, con le dita ancora aperte
+    (chiuderle prima della conferma spingerebbe il frutto se la stima è in
+    anticipo)
+    
+    Returns:
+        function: Funzione di attesa dell'arrivo (o di attesa se il nastro è fermo)
+    """
+    if speed_field.getSFFloat() <= 0:
+        return action_waiting  # Nastro fermato: previsione non più valida
+    
+    set_sensor_mode("detect")  # action_arrival legge la distanza a ogni passo
+    return action_arrival
+
+def action_arrival():
+    """
+    Funzione di arrivo: conferma con il sensore di distanza il frutto previsto,
+    chiude le dita e avvia il prelievo quando sono chiuse
+    
+    Returns:
+        function: Funzione di prelievo, di arrivo (ancora in attesa) o di attesa
+    """
+    global fruit, substate_wait
+    
+    if distance_sensor.getValue() < 1000:
+        fruit = lookahead_fruit
+        playSnd(fruit)  # Riproduce il suono corrispondente al frutto
+        fruit_counters[fruit]()  # Incrementa il contatore del tipo di frutto
+        for motor in hand_motors:
+            motor.setPosition(0.52)  # Chiude le dita sul frutto confermato
+        substate_wait = FINGER_CLOSE_TIME
+        return action_picking
+    
+    if robot.getTime() > lookahead_eta + LOOKAHEAD_TOLERANCE:
+        return action_waiting  # Il frutto non è arrivato: dita ancora aperte
+    return action_arrival
+
 def action_picking():
     """
     Funzione per il prelievo: muove il braccio robotico nella posizione corretta
@@ -678,14 +837,28 @@ def action_picking():
     Returns:
         function: Funzione per la rotazione del braccio
     """
-    global current_state, fruit
+    global current_state, fruit, cycle_start, cycle_predicted, cycle_key, picking_target
     
+    set_sensor_mode("moving")  # Nessuna visione fino al ritorno in attesa
+
     # Ottiene le posizioni target per il frutto corrente
-    selected_positions = get_picking_positions(fruit, current_state)
+    target = picking_target = get_picking_target(fruit, current_state)
+    selected_positions = target_positions[target]
+
+    # Inizio del ciclo: durata prevista di andata, rilascio e ritorno
+    cycle_start = robot.getTime()
+    cycle_key = (fruit_names[fruit], target_names[target])
+    cycle_predicted = (4 + 1) * timestep / 1000.0  # Passi di attesa del rilascio
     
     # Imposta le posizioni dei motori per il prelievo
+    if arm_trajectory is not None:
+        cycle_predicted += arm_trajectory.move(selected_positions, robot.getTime())
+        cycle_predicted += arm_trajectory.predict(selected_positions, target_HOME)
+        return action_rotating
     for i in range(5):
         ur_motors[i].setPosition(selected_positions[i])
+    cycle_predicted += constant_velocity_duration(target_HOME, selected_positions, speed)
+    cycle_predicted += constant_velocity_duration(selected_positions, target_HOME, speed)
 
     return action_rotating
     
@@ -699,8 +872,9 @@ def action_rotating():
     """
     speed_field.setSFFloat(0.0)  # Ferma il nastro durante la rotazione
 
-    # Verifica se la rotazione è completata (varia in base al tipo di frutto)
-    if fruit != 2:
+    # Verifica se la rotazione è completata (varia in base al contenitore:
+    # anche mele e arance senza contenitore nello stato vanno nel cestino blu)
+    if picking_target != 2:
         is_rotated = position_sensor.getValue() < -2.3  # Controlla se il braccio ha raggiunto la posizione di rilascio
     else:
         is_rotated = position_sensor.getValue() < -2.16
@@ -714,46 +888,37 @@ def action_dropping():
     Returns:
         function: Funzione per il ritorno alla posizione iniziale
     """
-    global counter, state_bin_counts, counter_O1, counter_O2, counter_G1, counter_G2, counter_binblue
-    global counter_binblue, state_apple_count, state_orange_count
+    global substate_wait, counter_binblue, state_apple_count, state_orange_count, state_outstanding
     
     # Apre le dita del gripper per rilasciare il frutto
     for motor in hand_motors:
         motor.setPosition(motor.getMinPosition())
     
-    counter = 4  # Delay per il rilascio
+    substate_wait = DROPPING_DELAY  # Delay per il rilascio
     
     # Gestione mele marce
     if fruit == 2:
         counter_binblue += 1
         return action_rotate_back
     
-    # Ottiene la configurazione dello stato corrente
-    current_state_config = FSA[current_state]["requirements"]
-    
-    # Gestione mele
+    # Gestione mele e arance: contatori del frutto e del contenitore dello stato
     if fruit == 1:
         state_apple_count += 1  # Incrementa il contatore di mele dello stato
-        for bin_name in current_state_config:
-            if bin_name.startswith("bin_green"):
-                state_bin_counts[bin_name] += 1
-                if bin_name == "bin_green1":
-                    counter_G1 += 1
-                elif bin_name == "bin_green2":
-                    counter_G2 += 1
-                break
-
-    # Gestione arance
     elif fruit == 0:
         state_orange_count += 1  # Incrementa il contatore di arance dello stato
-        for bin_name in current_state_config:
-            if bin_name.startswith("bin_orange"):
-                state_bin_counts[bin_name] += 1
-                if bin_name == "bin_orange1":
-                    counter_O1 += 1
-                elif bin_name == "bin_orange2":
-                    counter_O2 += 1
-                break
+    else:
+        return action_rotate_back
+    
+    bin_index = select_bin(fruit, current_state)
+    if bin_index != -1:
+        state_bin_counts[bin_index] += 1
+        bin_totals[bin_index] += 1
+        
+        # Un oggetto richiesto in meno: all'ultimo lo stato è completo
+        if state_bin_counts[bin_index] <= FSA[current_state].required[bin_index]:
+            state_outstanding -= 1
+            if state_outstanding == 0 and not state_delay_active:
+                start_state_delay(robot.getTime())
     
     return action_rotate_back
     
@@ -765,14 +930,29 @@ def action_rotate_back():
     Returns:
         function: Funzione di attesa o continuazione basata sulla posizione
     """
-    speed_field.setSFFloat(0.15)    # Riavvia il nastro
+    speed_field.setSFFloat(FSA[current_state].belt_speed)    # Riavvia il nastro
+    set_sensor_mode("detect")  # Frame aggiornato già al ritorno in attesa
     is_back = position_sensor.getValue() > -0.1  # Verifica posizione di ritorno
 
     # Riporta tutti i motori alla posizione iniziale
-    for motor in ur_motors:
-        motor.setPosition(0.0)
+    if arm_trajectory is not None:
+        arm_trajectory.move(target_HOME, robot.getTime())
+    else:
+        for motor in ur_motors:
+            motor.setPosition(0.0)
     return actions_substate_machine.get(("rotate_back", is_back), action_waiting)
 
+def check_cycle_end():
+    """
+    Registra la fine del ciclo di prelievo quando il braccio, dopo il
+    rilascio, è tornato in posizione di attesa
+    """
+    global cycle_start
+    if (cycle_start is not None and current_substate is action_waiting
+            and position_sensor.getValue() > -0.1):
+        cycle_stats.record(cycle_key, cycle_predicted, robot.getTime() - cycle_start)
+        cycle_start = None
+
 # ============================================================================
 # 9. CONFIGURAZIONE MACCHINA A STATI
 # ============================================================================
@@ -798,63 +978,176 @@ actions_substate_machine = {
     ("rotate_back", True): action_waiting
 }
 
+# Sottostati del ciclo del braccio, da completare anche se cambia lo stato principale
+arm_cycle_substates = (action_picking, action_rotating, action_dropping, action_rotate_back)
+
+# Nomi dei sottostati per le metriche
+substate_names = {
+    action_waiting: "waiting",
+    action_staging: "staging",
+    action_arrival: "arrival",
+    action_picking: "picking",
+    action_rotating: "rotating",
+    action_dropping: "dropping",
+    action_rotate_back: "rotate_back",
+}
+
+def record_substate(now):
+    """
+    Segnala alle metriche il sottostato corrente, con frutto e contenitore
+    
+    Il contenitore è quello scelto da action_picking (picking_target): dopo
+    il deposito select_bin indicherebbe già il contenitore successivo.
+    All'ingresso in picking la scelta non è ancora avvenuta e viene calcolata.
+    """
+    if fruit < 0:
+        metrics.transition(now, substate_names.get(current_substate, "end"), NONE_LABEL, NONE_LABEL)
+        return
+    target = get_picking_target(fruit, current_state) if current_substate is action_picking else picking_target
+    metrics.transition(now, substate_names.get(current_substate, "end"), fruit_names[fruit], target_names[target])
+
+def run_substate():
+    """
+    Evento dello scheduler: esegue il sottostato corrente e lo riprogramma
+    dopo l'attesa richiesta (substate_wait, 0 = passo successivo)
+    """
+    global current_substate, main_state_changed, substate_wait, substate_event
+    
+    # Processo completato o sottostato END: nessuna riprogrammazione
+    if is_process_complete or current_substate == "END":
+        return
+    
+    # Gestione del cambio di stato: un ciclo del braccio già avviato termina
+    # comunque con il ritorno sopra il nastro (action_rotate_back)
+    if main_state_changed and current_substate not in arm_cycle_substates:
+        current_substate = action_waiting
+        main_state_changed = False
+    
+    # Aggiornamento del sottostato corrente
+    substate_wait = 0.0
+    try:
+        # Verifica che current_substate sia una funzione prima di chiamarla
+        if callable(current_substate):
+            current_substate = current_substate()
+    except Exception as e:
+        print(f"Error in substate execution: {e}")
+        halt_system()
+        return
+    substate_event = scheduler.schedule(robot.getTime() + substate_wait, timed_substate)
+
+def timed(name, callback):
+    """
+    Evento dello scheduler con il tempo attribuito alla sezione name del
+    profiler (la callback invariata se il profiler non è attivo)
+    """
+    if profiler is None:
+        return callback
+    def run():
+        lap("scheduler")
+        callback()
+        lap(name)
+    return run
+
+timed_substate = timed("substate", run_substate)
+
+def poll_fsa():
+    """Task dell'executor: porta nel buffer di attesa il nuovo FSA preparato dal thread di ricaricamento"""
+    global next_fsa
+    new_fsa = fsa_reloader.poll()
+    if new_fsa is not None:
+        next_fsa = new_fsa
+
+def update_hud():
+    """Task dell'executor: aggiornamento di etichette e pannello informativo"""
+    hud.update(robot.getTime(), hud_view_model)
+
+def report_stats():
+    """Task dell'executor: resoconti periodici e riepiloghi delle metriche"""
+    now = robot.getTime()
+    actuator_stats.report(now)
+    cycle_stats.report(now)
+    if metrics is not None:
+        metrics.update(now)
+
+# Executor multi-rate: (sezione del profiler, periodo in s, task). La visione
+# non è un task: la esegue action_waiting, alla cadenza dei sottostati
+PERIODIC_TASKS = (
+    ("fsa_poll", FSA_POLL_PERIOD, poll_fsa),
+    ("main_state", LOGIC_PERIOD, main_state),
+    ("hud", HUD_REFRESH_PERIOD, update_hud),
+    ("stats", STATS_PERIOD, report_stats),
+)
+
+def next_step_duration():
+    """
+    Durata del prossimo passo di simulazione (ms): con SLEEP_UNTIL_DEADLINE,
+    se nessuna traiettoria o registrazione richiede ogni passo, arriva fino
+    alla prossima scadenza dello scheduler
+    """
+    if (not SLEEP_UNTIL_DEADLINE or recorder is not None
+            or (arm_trajectory is not None and arm_trajectory.trajectory is not None)):
+        return timestep
+    deadline = scheduler.next_deadline()
+    if deadline is None:
+        return timestep
+    steps = int((deadline - robot.getTime()) * 1000.0 / timestep + 1e-6)
+    return max(1, steps) * timestep
+
 # ============================================================================
 # 10. LOOP PRINCIPALE DEL PROGRAMMA
 # ============================================================================
 # Inizializzazione stati
 current_state = 1  # Stato iniziale del sistema
 current_substate = action_waiting  # Sottostato iniziale (attesa)
+reset_state_progress()
+if not state_delay_active:
+    speed_field.setSFFloat(FSA[current_state].belt_speed)
+acknowledge_fsa()  # Versione caricata all'avvio
+substate_event = scheduler.schedule(robot.getTime(), timed_substate)
+for name, period, task in PERIODIC_TASKS:
+    PeriodicTask(scheduler, period, timed(name, task), robot.getTime())
+if metrics is not None:
+    record_substate(robot.getTime())
 
 # Main loop
-while robot.step(timestep) != -1:
-    # Carica il messaggio FSA se il file è stato modificato
-    FSA, last_modified_time = load_fsa_message(file_path, last_modified_time)
-
-    # Gestione dello stato principale
-    main_state()
-    
-    # Se il processo non è completato e il sottostato non è END
-    if not is_process_complete and current_substate != "END":
-        # Gestione del contatore di delay
-        if counter > 0:
-            counter -= 1
-        else:
-            # Gestione del cambio di stato
-            if main_state_changed:
-                current_substate = action_waiting
-                main_state_changed = False
-            
-            # Aggiornamento del sottostato corrente
-            try:
-                # Verifica che current_substate sia una funzione prima di chiamarla
-                if callable(current_substate):
-                    current_substate = current_substate()
-            except Exception as e:
-                print(f"Error in substate execution: {e}")
-                halt_system()
-    
-    # Aggiornamento del pannello informativo
-    draw_info_panel()
-    
-    # Aggiornamento delle etichette del display
-    robot.setLabel(
-        1,
-        f"Apples: {apple:3d}    Oranges: {orange:3d}    Substate: {'END' if current_substate == 'END' else (current_substate.__name__ if hasattr(current_substate, '__name__') else 'Unknown')}",
-        0.07,
-        0.96,
-        0.06,
-        0x00FF00,
-        0,
-        "Lucida Console",
-    )
-    robot.setLabel(
-        2,
-        f"State: {current_state}    G1: {counter_G1}  O1: {counter_O1} " + 
-        f"G2: {counter_G2}  O2: {counter_O2}  Blue: {counter_binblue} Delay: {max(0, state_delay_end_time - robot.getTime()) if state_delay_active and not is_process_complete else 0:.1f}",
-        0.07,
-        0.91,
-        0.05,
-        0x0000FF,
-        0,
-        "Lucida Console",
-    )
+step_duration = timestep
+while robot.step(step_duration) != -1:
+    lap("step")
+    previous_substate = current_substate
+
+    # Nuovo FSA nel buffer di attesa (task "fsa_poll"), applicato solo in un punto sicuro
+    if next_fsa is not None and fsa_swap_safe():
+        apply_fsa(next_fsa)
+        next_fsa = None
+    lap("fsa_swap")
+
+    # Eventi scaduti: task periodici, sottostati e fine dei delay tra gli stati
+    scheduler.run_due(robot.getTime())
+    lap("scheduler")
+    
+    # Passo della traiettoria del braccio in corso
+    if arm_trajectory is not None:
+        arm_trajectory.update(robot.getTime(), timestep / 1000.0)
+    check_cycle_end()
+    lap("trajectory")
+    if metrics is not None:
+        if current_substate is not previous_substate:
+            record_substate(robot.getTime())
+
+    # Registrazione del frame quando la telecamera ne produce uno nuovo
+    if recorder is not None:
+        frame_time = camera_frame_time()
+        if frame_time is not None and frame_time != recorded_frame_at:
+            recorded_frame_at = frame_time
+            recorder.append(robot.getTime(), camera.getImage(), distance_sensor.getValue(),
+                            position_sensor.getValue(), fruit)
+    lap("recording")
+
+    if profiler is not None:
+        profiler.end_step(robot.getTime(), step_duration)
+    step_duration = next_step_duration()
+
+if recorder is not None:
+    recorder.flush()
+if metrics is not None:
+    metrics.close()
@@ -0,0 +1,159 @@
+# ============================================================================
+# TRACKING DEI FRUTTI TRA I FRAME
+# ============================================================================
+"""
+Tracker leggero dei frutti inquadrati dalla telecamera.
+
+Ad ogni frame FruitDetector.locate() trova i riquadri di tutti i frutti;
+ogni riquadro viene associato alla traccia esistente con sovrapposizione
+(IoU) maggiore o, in mancanza, con il centro più vicino. Solo i riquadri
+senza traccia vengono classificati (FruitDetector.classify(), nella modalità
+di segmentazione del rilevatore): il tipo del frutto resta alla traccia per
+tutti i frame successivi, con un identificatore stabile. Finché il centro
+del frutto non ha superato il bordo superiore della regione di interesse il
+frutto sta ancora entrando ed è visto solo in parte (una mela marcia può mostrare ancora solo
+la parte verde), quindi la traccia viene riclassificata ad ogni frame e
+nearest() non la considera ancora. Le
+tracce non più viste per max_age secondi vengono eliminate.
+
+Il frutto più vicino al gripper è quello con il bordo inferiore più in basso
+nell'immagine (il nastro porta i frutti verso il basso del frame).
+"""
+
+from fruit_detector import ROI_ROWS
+from scheduler import PeriodicReport  # Resoconto ogni REPORT_PERIOD secondi di simulazione
+
+MIN_IOU = 0.3         # Sovrapposizione minima per associare un riquadro a una traccia
+MAX_DISTANCE = 60.0   # Distanza massima (px) tra i centri in mancanza di sovrapposizione
+
+
+def iou(a, b):
+    """Intersezione su unione di due riquadri (x, y, w, h)"""
+    w = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    h = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / (a[2] * a[3] + b[2] * b[3] - inter)
+
+
+def center_distance(a, b):
+    """Distanza tra i centri di due riquadri (x, y, w, h)"""
+    dx = (a[0] + a[2] / 2) - (b[0] + b[2] / 2)
+    dy = (a[1] + a[3] / 2) - (b[1] + b[3] / 2)
+    return (dx * dx + dy * dy) ** 0.5
+
+
+def entering(box):
+    """
+    True se il frutto nel riquadro (x, y, w, h) sta ancora entrando dal bordo
+    superiore della regione di interesse: il riquadro tocca il bordo ed è alto
+    meno di metà della sua larghezza, cioè il centro del frutto tondo non è
+    ancora inquadrato
+    """
+    return box[1] <= ROI_ROWS[0] and 2 * box[3] < box[2]
+
+
+class Track:
+    """Frutto seguito tra i frame: identificatore, tipo e ultimo riquadro"""
+
+    __slots__ = ("id", "fruit", "box", "first_seen", "last_seen")
+
+    def __init__(self, track_id, fruit, box, now):
+        self.id = track_id
+        self.fruit = fruit
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+
+
+class FruitTracker:
+    """
+    Associazione dei riquadri tra i frame con classificazione una tantum
+
+    Args:
+        detector (FruitDetector): Rilevatore usato per locate() e classify()
+        max_age (float): Tempo massimo (s) senza riscontri prima di eliminare una traccia
+    """
+
+    def __init__(self, detector, max_age=1.0):
+        self.detector = detector
+        self.max_age = max_age
+        self.tracks = []
+        self.next_id = 1
+        self.frames = 0
+        self.classifications = 0
+        self._report = PeriodicReport(self._print_report)
+
+    def update(self, image, now):
+        """
+        Aggiorna le tracce con un nuovo frame
+
+        Args:
+            image (bytes): Buffer restituito da camera.getImage() (None = nessun frame)
+            now (float): Tempo di simulazione
+
+        Returns:
+            list: Tracce viste in questo frame
+        """
+        if image is None:
+            return []
+        self.frames += 1
+        boxes = self.detector.locate(image)
+        self.tracks = [track for track in self.tracks if now - track.last_seen <= self.max_age]
+
+        # Associazione greedy: coppie (traccia, riquadro) in ordine di IoU decrescente
+        pairs = []
+        for t, track in enumerate(self.tracks):
+            for b, box in enumerate(boxes):
+                overlap = iou(track.box, box)
+                if overlap >= MIN_IOU:
+                    pairs.append((overlap, 0.0, t, b))
+                else:
+                    distance = center_distance(track.box, box)
+                    if distance <= MAX_DISTANCE:
+                        pairs.append((0.0, -distance, t, b))
+        pairs.sort(reverse=True)
+
+        used_tracks = set()
+        used_boxes = set()
+        seen = []
+        for _, _, t, b in pairs:
+            if t in used_tracks or b in used_boxes:
+                continue
+            used_tracks.add(t)
+            used_boxes.add(b)
+            track = self.tracks[t]
+            track.box = boxes[b]
+            track.last_seen = now
+            if track.fruit == -1 or entering(track.box):
+                track.fruit = self._classify(track.box)  # Non ancora riconosciuto o visto in parte
+            seen.append(track)
+
+        # Nuove tracce: unica classificazione del frutto
+        for b, box in enumerate(boxes):
+            if b not in used_boxes:
+                track = Track(self.next_id, self._classify(box), box, now)
+                self.next_id += 1
+                self.tracks.append(track)
+                seen.append(track)
+
+        self._report.update(now)
+        return seen
+
+    def nearest(self, tracks):
+        """Traccia riconosciuta e del tutto entrata più vicina al gripper (None se assente)"""
+        best = None
+        for track in tracks:
+            if track.fruit != -1 and not entering(track.box) and (best is None or track.box[1] + track.box[3] > best.box[1] + best.box[3]):
+                best = track
+        return best
+
+    def _classify(self, box):
+        self.classifications += 1
+        return self.detector.classify(box)
+
+    def _print_report(self, elapsed):
+        print(f"Tracker: {self.frames} frame, {self.classifications} classificazioni, "
+              f"{len(self.tracks)} tracce attive")
+        self.frames = self.classifications = 0
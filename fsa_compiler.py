@@ -0,0 +1,80 @@
+# ============================================================================
+# COMPILAZIONE DEI PROGRAMMI FSA PER IL CONTROLLER
+# ============================================================================
+"""
+Configurazione compilata degli stati FSA usata dal loop del controller.
+
+compile_program() accetta un programma in uno qualsiasi dei formati di
+fsa_schema.load (stringa storica, JSON, binario) e restituisce la lista
+degli StateConfig indicizzata per numero di stato. Gli StateConfig vengono
+costruiti direttamente dai decodificatori di fsa_schema, senza passare per
+gli StateSpec intermedi: con programmi di centinaia di migliaia di stati il
+tempo di caricamento è dominato dalle allocazioni.
+"""
+
+import fsa_schema
+
+BIN_CODES = fsa_schema.BINS  # Nomi dei contenitori nei programmi FSA (indice = BIN_* del controller)
+BIN_FRUIT = (1, 1, 0, 0)     # Tipo di frutto di ogni contenitore (0=arancia, 1=mela)
+_BIN_INDEX = {code: index for index, code in enumerate(BIN_CODES)}
+
+
+class StateConfig:
+    """
+    Configurazione compilata di uno stato dell'FSA, indicizzata per intero
+
+    Attributi:
+        trigger (int): Stato successivo (-1 per lo stato HALT)
+        required (list): Oggetti richiesti per contenitore (indice BIN_*)
+        fruit_bins (tuple): Contenitori per tipo di frutto (0=arancia, 1=mela),
+            in ordine di riempimento; vuota se il frutto non ha un contenitore
+        required_apples, required_oranges (int): Totali richiesti nello stato
+        delay (float): Ritardo dopo il completamento dello stato, in secondi
+        belt_speed (float): Velocità del nastro durante lo stato
+    """
+    __slots__ = ("trigger", "required", "fruit_bins",
+                 "required_apples", "required_oranges", "delay", "belt_speed")
+
+    def __init__(self, trigger, bins=(), delay=0, belt_speed=None):
+        self.trigger = trigger
+        required = self.required = [0, 0, 0, 0]
+        oranges, apples = self.fruit_bins = ([], [])
+        totals = [0, 0]  # Per tipo di frutto
+        for code, count in bins:
+            bin_index = _BIN_INDEX[code]
+            fruit = BIN_FRUIT[bin_index]
+            fruit_bins = apples if fruit else oranges
+            if bin_index not in fruit_bins:  # Anche con quantità 0: riceve le eccedenze del frutto
+                fruit_bins.append(bin_index)
+            required[bin_index] += count
+            totals[fruit] += count
+        self.required_oranges, self.required_apples = totals
+        self.delay = delay
+        self.belt_speed = belt_speed
+
+
+def compile_program(program, default_speed):
+    """
+    Compila un programma FSA nella lista degli StateConfig
+
+    Args:
+        program: Programma in uno dei formati di fsa_schema.load
+        default_speed (float): Velocità del nastro degli stati che non ne indicano una
+
+    Returns:
+        list: StateConfig indicizzati per numero di stato (indice 0 non usato,
+              ultimo elemento = HALT)
+
+    Raises:
+        ValueError: Programma non valido (vedi fsa_schema.load)
+    """
+    def state(bins, delay, belt_speed):
+        return StateConfig(0, bins, delay, default_speed if belt_speed is None else belt_speed)
+
+    fsa = fsa_schema.load(program, state)
+    # Lo stato i passa a i + 1; dopo l'ultimo (N) viene HALT, in posizione N + 1
+    for i, config in enumerate(fsa, start=1):
+        config.trigger = i + 1
+    fsa.insert(0, None)
+    fsa.append(StateConfig(-1, belt_speed=default_speed))
+    return fsa
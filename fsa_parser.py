@@ -0,0 +1,180 @@
+# ============================================================================
+# PARSER CONDIVISO DEI PROGRAMMI FSA
+# ============================================================================
+"""
+Parser dei programmi FSA usato sia da writer_node sia dal controller.
+
+Sintassi (spazi ammessi tra i simboli):
+
+    N, (mele,Gk,arance,Ok,ritardo), (mele,Gk,arance,Ok,ritardo), ...
+
+con N numero di stati, quantità e ritardo interi non negativi e contenitori
+G1, G2, O1, O2 (del contenitore conta il numero, 1 o 2, come nel
+controller originale).
+
+Percorso veloce: il messaggio viene validato per intero da una sola
+espressione regolare compilata (una per la forma canonica prodotta da
+format_program, con spazi solo dopo le virgole, e una che ammette spazi
+ovunque tra i simboli) e poi diviso in token con split(); ogni passaggio è
+lineare e avviene in C. Solo se la validazione fallisce un tokenizer
+carattere per carattere ripercorre il messaggio e solleva FSASyntaxError con
+la posizione esatta del primo simbolo inatteso.
+"""
+
+import gc
+import re
+
+BINS = ("G1", "G2", "O1", "O2")  # Contenitori accettati
+DEBUG_EXCERPT = 20               # Caratteri mostrati attorno all'errore
+
+_WHITESPACE = str.maketrans('', '', ' \t\r\n')
+_CANONICAL = re.compile(r'\d+(?:, ?\(\d+,[GO][12],\d+,[GO][12],\d+\))*', re.ASCII)
+_PROGRAM = re.compile(r'\s*\d+\s*(?:,\s*\(\s*\d+\s*,\s*[GO][12]\s*,\s*\d+\s*,'
+                      r'\s*[GO][12]\s*,\s*\d+\s*\)\s*)*', re.ASCII)
+_STATE = re.compile(r'\s*,\s*\(\s*\d+\s*,\s*[GO][12]\s*,\s*\d+\s*,\s*[GO][12]\s*,\s*\d+\s*\)', re.ASCII)
+
+
+class FSASyntaxError(ValueError):
+    """
+    Errore nel messaggio FSA
+
+    Attributes:
+        reason (str): Descrizione dell'errore
+        position (int): Indice del carattere nel messaggio originale
+    """
+
+    def __init__(self, reason, text, position):
+        self.reason = reason
+        self.position = position
+        start = max(0, position - DEBUG_EXCERPT)
+        excerpt = text[start:position + DEBUG_EXCERPT]
+        super().__init__(f"{reason} (carattere {position}): '{excerpt}'\n"
+                         f"{' ' * (position - start + 1)}^")
+
+
+def parse(text):
+    """
+    Analizza un programma FSA
+
+    Args:
+        text (str): Messaggio FSA
+
+    Returns:
+        list: Una tupla (mele, contenitore_mele, arance, contenitore_arance,
+              ritardo) per stato, con i contenitori come in BINS
+
+    Raises:
+        FSASyntaxError: Messaggio non valido, con la posizione dell'errore
+    """
+    if _CANONICAL.fullmatch(text) is not None:
+        compact = text.replace(' ', '')
+    elif _PROGRAM.fullmatch(text) is not None:
+        compact = text.translate(_WHITESPACE)  # Gli spazi sono solo tra i simboli
+    else:
+        _locate_error(text)
+
+    tokens = compact.replace('(', '').replace(')', '').split(',')
+    num_states = int(tokens[0])
+    if (len(tokens) - 1) // 5 != num_states:
+        _count_error(text, num_states, (len(tokens) - 1) // 5)
+
+    # Molte tuple allocate in blocco: il garbage collector non troverebbe cicli
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return list(zip(map(int, tokens[1::5]), tokens[2::5],
+                        map(int, tokens[3::5]), tokens[4::5],
+                        map(int, tokens[5::5])))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def format_program(states):
+    """
+    Scrive un programma nella forma canonica accettata dal controller
+
+    Args:
+        states (list): Tuple restituite da parse()
+
+    Returns:
+        str: Messaggio FSA (es. "2, (1,G1,1,O1,5), (1,G2,2,O2,3)")
+    """
+    return ", ".join([str(len(states))] + [f"({a},{ab},{o},{ob},{d})" for a, ab, o, ob, d in states])
+
+
+# --- Percorso lento: tokenizer per la diagnosi degli errori ---
+def _skip(text, i):
+    while i < len(text) and text[i] in ' \t\r\n':
+        i += 1
+    return i
+
+
+def _found(text, i):
+    return f"'{text[i]}'" if i < len(text) else "fine del messaggio"
+
+
+def _expect(text, i, char):
+    i = _skip(text, i)
+    if i >= len(text) or text[i] != char:
+        raise FSASyntaxError(f"Atteso '{char}', trovato {_found(text, i)}", text, i)
+    return i + 1
+
+
+def _expect_int(text, i, what):
+    i = _skip(text, i)
+    start = i
+    while i < len(text) and text[i].isdigit() and text[i].isascii():
+        i += 1
+    if i == start:
+        raise FSASyntaxError(f"Atteso {what} (intero), trovato {_found(text, start)}", text, start)
+    return i
+
+
+def _expect_bin(text, i, what):
+    i = _skip(text, i)
+    start = i
+    while i < len(text) and text[i].isalnum():
+        i += 1
+    token = text[start:i]
+    if not token:
+        raise FSASyntaxError(f"Atteso {what}, trovato {_found(text, start)}", text, start)
+    if token[0] not in "GO" or token[1:] not in ("1", "2"):
+        raise FSASyntaxError(f"Contenitore inesistente '{token}'", text, start)
+    return i
+
+
+def _locate_error(text):
+    """Ripercorre il messaggio un simbolo alla volta e segnala il primo errore"""
+    i = _expect_int(text, 0, "numero di stati")
+    match = _STATE.match
+    while _skip(text, i) < len(text):
+        state = match(text, i)
+        if state is not None:
+            i = state.end()  # Stato valido: nessuna analisi carattere per carattere
+            continue
+        i = _expect(text, i, ',')
+        i = _expect(text, i, '(')
+        i = _expect_int(text, i, "numero di mele")
+        i = _expect(text, i, ',')
+        i = _expect_bin(text, i, "contenitore delle mele")
+        i = _expect(text, i, ',')
+        i = _expect_int(text, i, "numero di arance")
+        i = _expect(text, i, ',')
+        i = _expect_bin(text, i, "contenitore delle arance")
+        i = _expect(text, i, ',')
+        i = _expect_int(text, i, "ritardo")
+        i = _expect(text, i, ')')
+    raise FSASyntaxError("Messaggio non valido", text, 0)  # Non raggiungibile
+
+
+def _count_error(text, declared, found):
+    """Segnala la discordanza tra stati dichiarati e configurazioni presenti"""
+    position = len(text)
+    if found > declared:
+        # Inizio della prima configurazione in eccesso
+        position = -1
+        for _ in range(declared + 1):
+            position = text.index('(', position + 1)
+    raise FSASyntaxError(f"Il numero di stati ({declared}) non corrisponde "
+                         f"al numero di configurazioni ({found})", text, position)
@@ -0,0 +1,224 @@
+# ============================================================================
+# PROTOCOLLO DI PUBBLICAZIONE DEL FILE FSA
+# ============================================================================
+"""
+Formato e scrittura atomica di fsa_message.json, condivisi da writer_node e
+dal controller.
+
+Il file contiene una busta JSON:
+
+    {"version": 7, "checksum": "sha256:...", "fsa": "3, (1,G1,1,O1,5), ..."}
+
+- version: intero crescente, assegnato da publish() rileggendo il file
+- checksum: SHA-256 del programma FSA (campo "fsa"), verificato in lettura
+- fsa: stringa del formato storico oppure programma JSON strutturato
+  (oggetto, vedi fsa_schema.py); per l'oggetto il checksum è calcolato sulla
+  sua serializzazione compatta
+
+Per lo scambio tra programmi il file può contenere invece la codifica
+binaria di fsa_schema, preceduta da un'intestazione con la stessa funzione
+della busta:
+
+    b"FSAB" <BxH versione dello schema, riservato  <II versione, CRC-32 dei dati
+
+publish() scrive la busta in un file temporaneo nella stessa directory e lo
+sostituisce con os.replace(): chi legge vede sempre la versione precedente
+completa oppure quella nuova completa, mai un file scritto a metà.
+
+decode() accetta anche il formato storico (solo la stringa FSA, senza busta),
+al quale non è associata alcuna versione.
+
+Il controller conferma ogni versione applicata scrivendo, sempre in modo
+atomico, fsa_applied.json nella stessa directory (acknowledge()); writer_node
+in modalità batch attende la conferma proprio della versione pubblicata
+prima di pubblicare il programma successivo (read_ack()). Quando le versioni
+ripartono da 1 (file mancante o in formato storico) publish() cancella la
+conferma rimasta dalla serie precedente, che potrebbe avere lo stesso numero.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+import fsa_schema
+
+ACK_FILE = "fsa_applied.json"  # Conferma delle versioni applicate dal controller
+BINARY_MAGIC = b"FSAB"
+_BINARY_HEADER = struct.Struct('<4sBxHII')  # magic, schema, riservato, versione, CRC-32
+
+
+def checksum(program):
+    """Checksum del programma FSA (stringa o oggetto JSON) nel formato della busta"""
+    if not isinstance(program, str):
+        program = json.dumps(program, separators=(',', ':'))
+    return "sha256:" + hashlib.sha256(program.encode('utf-8')).hexdigest()
+
+
+def encode(program, version):
+    """
+    Costruisce il contenuto del file per un programma FSA
+
+    Args:
+        program: Messaggio FSA storico (str), programma JSON (dict) o
+            codifica binaria di fsa_schema (bytes)
+        version (int): Versione da pubblicare
+
+    Returns:
+        str: Busta JSON, o bytes con intestazione binaria per i programmi binari
+    """
+    if isinstance(program, (bytes, bytearray)):
+        return _BINARY_HEADER.pack(BINARY_MAGIC, fsa_schema.SCHEMA_VERSION, 0, version,
+                                   zlib.crc32(program)) + program
+    return json.dumps({"version": version, "checksum": checksum(program), "fsa": program})
+
+
+def _decode_binary(content):
+    """Verifica l'intestazione binaria e restituisce (versione, dati)"""
+    if len(content) < _BINARY_HEADER.size:
+        raise ValueError("Intestazione binaria FSA troncata")
+    _, schema, _, version, crc = _BINARY_HEADER.unpack_from(content)
+    if schema != fsa_schema.SCHEMA_VERSION:
+        raise ValueError(f"Schema binario {schema} non supportato")
+    payload = bytes(content[_BINARY_HEADER.size:])
+    if zlib.crc32(payload) != crc:
+        raise ValueError(f"CRC non corrispondente per la versione {version}")
+    return version, payload
+
+
+def decode(content):
+    """
+    Estrae versione e programma dal contenuto del file FSA
+
+    Args:
+        content (bytes | str): Contenuto del file
+
+    Returns:
+        tuple: (versione, programma); versione None senza busta. Il programma
+            è una stringa storica, un oggetto JSON o bytes binari (fsa_schema.load)
+
+    Raises:
+        ValueError: Busta malformata o checksum non corrispondente
+    """
+    if isinstance(content, (bytes, bytearray)):
+        if content[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+            return _decode_binary(content)
+        content = content.decode('utf-8', errors='replace')
+    content = content.strip()
+    if not content.startswith('{'):
+        return None, content  # Formato storico: solo la stringa FSA
+
+    envelope = json.loads(content)  # json.JSONDecodeError è una sottoclasse di ValueError
+    if isinstance(envelope, dict) and "checksum" not in envelope:
+        return None, envelope  # Programma JSON scritto a mano, senza busta
+    try:
+        version = int(envelope["version"])
+        program = envelope["fsa"]
+        expected = envelope["checksum"]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Busta FSA incompleta: {e}") from None
+    if checksum(program) != expected:
+        raise ValueError(f"Checksum non corrispondente per la versione {version}")
+    return version, program
+
+
+def read_version(path):
+    """
+    Versione pubblicata nel file (0 se manca, è illeggibile o è in formato
+    storico). Il checksum non viene verificato: anche dopo una busta corrotta
+    la versione successiva resta maggiore di quella vista dal controller.
+    """
+    try:
+        with open(path, 'rb') as file:
+            content = file.read()
+        if content[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+            return _BINARY_HEADER.unpack_from(content)[3]
+        return int(json.loads(content)["version"])
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        return 0
+
+
+def write_atomic(path, text):
+    """
+    Sostituisce il contenuto di un file passando da un file temporaneo
+
+    Args:
+        path (str): File da scrivere
+        text (str | bytes): Nuovo contenuto
+    """
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())  # Contenuto su disco prima della sostituzione
+        os.chmod(tmp_path, 0o644)  # mkstemp crea il file leggibile solo dal proprietario
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def publish(path, program):
+    """
+    Pubblica atomicamente una nuova versione del programma FSA
+
+    Args:
+        path (str): Percorso di fsa_message.json
+        program: Programma già validato (str storica, dict JSON o bytes binari)
+
+    Returns:
+        int: Versione pubblicata
+    """
+    version = read_version(path) + 1
+    if version == 1:
+        # Nuova serie di versioni: la conferma precedente non si riferisce a questa
+        try:
+            os.unlink(ack_path(path))
+        except FileNotFoundError:
+            pass
+    write_atomic(path, encode(program, version))
+    return version
+
+
+def ack_path(path):
+    """Percorso del file di conferma associato al file FSA"""
+    return os.path.join(os.path.dirname(os.path.abspath(path)), ACK_FILE)
+
+
+def acknowledge(path, version, sim_time):
+    """
+    Conferma l'applicazione di una versione (lato controller)
+
+    Args:
+        path (str): Percorso di fsa_message.json
+        version (int): Versione applicata
+        sim_time (float): Tempo di simulazione dell'applicazione
+    """
+    write_atomic(ack_path(path), json.dumps({"version": version, "sim_time": sim_time, "wall_time": time.time()}))
+
+
+def read_ack(path):
+    """
+    Ultima conferma scritta dal controller
+
+    Args:
+        path (str): Percorso di fsa_message.json
+
+    Returns:
+        dict: Campi version, sim_time e wall_time, o None se non c'è conferma
+    """
+    try:
+        with open(ack_path(path), encoding='utf-8') as file:
+            return json.loads(file.read())
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,201 @@
+# ============================================================================
+# RICARICAMENTO DELLA CONFIGURAZIONE FSA
+# ============================================================================
+"""
+Sottosistema di ricaricamento del file FSA (fsa_message.json).
+
+Un thread in background osserva il file tramite inotify (solo Linux) oppure,
+se inotify non è disponibile, tramite polling periodico di os.stat.
+Quando il contenuto cambia davvero (hash diverso) il messaggio viene letto,
+analizzato e validato nel thread stesso; al loop di controllo viene passato
+solo l'FSA già pronto.
+
+Il file è una busta versionata con checksum (vedi fsa_protocol.py): buste
+con checksum errato o con versione non successiva a quella già consegnata
+vengono scartate. Il formato storico senza busta resta accettato.
+
+Il loop di controllo chiama poll() ad ogni passo: se non ci sono novità la
+chiamata non esegue alcun accesso al filesystem né parsing.
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import struct
+import threading
+
+import fsa_protocol
+
+# --- Costanti inotify (vedi <sys/inotify.h>) ---
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE  # Solo file completi, niente scritture parziali
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _open_inotify(directory):
+    """
+    Apre un descrittore inotify che osserva la directory indicata
+
+    Args:
+        directory (str): Directory contenente il file FSA
+
+    Returns:
+        int: Descrittore inotify, o None se inotify non è disponibile
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK)
+        if fd < 0:
+            return None
+        # Si osserva la directory e non il file: gli editor (e la scrittura
+        # atomica) sostituiscono il file, invalidando un watch sul file stesso
+        if libc.inotify_add_watch(fd, os.fsencode(directory), INOTIFY_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+class FSAReloader:
+    """
+    Osserva il file FSA e prepara in background le nuove configurazioni
+
+    Args:
+        percorso_file (str): Percorso del file FSA
+        parse (callable): Funzione che converte il messaggio in FSA (None se non valido)
+        poll_interval (float): Periodo del polling di riserva, in secondi
+    """
+
+    def __init__(self, percorso_file, parse, poll_interval=0.25):
+        self.percorso_file = os.path.abspath(percorso_file)
+        self.parse = parse
+        self.poll_interval = poll_interval
+        self.backend = None          # "inotify" oppure "polling"
+        self.reload_count = 0        # Configurazioni nuove consegnate
+        self.version = None          # Versione dell'ultimo FSA consegnato (None = formato storico)
+        self._nome_file = os.fsencode(os.path.basename(self.percorso_file))
+        self._last_hash = None
+        self._last_stat = None
+        self._pending = None         # (versione, FSA) pronto per poll()
+        self._latest_version = None  # Versione più recente accettata dal thread
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """
+        Legge e analizza il file in modo sincrono (usato all'avvio)
+
+        Returns:
+            dict: FSA analizzato, o None se il file manca o non è valido
+        """
+        self._check_file()
+        return self.poll()
+
+    def start(self):
+        """Avvia il thread di osservazione (inotify o polling)"""
+        fd = _open_inotify(os.path.dirname(self.percorso_file))
+        self.backend = "inotify" if fd is not None else "polling"
+        target = self._watch_inotify if fd is not None else self._watch_polling
+        args = (fd,) if fd is not None else ()
+        self._thread = threading.Thread(target=target, args=args, name="fsa-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ferma il thread di osservazione"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def poll(self):
+        """
+        Restituisce il nuovo FSA se ne è stato preparato uno
+
+        Returns:
+            dict: Nuovo FSA validato, o None se non ci sono novità
+        """
+        if self._pending is None:
+            return None
+        with self._lock:
+            (self.version, fsa), self._pending = self._pending, None
+        return fsa
+
+    # --- Thread di osservazione ---
+    def _watch_inotify(self, fd):
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd], [], [], self.poll_interval)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(fd, 4096)
+                except BlockingIOError:
+                    continue
+                if self._event_for_file(data):
+                    self._check_file()
+        finally:
+            os.close(fd)
+
+    def _event_for_file(self, data):
+        """Verifica se tra gli eventi letti ce n'è uno relativo al file FSA"""
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name == self._nome_file:
+                return True
+        return False
+
+    def _watch_polling(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                st = os.stat(self.percorso_file)
+            except OSError:
+                continue
+            stat_key = (st.st_mtime_ns, st.st_size)
+            if stat_key != self._last_stat:
+                self._last_stat = stat_key
+                self._check_file()
+
+    def _check_file(self):
+        """Rilegge il file e, se il contenuto è cambiato, prepara il nuovo FSA"""
+        try:
+            with open(self.percorso_file, 'rb') as file:
+                content = file.read()
+        except OSError as e:
+            print(f"Errore durante la lettura del file: {e}")
+            return
+
+        digest = hashlib.sha1(content).digest()
+        if digest == self._last_hash:
+            return  # Stesso contenuto (es. solo touch): nessun parsing
+
+        try:
+            version, message = fsa_protocol.decode(content)
+        except ValueError as e:
+            print(f"Errore: File FSA non valido, configurazione ignorata: {e}")
+            return
+        if version is not None and self._latest_version is not None and version <= self._latest_version:
+            print(f"Avviso: Versione FSA {version} non successiva a {self._latest_version}, ignorata")
+            self._last_hash = digest
+            return
+
+        fsa = self.parse(message)
+        if fsa is None:
+            # Configurazione non valida: si mantiene quella corrente
+            print("Errore: Parsing del messaggio FSA fallito, configurazione ignorata")
+            return
+
+        self._last_hash = digest
+        self._latest_version = version  # Dopo un file storico si riparte da qualsiasi versione
+        with self._lock:
+            self._pending = (version, fsa)
+        self.reload_count += 1
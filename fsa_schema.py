@@ -0,0 +1,248 @@
+# ============================================================================
+# SCHEMA STRUTTURATO DEI PROGRAMMI FSA
+# ============================================================================
+"""
+Programmi FSA strutturati (schema 2), in JSON e in codifica binaria compatta.
+
+JSON, per la scrittura a mano:
+
+    {"schema": 2,
+     "states": [
+         {"bins": {"G1": 3, "G2": 2, "O1": 1}, "delay": 2.5, "belt_speed": 0.1},
+         {"bins": {"O2": 4}}
+     ]}
+
+- bins: oggetti richiesti per contenitore, in un numero qualsiasi di
+  contenitori; i frutti di un tipo riempiono i suoi contenitori nell'ordine
+  indicato. Un frutto senza contenitori nello stato va nel cestino blu.
+- delay: ritardo dopo il completamento dello stato, in secondi (anche
+  frazionari, default 0, al più MAX_DELAY)
+- belt_speed: velocità del nastro durante lo stato, positiva e al più
+  MAX_BELT_SPEED (default quella del controller)
+- le quantità vanno da 0 a MAX_COUNT
+
+Binario, per lo scambio tra programmi (little endian), a record di
+lunghezza fissa decodificati con struct.iter_unpack:
+
+    <II  numero di stati, numero totale di contenitori
+    <IfB per ogni stato: ritardo in millisecondi, velocità del nastro
+         (NaN = default), numero dei suoi contenitori
+    <BH  per ogni contenitore, stato dopo stato: indice in BINS e quantità
+
+Con due contenitori per stato sono 15 byte per stato, meno del formato
+storico. I limiti dei campi sono quelli dei tipi binari: un programma JSON
+valido è sempre codificabile.
+
+Il formato storico "N, (mele,Gk,arance,Ok,ritardo), ..." resta accettato
+(fsa_parser) e viene convertito nella stessa rappresentazione.
+"""
+
+import gc
+import json
+import math
+import struct
+
+import fsa_parser
+
+SCHEMA_VERSION = 2
+BINS = fsa_parser.BINS  # Contenitori: indice nella codifica binaria
+
+MAX_DELAY = 0xFFFFFFFF / 1000.0  # Ritardo massimo (s): millisecondi in 32 bit
+MAX_BELT_SPEED = 10.0           # Velocità massima del nastro (m/s)
+MAX_COUNT = 0xFFFF              # Quantità massima per contenitore: 16 bit
+
+_HEADER = struct.Struct('<II')
+_STATE = struct.Struct('<IfB')
+_BIN = struct.Struct('<BH')
+_STATE_KEYS = frozenset(("bins", "delay", "belt_speed"))
+
+
+class FSASchemaError(ValueError):
+    """Programma strutturato non valido; path indica il campo (es. states[2].bins.G3)"""
+
+    def __init__(self, path, reason):
+        self.path = path
+        self.reason = reason
+        super().__init__(f"{path}: {reason}")
+
+
+class StateSpec:
+    """
+    Stato di un programma FSA, indipendente dal formato di origine
+
+    Attributi:
+        bins (tuple): Coppie (contenitore, quantità) in ordine di riempimento
+        delay (float): Ritardo dopo il completamento dello stato, in secondi
+        belt_speed (float): Velocità del nastro nello stato (None = default)
+    """
+    __slots__ = ("bins", "delay", "belt_speed")
+
+    def __init__(self, bins, delay=0.0, belt_speed=None):
+        self.bins = bins
+        self.delay = delay
+        self.belt_speed = belt_speed
+
+
+def from_legacy(states, state=StateSpec):
+    """
+    Converte gli stati del formato storico (tuple di fsa_parser.parse)
+
+    Del contenitore conta solo il numero: il primo è sempre delle mele (G),
+    il secondo delle arance (O), come nel controller originale.
+    """
+    return [state((("G" + apple_bin[1], apples), ("O" + orange_bin[1], oranges)), float(delay), None)
+            for apples, apple_bin, oranges, orange_bin, delay in states]
+
+
+def _number(value, path, maximum, integer=False):
+    if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+        raise FSASchemaError(path, f"atteso un numero{' intero' if integer else ''}, trovato {value!r}")
+    if value < 0 or (not integer and not math.isfinite(value)):
+        raise FSASchemaError(path, f"valore non valido {value!r}")
+    if value > maximum:
+        raise FSASchemaError(path, f"valore {value!r} oltre il massimo {maximum}")
+    return value
+
+
+def from_json(program, state=StateSpec):
+    """
+    Valida un programma JSON già decodificato (dict)
+
+    Raises:
+        FSASchemaError: Campo mancante, sconosciuto o fuori dominio
+    """
+    if not isinstance(program, dict):
+        raise FSASchemaError("programma", "atteso un oggetto JSON")
+    if program.get("schema") != SCHEMA_VERSION:
+        raise FSASchemaError("schema", f"versione {program.get('schema')!r} non supportata (attesa {SCHEMA_VERSION})")
+    states = program.get("states")
+    if not isinstance(states, list):
+        raise FSASchemaError("states", "attesa una lista di stati")
+
+    specs = []
+    for i, entry in enumerate(states):
+        path = f"states[{i}]"
+        if not isinstance(entry, dict):
+            raise FSASchemaError(path, "atteso un oggetto")
+        unknown = entry.keys() - _STATE_KEYS
+        if unknown:
+            raise FSASchemaError(f"{path}.{min(unknown)}", "campo sconosciuto")
+        bins = entry.get("bins", {})
+        if not isinstance(bins, dict):
+            raise FSASchemaError(f"{path}.bins", "atteso un oggetto contenitore: quantità")
+        for name, count in bins.items():
+            if name not in BINS:
+                raise FSASchemaError(f"{path}.bins.{name}", "contenitore inesistente")
+            _number(count, f"{path}.bins.{name}", MAX_COUNT, integer=True)
+        delay = _number(entry.get("delay", 0), f"{path}.delay", MAX_DELAY)
+        belt_speed = entry.get("belt_speed")
+        if belt_speed is not None:
+            belt_speed = float(_number(belt_speed, f"{path}.belt_speed", MAX_BELT_SPEED))
+            if belt_speed == 0:
+                raise FSASchemaError(f"{path}.belt_speed", "la velocità del nastro deve essere positiva")
+        specs.append(state(tuple(bins.items()), float(delay), belt_speed))
+    return specs
+
+
+def to_json(specs):
+    """Programma JSON (dict) equivalente agli stati indicati"""
+    states = []
+    for spec in specs:
+        state = {"bins": dict(spec.bins)}
+        if spec.delay:
+            state["delay"] = spec.delay
+        if spec.belt_speed is not None:
+            state["belt_speed"] = spec.belt_speed
+        states.append(state)
+    return {"schema": SCHEMA_VERSION, "states": states}
+
+
+def encode_binary(specs):
+    """
+    Codifica binaria compatta degli stati indicati
+
+    Raises:
+        FSASchemaError: Campo fuori dai limiti del formato binario (per
+            esempio un ritardo del formato storico oltre MAX_DELAY)
+    """
+    state_pack, bin_pack = _STATE.pack, _BIN.pack
+    states = []
+    bins = []
+    i = 0
+    try:
+        for i, spec in enumerate(specs):
+            speed = spec.belt_speed if spec.belt_speed is not None else math.nan
+            states.append(state_pack(round(spec.delay * 1000), speed, len(spec.bins)))
+            bins += [bin_pack(BINS.index(name), count) for name, count in spec.bins]
+    except (struct.error, OverflowError) as e:
+        raise FSASchemaError(f"states[{i}]", f"non rappresentabile in binario ({e})") from None
+    return b"".join([_HEADER.pack(len(states), len(bins))] + states + bins)
+
+
+def decode_binary(payload, state=StateSpec):
+    """
+    Decodifica la rappresentazione binaria
+
+    Raises:
+        FSASchemaError: Dati troncati o in eccesso, contenitore inesistente
+    """
+    if len(payload) < _HEADER.size:
+        raise FSASchemaError("byte 0", "dati binari troncati")
+    num_states, num_bins = _HEADER.unpack_from(payload)
+    bins_start = _HEADER.size + num_states * _STATE.size
+    end = bins_start + num_bins * _BIN.size
+    if end != len(payload):
+        problem = "dati binari troncati" if end > len(payload) else f"{len(payload) - end} byte in eccesso"
+        raise FSASchemaError(f"byte {min(end, len(payload))}", problem)
+
+    view = memoryview(payload)
+    try:
+        pairs = [(BINS[index], count) for index, count in _BIN.iter_unpack(view[bins_start:])]
+    except IndexError:
+        index = next(index for index, _ in _BIN.iter_unpack(view[bins_start:]) if index >= len(BINS))
+        raise FSASchemaError("bins", f"contenitore inesistente (indice {index})") from None
+
+    specs = []
+    start = 0
+    for delay_ms, speed, count in _STATE.iter_unpack(view[_HEADER.size:bins_start]):
+        end = start + count
+        # La velocità a 32 bit viene riportata alla precisione con cui è stata scritta
+        specs.append(state(tuple(pairs[start:end]), delay_ms / 1000.0,
+                           None if speed != speed else round(speed, 6)))
+        start = end
+    if start != num_bins:
+        raise FSASchemaError("bins", f"{num_bins} contenitori dichiarati, {start} usati dagli stati")
+    return specs
+
+
+def load(program, state=StateSpec):
+    """
+    Stati di un programma in uno qualsiasi dei formati
+
+    Args:
+        program: Stringa storica, testo JSON, dict JSON o bytes binari
+        state (callable): Costruttore degli stati, chiamato con (contenitori,
+            ritardo, velocità del nastro o None); per default StateSpec
+
+    Returns:
+        list: Stati costruiti da state, in ordine di stato
+
+    Raises:
+        ValueError: FSASyntaxError o FSASchemaError con la posizione dell'errore
+    """
+    # Il caricamento crea centinaia di migliaia di oggetti che restano in vita:
+    # senza sospendere il garbage collector ciclico le raccolte ripetute
+    # rileggerebbero ogni volta tutti gli stati già costruiti
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if isinstance(program, (bytes, bytearray)):
+            return decode_binary(program, state)
+        if isinstance(program, str):
+            if not program.lstrip().startswith('{'):
+                return from_legacy(fsa_parser.parse(program), state)
+            program = json.loads(program)  # json.JSONDecodeError riporta riga e colonna
+        return from_json(program, state)
+    finally:
+        if enabled:
+            gc.enable()
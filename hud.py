@@ -0,0 +1,115 @@
+# ============================================================================
+# HUD: ETICHETTE E PANNELLO INFORMATIVO
+# ============================================================================
+"""
+HUD del controller: le due etichette della vista 3D (robot.setLabel) e il
+pannello informativo (info_display) sono generati da un unico modello della
+vista, un dizionario con i valori mostrati.
+
+Il modello viene costruito al massimo una volta ogni refresh_period secondi
+di simulazione; se non è cambiato dall'ultimo aggiornamento non viene
+inviato nulla a Webots. Le etichette vengono reinviate solo se il loro testo
+cambia, il pannello ridisegna solo i campi modificati (vedi info_panel.py).
+
+Il tempo reale speso negli aggiornamenti viene misurato e riportato
+periodicamente, con un avviso se supera il budget.
+"""
+
+import time
+
+from info_panel import InfoPanel
+from scheduler import PeriodicReport  # Resoconto ogni REPORT_PERIOD secondi di simulazione
+
+# Etichette: (id, formato, x, y, dimensione, colore)
+LABELS = (
+    (1, "Apples: {apple:3d}    Oranges: {orange:3d}    Substate: {substate}", 0.07, 0.96, 0.06, 0x00FF00),
+    (2, "State: {state}    G1: {G1}  O1: {O1} G2: {G2}  O2: {O2}  Blue: {blue} Delay: {delay:.1f}",
+     0.07, 0.91, 0.05, 0x0000FF),
+)
+LABEL_FONT = "Lucida Console"
+
+# Campi del pannello: (nome, x, y, larghezza, altezza, formato, chiavi del modello)
+PANEL_FIELDS = (
+    ("apples", 10, 10, 260, 20, "Apples: {:3d}    {}|{}", ("apple", "state_apples", "required_apples")),
+    ("oranges", 10, 30, 260, 20, "Oranges: {:3d}    {}|{}", ("orange", "state_oranges", "required_oranges")),
+    ("fruit", 10, 50, 260, 20, "Fruit: {}", ("fruit",)),
+    ("skipped", 10, 70, 260, 20, "Skipped: {}", ("skipped",)),
+    ("state", 10, 100, 260, 20, "State: {}|{}", ("state", "states")),
+    ("G1", 10, 120, 85, 20, "G1: {} {}|{}", ("G1", "state_G1", "required_G1")),
+    ("O1", 10, 140, 85, 20, "O1: {} {}|{}", ("O1", "state_O1", "required_O1")),
+    ("G2", 95, 120, 85, 20, "G2: {} {}|{}", ("G2", "state_G2", "required_G2")),
+    ("O2", 95, 140, 85, 20, "O2: {} {}|{}", ("O2", "state_O2", "required_O2")),
+    ("B1", 180, 120, 90, 20, "B1: {}", ("blue",)),
+    ("delay", 180, 140, 90, 20, "Delay: {:.1f}", ("delay",)),
+    ("substate", 10, 160, 260, 20, "Substate: {}", ("substate",)),
+)
+
+
+class Hud:
+    """
+    Aggiornamento a frequenza limitata di etichette e pannello informativo
+
+    Args:
+        robot: Supervisor di Webots (per setLabel)
+        info_display: Display del pannello informativo (None se assente)
+        refresh_period (float): Intervallo minimo tra due aggiornamenti (s)
+        budget (float): Tempo reale massimo per secondo simulato (ms/s)
+    """
+
+    def __init__(self, robot, info_display, refresh_period=0.2, budget=5.0):
+        self.robot = robot
+        self.refresh_period = refresh_period
+        self.budget = budget
+        self.model = None
+        self.labels = {}
+        self.next_refresh = 0.0
+        self.spent = 0.0           # Tempo reale speso dall'ultimo resoconto (s)
+        self.updates = 0           # Aggiornamenti inviati dall'ultimo resoconto
+        self._report = PeriodicReport(self._print_report)
+
+        self.panel = None
+        if info_display is not None:
+            self.panel = InfoPanel(info_display)
+            for name, x, y, width, height, fmt, _ in PANEL_FIELDS:
+                self.panel.add_field(name, x, y, width, height, fmt)
+
+    def update(self, now, build_model):
+        """
+        Aggiorna l'HUD se è trascorso il periodo di refresh
+
+        Args:
+            now (float): Tempo di simulazione
+            build_model (callable): Restituisce il modello della vista (dict);
+                chiamata solo quando l'aggiornamento è dovuto
+        """
+        if now < self.next_refresh:
+            return
+        start = time.perf_counter()
+        self.next_refresh = now + self.refresh_period
+
+        model = build_model()
+        if model != self.model:
+            self.model = model
+            self.updates += 1
+            self._push_labels(model)
+            if self.panel is not None:
+                for name, _, _, _, _, _, keys in PANEL_FIELDS:
+                    self.panel.set(name, *[model[key] for key in keys])
+                self.panel.flush(now)
+
+        self.spent += time.perf_counter() - start
+        self._report.update(now)
+
+    def _push_labels(self, model):
+        for label_id, fmt, x, y, size, color in LABELS:
+            text = fmt.format(**model)
+            if self.labels.get(label_id) != text:
+                self.labels[label_id] = text
+                self.robot.setLabel(label_id, text, x, y, size, color, 0, LABEL_FONT)
+
+    def _print_report(self, elapsed):
+        cost = 1000.0 * self.spent / elapsed
+        print(f"HUD: {cost:.2f} ms/s di aggiornamenti, {self.updates / elapsed:.1f} aggiornamenti/s"
+              + (f" (oltre il budget di {self.budget:.1f} ms/s)" if cost > self.budget else ""))
+        self.spent = 0.0
+        self.updates = 0
@@ -0,0 +1,105 @@
+# ============================================================================
+# PANNELLO INFORMATIVO A MODALITÀ RITENUTA
+# ============================================================================
+"""
+Pannello informativo che ridisegna solo i campi modificati.
+
+Ogni campo ha una regione fissa del display, un formato e l'ultimo valore
+disegnato. set() confronta il nuovo valore con quello precedente e segna il
+campo come da ridisegnare; flush() cancella e riscrive solo le regioni dei
+campi modificati, raggruppando i cambi di colore e trasparenza.
+
+Il pannello conta le chiamate al display inviate e quelle risparmiate
+rispetto al ridisegno completo ad ogni passo, e le riporta periodicamente.
+"""
+
+from scheduler import PeriodicReport  # Resoconto ogni REPORT_PERIOD secondi di simulazione
+
+BACKGROUND_COLOR = 0xFFFFFF  # Sfondo bianco
+BACKGROUND_ALPHA = 0.8       # Leggera trasparenza
+TEXT_COLOR = 0x000000        # Testo nero
+
+
+class InfoPanel:
+    """
+    Pannello a campi con ridisegno incrementale
+
+    Args:
+        display: Dispositivo Display di Webots (ottenuto una sola volta)
+        font (tuple): Font del testo (nome, dimensione, antialiasing)
+    """
+
+    def __init__(self, display, font=("Arial", 14, True)):
+        self.display = display
+        self.fields = {}      # nome -> [x, y, larghezza, altezza, formato, valore, da ridisegnare]
+        self.dirty = []       # Campi da ridisegnare, in ordine di modifica
+        self.initialized = False
+        self.calls_sent = 0
+        self.calls_saved = 0
+        self._report = PeriodicReport(self._print_report)
+        display.setFont(*font)
+
+    def add_field(self, name, x, y, width, height, fmt):
+        """
+        Registra un campo del pannello
+
+        Args:
+            name (str): Nome del campo
+            x, y (int): Posizione del testo (angolo della regione)
+            width, height (int): Dimensioni della regione cancellata al ridisegno
+            fmt (str): Formato del testo, applicato con str.format(*valore)
+        """
+        self.fields[name] = [x, y, width, height, fmt, None, False]
+
+    def set(self, name, *value):
+        """Aggiorna il valore di un campo; se è cambiato verrà ridisegnato"""
+        field = self.fields[name]
+        if field[5] != value:
+            field[5] = value
+            if not field[6]:
+                field[6] = True
+                self.dirty.append(field)
+
+    def full_redraw_calls(self):
+        """Chiamate al display del ridisegno completo ad ogni passo"""
+        # Colore, trasparenza e riempimento dello sfondo, font, colore e trasparenza del testo, testi
+        return 6 + len(self.fields)
+
+    def flush(self, now):
+        """
+        Ridisegna i campi modificati dall'ultimo flush
+
+        Args:
+            now (float): Tempo di simulazione, per il resoconto periodico
+        """
+        display = self.display
+        full = self.full_redraw_calls()
+        sent = 0
+
+        if self.dirty:
+            display.setColor(BACKGROUND_COLOR)
+            display.setAlpha(BACKGROUND_ALPHA)
+            if not self.initialized:
+                # Primo disegno: sfondo dell'intero pannello
+                display.fillRectangle(0, 0, display.getWidth(), display.getHeight())
+                sent += 1
+                self.initialized = True
+            for x, y, width, height, _, _, _ in self.dirty:
+                display.fillRectangle(x, y, width, height)
+            display.setColor(TEXT_COLOR)
+            display.setAlpha(1.0)
+            for field in self.dirty:
+                x, y, _, _, fmt, value, _ = field
+                display.drawText(fmt.format(*value), x, y)
+                field[6] = False
+            sent += 4 + 2 * len(self.dirty)
+            self.dirty.clear()
+
+        self.calls_sent += sent
+        self.calls_saved += max(0, full - sent)
+        self._report.update(now)
+
+    def _print_report(self, elapsed):
+        print(f"Info panel: {self.calls_saved / elapsed:.1f} chiamate al display/s risparmiate, "
+              f"{self.calls_sent / elapsed:.1f} chiamate/s inviate")
+        self.calls_sent = self.calls_saved = 0
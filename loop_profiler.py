@@ -0,0 +1,243 @@
+# ============================================================================
+# PROFILER DEL LOOP PRINCIPALE
+# ============================================================================
+"""
+Profiler a basso overhead del loop del controller, attivato con
+FRUIT_SORTER_PROFILE (1 = riepilogo su stdout, altrimenti percorso del file
+in cui aggiungere il riepilogo).
+
+Il loop chiama lap(nome) alla fine di ogni sezione: il tempo reale dal lap
+precedente viene attribuito alla sezione, con una sola lettura di
+perf_counter_ns() per sezione. La sezione "step" è il tempo bloccato in
+robot.step(), cioè la simulazione di Webots; le altre sono il lavoro del
+controller. end_step() chiude il passo e:
+- segnala come overrun i passi in cui il lavoro del controller supera la
+  durata simulata del passo (il controller rallenta la simulazione)
+- calcola il fattore di tempo reale (tempo simulato / tempo reale) su
+  finestre di RTF_WINDOW secondi simulati e segnala quelle sotto min_rtf
+
+Le durate finiscono in istogrammi a bucket logaritmici (potenze di 2 in
+microsecondi), quindi la memoria resta costante su simulazioni lunghe e i
+percentili del riepilogo sono approssimati per eccesso al bucket.
+
+Il riepilogo viene scritto all'uscita (atexit) e su richiesta con SIGUSR1
+(kill -USR1 <pid>), senza interrompere il controller: il gestore del
+segnale imposta solo un flag e il riepilogo viene scritto dal passo
+successivo, fuori dal gestore (una print nel gestore durante un'altra
+print del loop solleverebbe "reentrant call" sullo stdout bufferizzato).
+"""
+
+import atexit
+import os
+import signal
+import sys
+import time
+
+from scheduler import PeriodicReport  # Resoconto sintetico ogni REPORT_PERIOD secondi di simulazione
+
+RTF_WINDOW = 1.0       # Finestra del fattore di tempo reale (s simulati)
+BUCKETS = 32           # Bucket dell'istogramma: il bucket i conta [2^(i-1), 2^i) µs
+MAX_WARNINGS = 5       # Avvisi stampati per periodo di resoconto
+STEP_SECTION = "step"  # Sezione del tempo bloccato in robot.step()
+
+
+class Histogram:
+    """Istogramma logaritmico di durate in nanosecondi"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ns):
+        bucket = (ns // 1000).bit_length()  # 0 per durate sotto 1 µs
+        self.counts[bucket if bucket < BUCKETS else BUCKETS - 1] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, q):
+        """Limite superiore (µs) del bucket che contiene il percentile q (0-1), al più il massimo"""
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(1 << bucket, -(-self.max // 1000))
+        return -(-self.max // 1000)
+
+
+class LoopProfiler:
+    """
+    Tempi per sezione del loop, overrun dei passi e fattore di tempo reale
+
+    Args:
+        output (str): File del riepilogo (None = stdout)
+        min_rtf (float): Fattore di tempo reale minimo prima dell'avviso
+    """
+
+    def __init__(self, output=None, min_rtf=0.9):
+        self.output = output
+        self.min_rtf = min_rtf
+        self.sections = {}           # Nome -> Histogram, in ordine di primo lap
+        self.work = Histogram()      # Lavoro del controller per passo
+        self.recent_work = Histogram()  # Lo stesso, dall'ultimo resoconto
+        self.steps = 0
+        self.overruns = 0
+        self.worst_overrun = (0, 0.0)  # (lavoro ns, tempo simulato)
+        self.slow_windows = 0
+        self.windows = 0
+        self.min_window_rtf = None
+        self._warnings = 0
+        self._last = time.perf_counter_ns()
+        self._step_start = self._last  # Inizio del lavoro del passo corrente
+        self._wall_start = self._last
+        self._sim_start = None
+        self._window = None            # (tempo simulato, tempo reale) di inizio finestra
+        self._report = PeriodicReport(self._print_report)
+        self._reported = (0, 0)        # (passi, overrun) all'ultimo resoconto
+        self._dump_requested = False   # Impostato da SIGUSR1, gestito in end_step
+
+        atexit.register(self.dump)
+        if hasattr(signal, "SIGUSR1"):
+            try:
+                signal.signal(signal.SIGUSR1, self._request_dump)
+            except ValueError:
+                pass  # Non nel thread principale: solo il riepilogo all'uscita
+
+    def _request_dump(self, signum, frame):
+        """Gestore di SIGUSR1: solo il flag, il riepilogo lo scrive end_step"""
+        self._dump_requested = True
+
+    def lap(self, name):
+        """Attribuisce alla sezione name il tempo reale dal lap precedente"""
+        now = time.perf_counter_ns()
+        histogram = self.sections.get(name)
+        if histogram is None:
+            histogram = self.sections[name] = Histogram()
+        histogram.add(now - self._last)
+        if name == STEP_SECTION:
+            self._step_start = now
+        self._last = now
+
+    def end_step(self, sim_time, step_ms):
+        """
+        Chiude il passo: controlla overrun e fattore di tempo reale
+
+        Args:
+            sim_time (float): Tempo di simulazione corrente
+            step_ms (int): Durata simulata del passo (ms)
+        """
+        now = time.perf_counter_ns()
+        work = now - self._step_start
+        self.work.add(work)
+        self.recent_work.add(work)
+        self.steps += 1
+        if self._sim_start is None:
+            self._sim_start = sim_time
+            self._window = (sim_time, now)
+
+        if work > step_ms * 1000000:
+            self.overruns += 1
+            if work > self.worst_overrun[0]:
+                self.worst_overrun = (work, sim_time)
+            self._warn(f"Profiler: overrun a t={sim_time:.3f} s, lavoro {work / 1e6:.1f} ms "
+                       f"su un passo di {step_ms} ms")
+
+        window_sim, window_wall = self._window
+        if sim_time - window_sim >= RTF_WINDOW:
+            rtf = (sim_time - window_sim) * 1e9 / max(1, now - window_wall)
+            self.windows += 1
+            if self.min_window_rtf is None or rtf < self.min_window_rtf:
+                self.min_window_rtf = rtf
+            if rtf < self.min_rtf:
+                self.slow_windows += 1
+                self._warn(f"Profiler: fattore di tempo reale {rtf:.2f} "
+                           f"tra t={window_sim:.1f} e t={sim_time:.1f} s")
+            self._window = (sim_time, now)
+
+        self._report.update(sim_time)
+        self._last = now
+        if self._dump_requested:
+            self._dump_requested = False
+            self.dump()
+            self._last = time.perf_counter_ns()  # Il riepilogo non va nel lavoro del passo successivo
+
+    def _warn(self, message):
+        self._warnings += 1
+        if self._warnings <= MAX_WARNINGS:
+            print(message)
+
+    def _print_report(self, elapsed):
+        """Resoconto sintetico dall'ultimo resoconto"""
+        report_steps, report_overruns = self._reported
+        steps = self.steps - report_steps
+        busiest = max((name for name in self.sections if name != STEP_SECTION),
+                      key=lambda name: self.sections[name].total, default=None)
+        print(f"Profiler: {steps} passi, {self.overruns - report_overruns} overrun, "
+              f"lavoro p95 {self.recent_work.percentile(0.95)} µs, sezione più costosa: {busiest}"
+              + (f", avvisi soppressi: {self._warnings - MAX_WARNINGS}" if self._warnings > MAX_WARNINGS else ""))
+        self._warnings = 0
+        self.recent_work = Histogram()
+        self._reported = (self.steps, self.overruns)
+
+    def summary(self):
+        """
+        Riepilogo completo: istogrammi per sezione, overrun e tempo reale
+
+        Returns:
+            str: Testo del riepilogo
+        """
+        wall = (time.perf_counter_ns() - self._wall_start) / 1e9
+        total = sum(histogram.total for histogram in self.sections.values()) or 1
+        lines = [f"=== Profilo del loop: {self.steps} passi in {wall:.1f} s reali ===",
+                 f"{'sezione':<12} {'chiamate':>9} {'media µs':>9} {'p50':>7} {'p95':>7} {'p99':>7} "
+                 f"{'max µs':>9} {'quota':>6}"]
+        rows = list(self.sections.items()) + [("(lavoro)", self.work)]
+        for name, histogram in rows:
+            if not histogram.count:
+                continue
+            share = f"{histogram.total * 100 / total:5.1f}%" if histogram is not self.work else ""
+            lines.append(f"{name:<12} {histogram.count:>9} {histogram.total / histogram.count / 1000:>9.1f} "
+                         f"{histogram.percentile(0.5):>7} {histogram.percentile(0.95):>7} "
+                         f"{histogram.percentile(0.99):>7} {histogram.max / 1000:>9.0f} {share:>6}")
+        lines.append("Istogrammi (limite superiore del bucket in µs: passi):")
+        for name, histogram in rows:
+            buckets = [f"{1 << bucket}:{count}" for bucket, count in enumerate(histogram.counts) if count]
+            if buckets:
+                lines.append(f"  {name:<10} " + " ".join(buckets))
+        worst, worst_time = self.worst_overrun
+        lines.append(f"Overrun: {self.overruns} passi"
+                     + (f" (peggiore {worst / 1e6:.1f} ms a t={worst_time:.3f} s)" if self.overruns else ""))
+        if self.windows:
+            lines.append(f"Fattore di tempo reale: minimo {self.min_window_rtf:.2f} su finestre di "
+                         f"{RTF_WINDOW:.0f} s, {self.slow_windows}/{self.windows} sotto {self.min_rtf:.2f}")
+        return "\n".join(lines)
+
+    def dump(self):
+        """Scrive il riepilogo su stdout o in coda al file di output"""
+        text = self.summary()
+        if self.output is None:
+            print(text)
+            sys.stdout.flush()
+            return
+        with open(self.output, 'a', encoding='utf-8') as file:
+            file.write(text + "\n")
+
+
+def from_environment():
+    """
+    Profiler configurato da FRUIT_SORTER_PROFILE e FRUIT_SORTER_PROFILE_MIN_RTF
+
+    Returns:
+        LoopProfiler: Profiler, o None se non richiesto
+    """
+    setting = os.environ.get("FRUIT_SORTER_PROFILE")
+    if not setting or setting == "0":
+        return None
+    return LoopProfiler(None if setting == "1" else setting,
+                        float(os.environ.get("FRUIT_SORTER_PROFILE_MIN_RTF", 0.9)))
@@ -0,0 +1,491 @@
+# ============================================================================
+# BACKEND SIMULATO DELLA LIBRERIA controller DI WEBOTS
+# ============================================================================
+"""
+Sostituto in puro Python (più NumPy) delle classi Webots usate dai controller:
+Supervisor, Node, Field, Camera, Motor, DistanceSensor, PositionSensor,
+Display e Speaker.
+
+Il mondo simulato (MockWorld) contiene il nastro trasportatore, il braccio
+UR5e e una sequenza di frutti in arrivo. Camera e sensore di distanza possono
+essere alimentati in due modi:
+- sintetico: i frutti avanzano sul nastro e vengono disegnati nel frame BGRA
+- registrato: frame e letture del sensore provengono da una traccia .npy
+  (vedi frame_recorder.py) e vengono riprodotti in base al tempo di simulazione
+
+Il tempo avanza solo con Supervisor.step(), senza attese: la simulazione
+gira alla velocità consentita dal controller. Vedi replay.py.
+
+Come in Webots i sensori producono un campione ogni periodo di
+campionamento (il primo un periodo dopo enable()); sensore di distanza e
+sensori di posizione restituiscono il valore dell'ultimo campione, quindi
+un periodo troppo lungo si traduce in letture vecchie. MockWorld.samples
+conta i campioni prodotti da ogni dispositivo (per la telecamera, i frame
+che Webots dovrebbe renderizzare).
+"""
+
+import numpy as np  # NumPy per operazioni numeriche e array
+
+from frame_recorder import load_trace  # Tracce registrate dal controller
+
+# --- Geometria del mondo simulato ---
+CAMERA_WIDTH, CAMERA_HEIGHT = 200, 150
+BELT_LENGTH = 4.4         # Distanza (m) tra il punto di rilascio dei frutti e il gripper
+GRIP_WINDOW = 0.06        # Distanza (m) entro cui il frutto è sotto il gripper
+BASIC_TIME_STEP = 16      # Passo di integrazione del mondo (ms), come basicTimeStep del .wbt
+HOME_TOLERANCE = 0.1      # Scarto massimo (rad) dei giunti dalla posa sopra il nastro
+PIXELS_PER_METER = 600.0  # Scala dell'immagine lungo il nastro
+GRIPPER_ROW = 75          # Riga dell'immagine corrispondente al gripper
+FRUIT_RADIUS = 48         # Raggio (px) del frutto disegnato
+NO_OBJECT_DISTANCE = 1000.0
+OBJECT_DISTANCE = 300.0
+
+# Colori BGR di arancia, mela e mela marcia (dentro i range HSV di find_fruit)
+FRUIT_BGR = ((0, 140, 255), (30, 180, 40), (12, 12, 12))
+BELT_BGR = (120, 120, 120)
+
+# Contenitori: posizione del giunto shoulder_pan -> nome del contenitore
+BIN_PAN_POSITIONS = {-1.570796: "O1", 0.0: "G1", -1.0: "B1", 1.570796: "O2", 1.0: "G2"}
+BIN_FRUIT = {"O1": 0, "O2": 0, "G1": 1, "G2": 1, "B1": 2}
+
+# Giunti del braccio e del gripper
+FINGER_MIN_POSITION = 0.0495
+UR_JOINTS = ('shoulder_pan_joint', 'shoulder_lift_joint', 'elbow_joint', 'wrist_1_joint', 'wrist_2_joint')
+FINGER_JOINTS = ('finger_1_joint_1', 'finger_2_joint_1', 'finger_middle_joint_1')
+
+
+def synthetic_arrivals(count, period, seed=0, rotten=0.0):
+    """
+    Genera una sequenza di arrivi di frutti sul nastro
+
+    Args:
+        count (int): Numero di frutti
+        period (float): Intervallo medio tra due frutti, in secondi
+        seed (int): Seme del generatore casuale
+        rotten (float): Frazione di mele marce
+
+    Returns:
+        list: Lista di tuple (tempo di rilascio, tipo di frutto)
+    """
+    rng = np.random.default_rng(seed)
+    arrivals = []
+    t = 0.0
+    for _ in range(count):
+        t += period * rng.uniform(0.8, 1.2)
+        kind = 2 if rng.random() < rotten else int(rng.integers(0, 2))
+        arrivals.append((t, kind))
+    return arrivals
+
+
+# ============================================================================
+# MONDO SIMULATO
+# ============================================================================
+class MockWorld:
+    """
+    Stato del mondo simulato condiviso da tutti i dispositivi
+
+    Args:
+        duration (float): Durata della simulazione in secondi
+        arrivals (list): Tuple (tempo, tipo di frutto) per la modalità sintetica
+        trace (ndarray): Traccia registrata (vedi load_trace); se presente
+            camera e sensore di distanza riproducono la traccia
+    """
+
+    def __init__(self, duration=600.0, arrivals=(), trace=None):
+        self.duration = duration
+        self.time = 0.0
+        self.trace = trace
+        self.arrivals = sorted(arrivals)
+        self.belt_speed = 0.15
+        self.motors = {}
+        self.labels = {}
+        self.fruits = []       # Frutti sul nastro: [distanza dal gripper, tipo]
+        self.held = None       # Tipo del frutto nel gripper
+        self.released = 0      # Frutti rilasciati sul nastro finora
+        self.missed = 0        # Frutti caduti oltre il gripper
+        self.sorted = {}       # (tipo di frutto, contenitore) -> quantità
+        self.misplaced = 0     # Frutti nel contenitore sbagliato
+        self.samples = {}      # Nome del dispositivo -> campioni prodotti
+        self._frame_cache = {}
+        self._background = np.empty((CAMERA_HEIGHT, CAMERA_WIDTH, 4), np.uint8)
+        self._background[:, :, :3] = BELT_BGR
+        self._background[:, :, 3] = 255
+
+    # --- Avanzamento del tempo ---
+    def advance(self, dt):
+        """Avanza il mondo di dt secondi: motori, nastro, presa e rilascio"""
+        self.time += dt
+        for motor in self.motors.values():
+            motor._advance(dt)
+        if self.trace is not None:
+            return
+
+        while self.released < len(self.arrivals) and self.arrivals[self.released][0] <= self.time:
+            self.fruits.append([BELT_LENGTH, self.arrivals[self.released][1]])
+            self.released += 1
+
+        for fruit in self.fruits:
+            fruit[0] -= self.belt_speed * dt
+        lost = [f for f in self.fruits if f[0] < -GRIP_WINDOW]
+        if lost:
+            self.missed += len(lost)
+            self.fruits = [f for f in self.fruits if f[0] >= -GRIP_WINDOW]
+
+        fingers_closed = self._finger_target() > 0.3
+        if self.held is None and fingers_closed:
+            under = self._fruit_under_gripper()
+            if under is not None:
+                # Le dita si chiudono sul frutto sotto il gripper
+                self.fruits.remove(under)
+                self.held = under[1]
+        elif self.held is not None and not fingers_closed:
+            self._drop()
+
+    def _finger_target(self):
+        fingers = [self.motors[name] for name in FINGER_JOINTS if name in self.motors]
+        return min((m.target for m in fingers), default=0.0)
+
+    def _arm_home(self):
+        """True se il braccio è nella posa di attesa sopra il nastro"""
+        for name in UR_JOINTS:
+            motor = self.motors.get(name)
+            if motor is not None and abs(motor.position) > HOME_TOLERANCE:
+                return False
+        return True
+
+    def _fruit_under_gripper(self):
+        # Il gripper (e il suo sensore di distanza) è sopra il nastro solo nella posa di attesa
+        if not self._arm_home():
+            return None
+        for fruit in self.fruits:
+            if abs(fruit[0]) <= GRIP_WINDOW:
+                return fruit
+        return None
+
+    def _drop(self):
+        """Rilascia il frutto tenuto nel contenitore sotto il braccio"""
+        pan = self.motors['shoulder_pan_joint'].position
+        wrist = self.motors['wrist_1_joint'].position
+        bin_name = "floor"
+        if wrist < -2.0:
+            nearest = min(BIN_PAN_POSITIONS, key=lambda p: abs(p - pan))
+            if abs(nearest - pan) < 0.1:
+                bin_name = BIN_PAN_POSITIONS[nearest]
+        key = (self.held, bin_name)
+        self.sorted[key] = self.sorted.get(key, 0) + 1
+        if BIN_FRUIT.get(bin_name) != self.held:
+            self.misplaced += 1
+        self.held = None
+
+    # --- Letture dei sensori ---
+    def _trace_record(self):
+        index = np.searchsorted(self.trace['time'], self.time, side='right') - 1
+        return self.trace[max(index, 0)]
+
+    def distance(self):
+        if self.trace is not None:
+            return float(self._trace_record()['distance'])
+        # Il sensore è nel gripper: vede anche il frutto tenuto
+        if self.held is not None or self._fruit_under_gripper() is not None:
+            return OBJECT_DISTANCE
+        return NO_OBJECT_DISTANCE
+
+    def image(self):
+        if self.trace is not None:
+            return self._trace_record()['image'].tobytes()
+
+        # Il frutto più vicino al gripper tra quelli inquadrati (la telecamera è sul gripper)
+        visible = [f for f in self.fruits if -GRIP_WINDOW <= f[0] <= (GRIPPER_ROW + FRUIT_RADIUS) / PIXELS_PER_METER]
+        if not visible or self.held is not None or not self._arm_home():
+            return self._render(None, 0)
+        d, kind = min(visible, key=lambda f: f[0])
+        return self._render(kind, GRIPPER_ROW - int(d * PIXELS_PER_METER))
+
+    def _render(self, kind, row):
+        """Frame BGRA con un frutto circolare centrato sulla riga indicata"""
+        key = (kind, row)
+        frame = self._frame_cache.get(key)
+        if frame is None:
+            img = self._background.copy()
+            if kind is not None:
+                yy, xx = np.ogrid[:CAMERA_HEIGHT, :CAMERA_WIDTH]
+                disk = (yy - row) ** 2 + (xx - CAMERA_WIDTH // 2) ** 2 <= FRUIT_RADIUS ** 2
+                img[disk, :3] = FRUIT_BGR[kind]
+            frame = img.tobytes()
+            self._frame_cache[key] = frame
+        return frame
+
+    def picks(self):
+        """Numero di frutti depositati in un contenitore"""
+        return sum(n for (_, b), n in self.sorted.items() if b != "floor")
+
+
+_world = None
+
+
+def configure(world):
+    """Imposta il mondo usato dai Supervisor creati in seguito"""
+    global _world
+    _world = world
+
+
+# ============================================================================
+# DISPOSITIVI
+# ============================================================================
+class Device:
+    def __init__(self, world, name):
+        self.world = world
+        self.name = name
+
+    def getName(self):
+        return self.name
+
+
+class SampledDevice(Device):
+    def __init__(self, world, name):
+        super().__init__(world, name)
+        self.sampling_period = 0
+        self.next_sample = None
+        self.value = float('nan')  # Ultimo campione
+
+    def enable(self, sampling_period):
+        self.sampling_period = sampling_period
+        self.next_sample = self.world.time + sampling_period / 1000.0
+
+    def disable(self):
+        self.sampling_period = 0
+        self.next_sample = None
+
+    def _sample(self):
+        """Produce un campione se è trascorso un periodo (a ogni passo di integrazione)"""
+        if self.next_sample is None or self.world.time < self.next_sample - 1e-9:
+            return
+        while self.next_sample <= self.world.time + 1e-9:
+            self.next_sample += self.sampling_period / 1000.0
+        self.value = self._measure()
+        self.world.samples[self.name] = self.world.samples.get(self.name, 0) + 1
+
+    def _measure(self):
+        return None
+
+    def getSamplingPeriod(self):
+        return self.sampling_period
+
+
+class Motor(Device):
+    def __init__(self, world, name, min_position=-6.28, max_position=6.28, max_velocity=3.14):
+        super().__init__(world, name)
+        self.position = 0.0
+        self.target = 0.0
+        self.velocity = max_velocity
+        self.min_position = min_position
+        self.max_position = max_position
+        self.max_velocity = max_velocity
+        world.motors[name] = self
+
+    def setPosition(self, position):
+        self.target = float(position)
+
+    def setVelocity(self, velocity):
+        self.velocity = min(float(velocity), self.max_velocity)
+
+    def getTargetPosition(self):
+        return self.target
+
+    def getVelocity(self):
+        return self.velocity
+
+    def getMaxVelocity(self):
+        return self.max_velocity
+
+    def getMinPosition(self):
+        return self.min_position
+
+    def getMaxPosition(self):
+        return self.max_position
+
+    def _advance(self, dt):
+        step = self.velocity * dt
+        error = self.target - self.position
+        self.position = self.target if abs(error) <= step else self.position + (step if error > 0 else -step)
+
+
+class PositionSensor(SampledDevice):
+    def __init__(self, world, name, motor):
+        super().__init__(world, name)
+        self.motor = motor
+
+    def _measure(self):
+        return self.motor.position
+
+    def getValue(self):
+        return self.value
+
+
+class DistanceSensor(SampledDevice):
+    def _measure(self):
+        return self.world.distance()
+
+    def getValue(self):
+        return self.value
+
+
+class Camera(SampledDevice):
+    def __init__(self, world, name):
+        super().__init__(world, name)
+        self.value = None  # Nessun frame prima del primo campione
+
+    def _measure(self):
+        return self.world.image()
+
+    def getWidth(self):
+        return CAMERA_WIDTH
+
+    def getHeight(self):
+        return CAMERA_HEIGHT
+
+    def getImage(self):
+        # Frame dell'ultimo campione, come in Webots: tra due campioni non cambia
+        return self.value if self.sampling_period > 0 else None
+
+
+class Display(Device):
+    def __init__(self, world, name, width, height):
+        super().__init__(world, name)
+        self.width = width
+        self.height = height
+        self.draw_calls = 0
+
+    def getWidth(self):
+        return self.width
+
+    def getHeight(self):
+        return self.height
+
+    def attachCamera(self, camera):
+        pass
+
+    def detachCamera(self):
+        pass
+
+    def setColor(self, color):
+        pass
+
+    def setAlpha(self, alpha):
+        pass
+
+    def setFont(self, font, size, anti_aliasing):
+        pass
+
+    def fillRectangle(self, x, y, width, height):
+        self.draw_calls += 1
+
+    def drawRectangle(self, x, y, width, height):
+        self.draw_calls += 1
+
+    def drawText(self, text, x, y):
+        self.draw_calls += 1
+
+
+class Speaker(Device):
+    @staticmethod
+    def playSound(left, right, sound, volume, pitch, balance, loop):
+        pass
+
+
+# ============================================================================
+# NODI E CAMPI DEL SUPERVISORE
+# ============================================================================
+class Field:
+    def __init__(self, world, getter, setter):
+        self._get = getter
+        self._set = setter
+
+    def getSFFloat(self):
+        return self._get()
+
+    def setSFFloat(self, value):
+        self._set(float(value))
+
+    def getSFVec3f(self):
+        return list(self._get())
+
+    def setSFVec3f(self, value):
+        self._set(list(value))
+
+
+class Node:
+    def __init__(self, world, fields):
+        self.world = world
+        self.fields = fields
+
+    def getField(self, name):
+        return self.fields.get(name)
+
+
+def _set_belt_speed(world, value):
+    world.belt_speed = value
+
+
+class Supervisor:
+    """Sostituto di controller.Supervisor legato al mondo simulato"""
+
+    def __init__(self):
+        self.world = _world if _world is not None else MockWorld()
+        self.devices = {}
+        speed = Field(self.world, lambda: self.world.belt_speed, lambda v: _set_belt_speed(self.world, v))
+        self.nodes = {"conveyor_belt": Node(self.world, {"speed": speed})}
+
+    def step(self, duration):
+        if self.world.time >= self.world.duration:
+            return -1
+        # Come Webots, un passo lungo del controller è integrato a passi di BASIC_TIME_STEP
+        steps = max(1, round(duration / BASIC_TIME_STEP))
+        sampled = [device for device in self.devices.values() if isinstance(device, SampledDevice)]
+        for _ in range(steps):
+            self.world.advance(duration / steps / 1000.0)
+            for device in sampled:
+                device._sample()
+        return 0
+
+    def getTime(self):
+        return self.world.time
+
+    def getBasicTimeStep(self):
+        return float(BASIC_TIME_STEP)
+
+    def getFromDef(self, name):
+        return self.nodes.get(name)
+
+    def setLabel(self, id, label, x, y, size, color, transparency=0, font="Arial"):
+        self.world.labels[id] = label
+
+    def getDevice(self, name):
+        device = self.devices.get(name)
+        if device is None:
+            device = self._create_device(name)
+            if device is None:
+                print(f"Warning: Device \"{name}\" was not found on robot")
+                return None
+            self.devices[name] = device
+        return device
+
+    def _create_device(self, name):
+        world = self.world
+        if name in UR_JOINTS:
+            return Motor(world, name)
+        if name in FINGER_JOINTS:
+            return Motor(world, name, min_position=FINGER_MIN_POSITION, max_position=1.2217, max_velocity=2.0)
+        if name.endswith('_sensor') and name[:-len('_sensor')] in UR_JOINTS:
+            return PositionSensor(world, name, self.getDevice(name[:-len('_sensor')]))
+        if name == 'distance sensor':
+            return DistanceSensor(world, name)
+        if name in ('camera', 'camera_bin'):
+            return Camera(world, name)
+        if name == 'display':
+            return Display(world, name, 200, 150)
+        if name == 'info_display':
+            return Display(world, name, 270, 180)
+        if name == 'speaker':
+            return Speaker(world, name)
+        return None
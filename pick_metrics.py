@@ -0,0 +1,144 @@
+# ============================================================================
+# METRICHE DEI SOTTOSTATI PER OGNI PRELIEVO
+# ============================================================================
+"""
+Strumentazione dei sottostati del controller (waiting, picking, rotating,
+dropping, rotate_back) e dei delay tra gli stati dell'FSA.
+
+Il controller segnala ogni cambio di sottostato con transition(): l'intervallo
+del sottostato uscente (dall'ingresso all'uscita, in tempo di simulazione,
+compresi i passi di attesa del contatore) viene attribuito al frutto e al
+contenitore del prelievo in corso. Un prelievo va dall'ingresso in picking
+al successivo ritorno in waiting.
+
+Gli intervalli vengono aggiunti a pick_spans.csv man mano che si chiudono;
+periodicamente e alla fine vengono scritti:
+- pick_metrics.csv: p50/p95 per sottostato, per frutto e per contenitore
+- pick_metrics.prom: le stesse statistiche in formato testo Prometheus
+"""
+
+import csv
+import math
+import os
+
+from scheduler import PeriodicReport  # Riepiloghi ogni REPORT_PERIOD secondi di simulazione
+
+NONE_LABEL = "none"   # Etichetta di frutto e contenitore assenti
+QUANTILES = (0.5, 0.95)
+
+
+def percentile(values, q):
+    """Percentile q (0-1) con il metodo nearest-rank su valori ordinati"""
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class PickMetrics:
+    """
+    Raccolta ed esportazione dei tempi dei sottostati
+
+    Args:
+        directory (str): Directory dei file CSV e Prometheus (creata se manca)
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.spans = {}         # (sottostato, frutto, contenitore) -> durate
+        self.picks = {}         # (frutto, contenitore) -> durate dei prelievi
+        self.substate = None    # Sottostato corrente
+        self.entered = 0.0      # Ingresso nel sottostato corrente
+        self.pick_start = None  # Ingresso in picking del prelievo in corso
+        self.pick_id = 0
+        self._export = PeriodicReport(lambda elapsed: self.export())
+
+        self._spans_file = open(os.path.join(directory, "pick_spans.csv"), 'w', newline='')
+        self._spans_csv = csv.writer(self._spans_file)
+        self._spans_csv.writerow(("pick", "substate", "fruit", "bin", "start", "end", "duration"))
+
+    def transition(self, now, substate, fruit_name, bin_name):
+        """
+        Chiude l'intervallo del sottostato corrente e apre il successivo
+
+        Args:
+            now (float): Tempo di simulazione
+            substate (str): Nome del nuovo sottostato
+            fruit_name, bin_name (str): Frutto e contenitore del prelievo in corso
+        """
+        if self.substate is not None:
+            self._record(self.substate, fruit_name, bin_name, self.entered, now)
+        if substate == "picking":
+            self.pick_id += 1
+            self.pick_start = now
+        elif substate == "waiting" and self.pick_start is not None:
+            self.picks.setdefault((fruit_name, bin_name), []).append(now - self.pick_start)
+            self.pick_start = None
+        self.substate = substate
+        self.entered = now
+
+    def record_delay(self, start, end):
+        """Registra il delay di fine stato (start, end in tempo di simulazione)"""
+        self._record("state_delay", NONE_LABEL, NONE_LABEL, start, end)
+
+    def _record(self, substate, fruit_name, bin_name, start, end):
+        self.spans.setdefault((substate, fruit_name, bin_name), []).append(end - start)
+        self._spans_csv.writerow((self.pick_id, substate, fruit_name, bin_name,
+                                  f"{start:.3f}", f"{end:.3f}", f"{end - start:.3f}"))
+
+    def update(self, now):
+        """Scrive i riepiloghi ogni REPORT_PERIOD secondi di simulazione"""
+        self._export.update(now)
+
+    def rollups(self):
+        """
+        Durate raggruppate per sottostato, per frutto e per contenitore
+
+        Returns:
+            list: Tuple (gruppo, sottostato, chiave, durate ordinate)
+        """
+        groups = {}
+        for (substate, fruit_name, bin_name), values in self.spans.items():
+            for group, key in (("substate", ""), ("fruit", fruit_name), ("bin", bin_name)):
+                groups.setdefault((group, substate, key), []).extend(values)
+        for (fruit_name, bin_name), values in self.picks.items():
+            for group, key in (("substate", ""), ("fruit", fruit_name), ("bin", bin_name)):
+                groups.setdefault((group, "pick", key), []).extend(values)
+        return [(group, substate, key, sorted(values))
+                for (group, substate, key), values in sorted(groups.items())]
+
+    def export(self):
+        """Scrive pick_metrics.csv e pick_metrics.prom (sostituzione atomica)"""
+        self._spans_file.flush()
+        rollups = self.rollups()
+
+        path = os.path.join(self.directory, "pick_metrics.csv")
+        with open(path + ".tmp", 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(("group", "substate", "key", "count", "p50", "p95", "mean"))
+            for group, substate, key, values in rollups:
+                writer.writerow((group, substate, key, len(values), f"{percentile(values, 0.5):.3f}",
+                                 f"{percentile(values, 0.95):.3f}", f"{sum(values) / len(values):.3f}"))
+        os.replace(path + ".tmp", path)
+
+        path = os.path.join(self.directory, "pick_metrics.prom")
+        lines = []
+        for group in ("substate", "fruit", "bin"):
+            name = "fruit_sorter_substate_seconds" if group == "substate" else f"fruit_sorter_substate_{group}_seconds"
+            lines.append(f"# HELP {name} Durata dei sottostati per prelievo"
+                         + ("" if group == "substate" else f" e {group}"))
+            lines.append(f"# TYPE {name} summary")
+            for rollup_group, substate, key, values in rollups:
+                if rollup_group != group:
+                    continue
+                labels = f'substate="{substate}"' + ("" if group == "substate" else f',{group}="{key}"')
+                for q in QUANTILES:
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} {percentile(values, q):.6f}')
+                lines.append(f"{name}_sum{{{labels}}} {sum(values):.6f}")
+                lines.append(f"{name}_count{{{labels}}} {len(values)}")
+        with open(path + ".tmp", 'w') as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        """Scrive i riepiloghi finali e chiude il file degli intervalli"""
+        self.export()
+        self._spans_file.close()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# ============================================================================
+# ESECUZIONE HEADLESS DEL CONTROLLER SU MONDO SIMULATO
+# ============================================================================
+"""
+Esegue fruit_sorting_ctrl_opencv.py senza Webots, sul backend simulato di
+mock_controller.py, il più velocemente possibile.
+
+Alla fine stampa tempo simulato, tempo reale, fattore di tempo reale e
+risultati dello smistamento. Con --min-picks il codice di uscita è 1 se il
+controller ha smistato meno frutti del previsto (uso come test di regressione).
+Con --metrics stampa anche p50/p95 dei sottostati (vedi pick_metrics.py).
+
+Esempi:
+    python replay.py --duration 600 --period 6
+    python replay.py --trace registrazione.npy --duration 120
+    python replay.py --fsa "2, (2,G1,2,O2,1), (1,G2,1,O1,0)" --min-picks 6
+    python replay.py --duration 600 --period 2 --metrics metriche
+"""
+
+import argparse
+import csv
+import os
+import runpy
+import sys
+import tempfile
+import time
+
+import mock_controller
+
+CONTROLLER_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER = os.path.join(CONTROLLER_DIR, "fruit_sorting_ctrl_opencv.py")
+
+
+def run(world, fsa=None):
+    """
+    Esegue il controller sul mondo simulato indicato
+
+    Args:
+        world (MockWorld): Mondo simulato
+        fsa (str): Messaggio FSA da usare al posto di fsa_message.json
+
+    Returns:
+        float: Tempo reale impiegato, in secondi
+    """
+    os.environ["FRUIT_SORTER_BACKEND"] = "mock"
+    mock_controller.configure(world)
+    sys.path.insert(0, CONTROLLER_DIR)
+
+    cwd = os.getcwd()
+    workdir = CONTROLLER_DIR
+    if fsa is not None:
+        # Il controller legge fsa_message.json dalla directory corrente
+        workdir = tempfile.mkdtemp(prefix="fruit_replay_")
+        with open(os.path.join(workdir, "fsa_message.json"), 'w') as file:
+            file.write(fsa)
+
+    os.chdir(workdir)
+    start = time.perf_counter()
+    try:
+        runpy.run_path(CONTROLLER, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise
+    finally:
+        os.chdir(cwd)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Esecuzione headless del controller")
+    parser.add_argument("--duration", type=float, default=300.0, help="Tempo simulato in secondi")
+    parser.add_argument("--period", type=float, default=6.0, help="Intervallo medio tra i frutti (s)")
+    parser.add_argument("--count", type=int, default=0, help="Numero di frutti (0 = fino a fine durata)")
+    parser.add_argument("--rotten", type=float, default=0.0, help="Frazione di mele marce")
+    parser.add_argument("--seed", type=int, default=0, help="Seme per la sequenza di frutti")
+    parser.add_argument("--trace", help="Traccia registrata .npy da riprodurre")
+    parser.add_argument("--fsa", help="Messaggio FSA da usare al posto di fsa_message.json")
+    parser.add_argument("--min-picks", type=int, default=0, help="Minimo di frutti smistati richiesto")
+    parser.add_argument("--metrics", help="Directory delle metriche dei sottostati")
+    args = parser.parse_args()
+
+    if args.metrics:
+        os.environ["FRUIT_SORTER_METRICS_DIR"] = os.path.abspath(args.metrics)
+
+    if args.trace:
+        world = mock_controller.MockWorld(args.duration, trace=mock_controller.load_trace(args.trace))
+    else:
+        count = args.count or int(args.duration / args.period) + 1
+        arrivals = mock_controller.synthetic_arrivals(count, args.period, args.seed, args.rotten)
+        world = mock_controller.MockWorld(args.duration, arrivals)
+
+    wall = run(world, args.fsa)
+
+    print("\n=== Replay ===")
+    print(f"Tempo simulato: {world.time:.1f} s  reale: {wall:.2f} s  "
+          f"fattore tempo reale: {world.time / wall:.1f}x")
+    if world.trace is None:
+        picks = world.picks()
+        print(f"Frutti rilasciati: {world.released}  smistati: {picks}  "
+              f"persi: {world.missed}  fuori posto: {world.misplaced}")
+        print(f"Frutti al minuto: {picks * 60.0 / world.time:.2f}")
+        for (kind, bin_name), n in sorted(world.sorted.items()):
+            print(f"  {('Orange', 'Apple', 'Rottenapple')[kind]:<12} -> {bin_name}: {n}")
+        print("Campioni dei sensori: " + ", ".join(f"{name} {n}" for name, n in sorted(world.samples.items())))
+        if args.metrics:
+            print("Sottostati (s):        n     p50     p95")
+            with open(os.path.join(args.metrics, "pick_metrics.csv"), newline='') as file:
+                for row in csv.DictReader(file):
+                    if row["group"] == "substate":
+                        print(f"  {row['substate']:<16} {row['count']:>6} {row['p50']:>7} {row['p95']:>7}")
+        if picks < args.min_picks:
+            print(f"Errore: smistati {picks} frutti, attesi almeno {args.min_picks}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
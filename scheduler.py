@@ -0,0 +1,158 @@
+# ============================================================================
+# SCHEDULER DEGLI EVENTI A TEMPO DI SIMULAZIONE
+# ============================================================================
+"""
+Scheduler a heap di eventi con scadenza in tempo di simulazione
+(robot.getTime()), indipendente dal timestep del controller.
+
+Ogni evento è una funzione da chiamare alla scadenza. run_due() esegue, in
+ordine di scadenza, gli eventi scaduti all'istante indicato; gli eventi
+programmati durante l'esecuzione vengono considerati alla chiamata
+successiva, quindi un evento riprogrammato con scadenza "adesso" viene
+eseguito al passo seguente. next_deadline() permette al ciclo principale di
+dormire fino alla prossima scadenza.
+
+PeriodicTask è l'executor multi-rate: ogni task viene eseguito con il
+proprio periodo sulla griglia start + k * period. I task periodici non
+svegliano il ciclo principale (wake=False): con passi lunghi vengono
+eseguiti al primo passo utile, una sola volta anche se sono state saltate
+più scadenze.
+
+PeriodicReport è il resoconto periodico dei contatori dei moduli (HUD,
+attuatori, tracker, tempi di ciclo, ...): aggiornato ad ogni chiamata con il
+tempo di simulazione, chiama la funzione di resoconto con il tempo trascorso
+ogni REPORT_PERIOD secondi, a partire dal primo aggiornamento.
+"""
+
+import heapq
+
+EPSILON = 1e-9       # Tolleranza sul confronto dei tempi (s)
+REPORT_PERIOD = 60.0  # Periodo predefinito dei resoconti periodici (s)
+
+
+class Scheduler:
+    """Coda di eventi ordinata per scadenza"""
+
+    def __init__(self):
+        self.heap = []  # Voci [scadenza, progressivo, funzione, sveglia] (funzione None = annullato)
+        self.seq = 0
+        self.now = 0.0  # Istante dell'ultima run_due()
+
+    def schedule(self, deadline, callback, wake=True):
+        """
+        Programma un evento
+
+        Args:
+            deadline (float): Tempo di simulazione della scadenza (s)
+            callback (callable): Funzione senza argomenti da chiamare
+            wake (bool): False se la scadenza non deve accorciare i passi
+                del ciclo principale (vedi next_deadline)
+
+        Returns:
+            list: Riferimento all'evento, per cancel()
+        """
+        self.seq += 1
+        entry = [deadline, self.seq, callback, wake]
+        heapq.heappush(self.heap, entry)
+        return entry
+
+    def cancel(self, entry):
+        """Annulla un evento programmato (nessun effetto se già eseguito)"""
+        if entry is not None:
+            entry[2] = None
+
+    def next_deadline(self):
+        """Scadenza del prossimo evento valido con wake=True (None se non ce ne sono)"""
+        heap = self.heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        if not heap or heap[0][3]:
+            return heap[0][0] if heap else None
+        # Pochi eventi in coda (sottostati, delay e task periodici): scansione lineare
+        return min((entry[0] for entry in heap if entry[3] and entry[2] is not None), default=None)
+
+    def run_due(self, now):
+        """
+        Esegue gli eventi con scadenza non successiva a now
+
+        Args:
+            now (float): Tempo di simulazione corrente
+        """
+        self.now = now
+        heap = self.heap
+        due = []
+        while heap and heap[0][0] <= now + EPSILON:
+            entry = heapq.heappop(heap)
+            if entry[2] is not None:
+                due.append(entry)
+        for entry in due:
+            callback = entry[2]
+            if callback is not None:  # Può essere stato annullato da un evento precedente
+                entry[2] = None
+                callback()
+
+
+class PeriodicTask:
+    """
+    Task periodico dell'executor multi-rate
+
+    Args:
+        scheduler (Scheduler): Scheduler su cui programmare il task
+        period (float): Periodo in secondi di simulazione
+        callback (callable): Funzione senza argomenti da chiamare
+        start (float): Prima scadenza (s)
+    """
+
+    def __init__(self, scheduler, period, callback, start):
+        self.scheduler = scheduler
+        self.period = period
+        self.callback = callback
+        self.deadline = start
+        self.entry = scheduler.schedule(start, self._run, wake=False)
+
+    def _run(self):
+        # Prossima scadenza sulla griglia, oltre quelle saltate con passi lunghi
+        while self.deadline <= self.scheduler.now + EPSILON:
+            self.deadline += self.period
+        self.entry = self.scheduler.schedule(self.deadline, self._run, wake=False)
+        self.callback()
+
+    def cancel(self):
+        """Interrompe il task"""
+        self.scheduler.cancel(self.entry)
+
+
+class PeriodicReport:
+    """
+    Resoconto periodico in tempo di simulazione
+
+    Il primo update() fissa l'inizio del periodo; quando sono trascorsi
+    almeno period secondi callback riceve il tempo trascorso (per i valori
+    al secondo) e deve azzerare i propri contatori.
+
+    Args:
+        callback (callable): Funzione chiamata con il tempo trascorso (s)
+        period (float): Periodo del resoconto in secondi di simulazione
+    """
+
+    __slots__ = ("callback", "period", "start")
+
+    def __init__(self, callback, period=REPORT_PERIOD):
+        self.callback = callback
+        self.period = period
+        self.start = None
+
+    def update(self, now):
+        """
+        Chiama il resoconto se è trascorso il periodo
+
+        Args:
+            now (float): Tempo di simulazione corrente
+        """
+        if self.start is None:
+            self.start = now
+            return
+        elapsed = now - self.start
+        if elapsed >= self.period:
+            self.start = now
+            self.callback(elapsed)
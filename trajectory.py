@@ -0,0 +1,191 @@
+# ============================================================================
+# TRAIETTORIE SINCRONIZZATE DEI GIUNTI DEL BRACCIO
+# ============================================================================
+"""
+Generazione di traiettorie a profilo di velocità trapezoidale per i giunti
+del braccio UR5e.
+
+Per ogni movimento punto a punto tutti i giunti usano la stessa durata e
+gli stessi tempi di accelerazione e decelerazione: partono e arrivano
+insieme, e il giunto con lo spostamento maggiore si muove alla velocità e
+accelerazione massime.
+
+ArmTrajectory invia ad ogni passo di simulazione la posizione pianificata
+per il passo successivo, con la velocità necessaria a raggiungerla.
+CycleStats confronta il tempo di ciclo previsto con quello misurato per
+tipo di frutto e contenitore.
+"""
+
+import math
+
+from scheduler import PeriodicReport  # Resoconto ogni REPORT_PERIOD secondi di simulazione
+
+
+def constant_velocity_duration(start, goal, velocity):
+    """
+    Durata di un movimento con velocità costante uguale per tutti i giunti
+
+    Args:
+        start, goal (list): Posizioni iniziale e finale dei giunti
+        velocity (float): Velocità dei giunti (rad/s)
+
+    Returns:
+        float: Tempo di arrivo dell'ultimo giunto (s)
+    """
+    return max(abs(g - s) for s, g in zip(start, goal)) / velocity
+
+
+class Trajectory:
+    """
+    Movimento sincronizzato tra due pose con profilo trapezoidale
+
+    Args:
+        start, goal (list): Posizioni iniziale e finale dei giunti
+        max_velocity (list): Velocità massima di ogni giunto (rad/s)
+        max_acceleration (list): Accelerazione massima di ogni giunto (rad/s²)
+    """
+
+    def __init__(self, start, goal, max_velocity, max_acceleration):
+        self.start = list(start)
+        self.goal = list(goal)
+        self.delta = [g - s for s, g in zip(start, goal)]
+        distances = [abs(d) for d in self.delta]
+
+        # Tempo di accelerazione comune: il più lungo richiesto dai singoli giunti
+        self.ramp = 0.0
+        for d, v, a in zip(distances, max_velocity, max_acceleration):
+            self.ramp = max(self.ramp, v / a if d >= v * v / a else math.sqrt(d / a))
+
+        # Durata comune: il giunto più lento alla sua velocità di crociera raggiungibile
+        self.duration = 0.0
+        if self.ramp > 0.0:
+            for d, v, a in zip(distances, max_velocity, max_acceleration):
+                self.duration = max(self.duration, self.ramp + d / min(v, a * self.ramp))
+
+        # Velocità di crociera di ogni giunto per arrivare insieme
+        cruise = self.duration - self.ramp
+        self.velocity = [d / cruise if cruise > 0.0 else 0.0 for d in self.delta]
+
+    def position(self, t):
+        """Posa pianificata dopo t secondi dall'inizio del movimento"""
+        if t >= self.duration:
+            return list(self.goal)
+        if t <= 0.0:
+            return list(self.start)
+        ramp, duration = self.ramp, self.duration
+        if t < ramp:
+            k = 0.5 * t * t / ramp
+        elif t <= duration - ramp:
+            k = t - 0.5 * ramp
+        else:
+            k = duration - ramp - 0.5 * (duration - t) ** 2 / ramp
+        return [s + v * k for s, v in zip(self.start, self.velocity)]
+
+
+class ArmTrajectory:
+    """
+    Esecuzione delle traiettorie sui motori del braccio
+
+    Args:
+        motors (list): Motori dei giunti, nello stesso ordine delle pose
+        max_acceleration (float): Accelerazione massima dei giunti (rad/s²)
+        max_velocity (float): Velocità massima dei giunti (rad/s);
+            None = velocità massima dichiarata da ogni motore
+    """
+
+    def __init__(self, motors, max_acceleration, max_velocity=None):
+        self.motors = motors
+        self.max_velocity = [max_velocity or motor.getMaxVelocity() for motor in motors]
+        self.max_acceleration = [max_acceleration] * len(motors)
+        self.pose = [motor.getTargetPosition() for motor in motors]  # Ultima posa comandata
+        self.trajectory = None
+        self.start_time = 0.0
+
+    @property
+    def goal(self):
+        """Destinazione dell'ultimo movimento (posa corrente se fermo)"""
+        return self.trajectory.goal if self.trajectory is not None else self.pose
+
+    def move(self, goal, now):
+        """
+        Avvia un movimento dalla posa comandata alla destinazione indicata
+
+        Se la destinazione coincide con quella del movimento in corso, il
+        movimento prosegue invariato.
+
+        Args:
+            goal (list): Posa di destinazione
+            now (float): Tempo di simulazione
+
+        Returns:
+            float: Durata prevista del movimento (s)
+        """
+        if list(goal) == self.goal:
+            if self.trajectory is None:
+                return 0.0
+            return self.trajectory.duration - (now - self.start_time)
+        self.trajectory = Trajectory(self.pose, goal, self.max_velocity, self.max_acceleration)
+        self.start_time = now
+        return self.trajectory.duration
+
+    def predict(self, start, goal):
+        """Durata prevista di un movimento tra due pose, senza eseguirlo"""
+        return Trajectory(start, goal, self.max_velocity, self.max_acceleration).duration
+
+    def update(self, now, dt):
+        """
+        Comanda ai motori la posa pianificata per il passo successivo
+
+        Args:
+            now (float): Tempo di simulazione
+            dt (float): Durata del passo di simulazione (s)
+        """
+        if self.trajectory is None:
+            return
+        t = now + dt - self.start_time
+        target = self.trajectory.position(t)
+        for motor, previous, position, v_max in zip(self.motors, self.pose, target, self.max_velocity):
+            motor.setVelocity(min(max(abs(position - previous) / dt, 1e-3), v_max))
+            motor.setPosition(position)
+        self.pose = target
+        if t >= self.trajectory.duration:
+            self.trajectory = None
+
+
+class CycleStats:
+    """
+    Tempi di ciclo previsti e misurati per tipo di frutto e contenitore
+
+    Un ciclo va dall'inizio del prelievo al ritorno del braccio in posizione
+    di attesa.
+    """
+
+    def __init__(self):
+        self.cycles = {}  # (frutto, contenitore) -> [cicli, previsto totale, misurato totale]
+        self._report = PeriodicReport(self._print_report)
+
+    def record(self, key, predicted, measured):
+        """
+        Registra un ciclo completato
+
+        Args:
+            key (tuple): (nome del frutto, nome del contenitore)
+            predicted, measured (float): Durate prevista e misurata (s)
+        """
+        entry = self.cycles.setdefault(key, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += predicted
+        entry[2] += measured
+
+    def report(self, now):
+        """Stampa periodicamente i tempi di ciclo medi e i prelievi al minuto"""
+        self._report.update(now)
+
+    def _print_report(self, elapsed):
+        if self.cycles:
+            picks = sum(entry[0] for entry in self.cycles.values())
+            print(f"Cicli: {picks * 60.0 / elapsed:.2f} prelievi/min")
+            for (fruit_name, bin_name), (n, predicted, measured) in sorted(self.cycles.items()):
+                print(f"  {fruit_name:<12} -> {bin_name}: {n} cicli, previsto {predicted / n:.2f} s, "
+                      f"misurato {measured / n:.2f} s")
+        self.cycles.clear()
@@ -1,60 +1,82 @@
 #!/usr/bin/env python3
+"""
+Nodo ROS per la scrittura dei programmi FSA.
+
+Uso:
+    writer_node.py                       inserimento interattivo
+    writer_node.py --batch programmi.txt un programma per riga da file
+    writer_node.py --batch -             un programma per riga da stdin
+    writer_node.py --spool directory     file della directory in ordine di nome
+
+I programmi sono nel formato storico "N, (mele,Gk,arance,Ok,ritardo), ..."
+oppure in JSON strutturato (vedi fsa_schema.py: più contenitori per stato,
+ritardi frazionari, velocità del nastro per stato). Nei file batch ogni riga
+è un programma; nella directory di spool un file che inizia con "{" è un
+unico programma JSON. Con --binary i programmi vengono pubblicati nella
+codifica binaria compatta.
+
+In modalità batch e spool ogni programma viene validato con parse_input e
+pubblicato solo dopo che il controller ha confermato (fsa_applied.json)
+l'applicazione del precedente; per ogni programma viene registrata la
+latenza tra pubblicazione e applicazione. Se una conferma non arriva entro
+--timeout (per programma) l'elaborazione si interrompe con codice di uscita 1:
+i programmi successivi non vengono pubblicati su un controller fermo.
+
+Nella directory di spool tutti i programmi di un file vengono validati prima
+di pubblicarne uno: un file con un programma non valido va in rejected/ per
+intero, senza pubblicazioni. Se un programma non viene confermato, i
+programmi già applicati vengono scritti in done/ e i rimanenti in rejected/
+con lo stesso nome, così rielaborare il file non ripubblica nulla due volte.
+"""
+
+import argparse  # Argomenti della modalità batch
+import os
+import sys
+import time
 
 import rospy  # Libreria ROS
 import json  # Libreria per lavorare con JSON
+import fsa_protocol  # Pubblicazione atomica e versionata del file FSA
+import fsa_parser  # Parser dei programmi FSA condiviso con il controller
+import fsa_schema  # Programmi FSA strutturati (JSON e binario)
+
+DEFAULT_ACK_TIMEOUT = 10.0  # Attesa predefinita della conferma di ogni programma (s)
 
 # Percorso del file JSON
 FASI = "/mnt/c/Users/utente/Desktop/ROS_UniversalRobotV3Python/UniversalRobotV3Python_4ceste/UniversalRobotV3Python/controllers/fruit_sorting_ctrl_opencv/fsa_message.json" # Aggiorna il percorso con la posizione del file JSON sul tuo sistema
 
 def write_to_file(data_str):
     """
-    Scrive la stringa nel file JSON.
+    Pubblica la stringa nel file JSON come nuova versione (file temporaneo
+    e os.replace: il controller non legge mai un file scritto a metà).
     """
     try:
-        with open(FASI, 'w') as file:
-            file.write(data_str)
-        rospy.loginfo(f"Dati scritti nel file: {FASI}")
+        version = fsa_protocol.publish(FASI, data_str)
+        rospy.loginfo(f"Dati scritti nel file: {FASI} (versione {version})")
     except Exception as e:
         rospy.logwarn(f"Errore durante la scrittura del file JSON: {e}")
 
 def parse_input(data_str):
     """
     Converte la stringa di input in una stringa compatibile con il formato richiesto da Webots.
+    Il controllo è quello del controller (fsa_parser, fsa_schema): un programma
+    accettato qui viene accettato anche da Webots. Un programma JSON viene
+    restituito come oggetto normalizzato.
     """
     try:
-        data_parts = data_str.split(', ', 1)
-        num_fasi = int(data_parts[0])
-        fasi_list = []
-
-        # Debug: stampa il contenuto della seconda parte
-        rospy.loginfo(f"Contenuto fasi: {data_parts[1]}")
-
-        # Rimuove le parentesi esterne e corregge la stringa
-        data_fasi = data_parts[1].strip().strip('()')  # Rimuove le parentesi esterne
-        rospy.loginfo(f"Fasi dopo la rimozione parentesi: {data_fasi}")
-
-        fasi = data_fasi.split('), (')  # Ora le fasi sono separate correttamente
-        rospy.loginfo(f"Fasi separate: {fasi}")
-
-        for fase in fasi:
-            fase = fase.strip('()')  # Pulisce le parentesi esterne rimaste
-            rospy.loginfo(f"Fase pulita: {fase}")
-
-            # Rimuove spazi extra prima e dopo la virgola
-            valori = [val.strip() for val in fase.split(',')]  # Pulisce gli spazi extra
-            if len(valori) == 5:  # Verifica che ci siano 5 valori
-                target_mele, scatola_mele, target_arance, scatola_arance, ritardo = valori
-                fasi_list.append(f"({target_mele},{scatola_mele},{target_arance},{scatola_arance},{ritardo})")
-            else:
-                rospy.logwarn(f"Errore nei valori della fase: {fase}. Si aspettano 5 valori.")
-
-        # Crea la stringa finale nel formato richiesto da Webots
-        fsa_message = f"{num_fasi}, " + ", ".join(fasi_list)
-        return fsa_message
+        if data_str.lstrip().startswith('{'):
+            return fsa_schema.to_json(fsa_schema.load(data_str))
+        return fsa_parser.format_program(fsa_parser.parse(data_str))
     except ValueError as e:
         rospy.logwarn(f"Errore nel parsing dell'input: {e}")
         return None
 
+def describe(program):
+    """Testo di un programma per i log"""
+    if isinstance(program, dict):
+        return json.dumps(program, separators=(',', ':'))
+    return program
+
 def writer_node():
     """
     Nodo ROS per raccogliere input e scrivere su un file JSON.
@@ -64,6 +86,7 @@ def writer_node():
     while not rospy.is_shutdown():
         rospy.loginfo("Inserisci i dettagli delle fasi nel formato:")
         rospy.loginfo("Esempio: 3, (1,G1,1,O1,5), (1,G2,2,O2,3), (2,O1,1,G1,4)")
+        rospy.loginfo('Oppure JSON: {"schema": 2, "states": [{"bins": {"G1": 2, "G2": 1, "O1": 1}, "delay": 1.5}]}')
 
         data_str = input("Inserisci il numero e i dettagli di ogni stato: ")
 
@@ -72,7 +95,7 @@ def writer_node():
         if data_str_formatted:
             write_to_file(data_str_formatted)
             rospy.loginfo(f"Dati scritti nel file JSON: {FASI}")
-            rospy.loginfo(f"Invio il messaggio: {data_str_formatted}")
+            rospy.loginfo(f"Invio il messaggio: {describe(data_str_formatted)}")
         else:
             rospy.logwarn("Input non valido. Verifica il formato e riprova.")
         
@@ -81,8 +104,213 @@ def writer_node():
         if cont.lower() != 's':
             break
 
+def wait_for_ack(version, submitted, timeout, poll):
+    """
+    Attende che il controller confermi l'applicazione di una versione
+
+    Solo la conferma della stessa versione vale: una conferma successiva
+    significa che il programma è stato sostituito da un'altra pubblicazione
+    e potrebbe non essere mai andato in esecuzione.
+
+    Args:
+        version (int): Versione pubblicata
+        submitted (float): Istante della pubblicazione (time.time())
+        timeout (float): Attesa massima in secondi (0 = senza limite)
+        poll (float): Periodo di controllo del file di conferma
+
+    Returns:
+        float: Latenza tra pubblicazione e applicazione (s), o None se non confermata
+    """
+    while not rospy.is_shutdown():
+        ack = fsa_protocol.read_ack(FASI)
+        acked = ack.get("version") if ack is not None else None
+        if acked == version:
+            return max(0.0, ack.get("wall_time", time.time()) - submitted)
+        if isinstance(acked, int) and acked > version:
+            rospy.logwarn(f"Versione {version} sostituita dalla {acked} prima della conferma")
+            return None
+        if timeout and time.time() - submitted > timeout:
+            rospy.logwarn(f"Versione {version} non confermata dal controller entro {timeout:.1f} s")
+            return None
+        time.sleep(poll)
+    return None
+
+def prepare_program(line, binary=False):
+    """
+    Valida un programma FSA e ne prepara il contenuto da pubblicare
+
+    Args:
+        line (str): Programma FSA nel formato di inserimento (storico o JSON)
+        binary (bool): Prepara la codifica binaria invece della busta JSON
+
+    Returns:
+        tuple: (programma normalizzato, contenuto da pubblicare), o None se non valido
+    """
+    data_str_formatted = parse_input(line)
+    if not data_str_formatted:
+        rospy.logwarn(f"Programma non valido, scartato: {line}")
+        return None
+
+    program = data_str_formatted
+    if binary:
+        try:
+            program = fsa_schema.encode_binary(fsa_schema.load(data_str_formatted))
+        except ValueError as e:  # Es. ritardo del formato storico oltre fsa_schema.MAX_DELAY
+            rospy.logwarn(f"Programma non codificabile in binario, scartato: {e}")
+            return None
+    return data_str_formatted, program
+
+def publish_program(prepared, timeout, poll):
+    """
+    Pubblica un programma preparato e attende che il controller lo applichi
+
+    Args:
+        prepared (tuple): Risultato di prepare_program
+        timeout (float): Attesa massima della conferma (0 = senza limite)
+        poll (float): Periodo di controllo del file di conferma
+
+    Returns:
+        bool: True se applicato, False se non pubblicato o non confermato
+    """
+    data_str_formatted, program = prepared
+    submitted = time.time()
+    try:
+        version = fsa_protocol.publish(FASI, program)
+    except OSError as e:
+        rospy.logwarn(f"Errore durante la scrittura del file JSON: {e}")
+        return False
+
+    latency = wait_for_ack(version, submitted, timeout, poll)
+    if latency is None:
+        return False
+    rospy.loginfo(f"Versione {version} applicata in {latency * 1000:.0f} ms: {describe(data_str_formatted)}")
+    return True
+
+def read_programs(file):
+    """Programmi di un file batch: una riga ciascuno, esclusi righe vuote e commenti (#)"""
+    for line in file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+def batch_mode(source, timeout, poll, binary=False):
+    """
+    Pubblica in ordine i programmi di un file o di stdin ("-"). I programmi
+    non validi vengono scartati; un programma non confermato interrompe il batch.
+
+    Returns:
+        bool: True se tutti i programmi sono stati applicati
+    """
+    file = sys.stdin if source == '-' else open(source, encoding='utf-8')
+    ok = True
+    try:
+        for line in read_programs(file):
+            if rospy.is_shutdown():
+                return False
+            prepared = prepare_program(line, binary)
+            if prepared is None:
+                ok = False
+                continue
+            if not publish_program(prepared, timeout, poll):
+                rospy.logwarn("Batch interrotto: programma non confermato dal controller")
+                return False
+    finally:
+        if file is not sys.stdin:
+            file.close()
+    return ok
+
+def write_programs(path, programs):
+    """Scrive i programmi in un file di spool, uno per riga (scrittura atomica)"""
+    directory, name = os.path.split(path)
+    temporary = os.path.join(directory, f".{name}.tmp")  # Nascosto: ignorato dallo spool
+    with open(temporary, 'w', encoding='utf-8') as file:
+        file.write("".join(program + "\n" for program in programs))
+    os.replace(temporary, path)
+
+def spool_file(directory, name, timeout, poll, binary=False):
+    """
+    Elabora un file di spool: valida tutti i programmi, poi li pubblica in
+    ordine e sposta il file in done/ o rejected/
+
+    Returns:
+        bool: False se un programma non è stato confermato dal controller
+    """
+    path = os.path.join(directory, name)
+    with open(path, encoding='utf-8') as file:
+        content = file.read()
+    if content.lstrip().startswith('{'):
+        programs = [content]  # Un unico programma JSON, anche su più righe
+    else:
+        programs = list(read_programs(content.splitlines()))
+
+    prepared = [prepare_program(program, binary) for program in programs]
+    if None in prepared:
+        rospy.logwarn(f"{name}: programmi non validi, nessuno pubblicato")
+        os.replace(path, os.path.join(directory, "rejected", name))
+        return True
+
+    for applied, program in enumerate(prepared):
+        if not publish_program(program, timeout, poll):
+            break
+    else:
+        os.replace(path, os.path.join(directory, "done", name))
+        return True
+
+    # I programmi già applicati in done/, da quello non confermato in poi in rejected/
+    rospy.logwarn(f"{name}: {applied} programmi su {len(programs)} applicati, il resto in rejected/")
+    if applied:
+        write_programs(os.path.join(directory, "done", name), programs[:applied])
+        write_programs(path, programs[applied:])
+    os.replace(path, os.path.join(directory, "rejected", name))
+    return False
+
+def spool_mode(directory, timeout, poll, binary=False):
+    """
+    Pubblica i programmi dei file che arrivano nella directory di spool,
+    in ordine di nome, finché il nodo non viene terminato o un programma
+    non viene confermato
+
+    Returns:
+        bool: False se interrotto da un programma non confermato
+    """
+    for sub in ("done", "rejected"):
+        os.makedirs(os.path.join(directory, sub), exist_ok=True)
+
+    while not rospy.is_shutdown():
+        names = sorted(name for name in os.listdir(directory)
+                       if not name.startswith('.') and os.path.isfile(os.path.join(directory, name)))
+        if not names:
+            time.sleep(poll)
+            continue
+        for name in names:
+            if not spool_file(directory, name, timeout, poll, binary):
+                rospy.logwarn("Spool interrotto: programma non confermato dal controller")
+                return False
+            if rospy.is_shutdown():
+                break
+    return True
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Scrittura dei programmi FSA per il controller")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--batch", metavar="FILE", help="File di programmi, uno per riga ('-' = stdin)")
+    source.add_argument("--spool", metavar="DIR", help="Directory di spool da cui leggere i programmi")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_ACK_TIMEOUT,
+                        help="Attesa massima della conferma di ogni programma in secondi (0 = senza limite)")
+    parser.add_argument("--poll", type=float, default=0.05, help="Periodo di controllo della conferma (s)")
+    parser.add_argument("--binary", action="store_true", help="Pubblica i programmi nella codifica binaria")
+    return parser.parse_args(argv)
+
 if __name__ == '__main__':
+    args = parse_args(rospy.myargv(argv=sys.argv)[1:])
     try:
-        writer_node()
+        if args.batch:
+            rospy.init_node('robot_state_writer', anonymous=True)
+            sys.exit(0 if batch_mode(args.batch, args.timeout, args.poll, args.binary) else 1)
+        elif args.spool:
+            rospy.init_node('robot_state_writer', anonymous=True)
+            sys.exit(0 if spool_mode(args.spool, args.timeout, args.poll, args.binary) else 1)
+        else:
+            writer_node()
     except rospy.ROSInterruptException:
         pass